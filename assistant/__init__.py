@@ -1,19 +1,41 @@
+from argparse import REMAINDER
 from argparse import ArgumentParser
 import atexit
+from functools import cached_property
+from itertools import islice
 import os
 from pathlib import Path
-import readline
 import shlex
+import sys
+import time
 
 from assistant.birthdays import Birthdays
 from assistant.common import Cmd
+from assistant.common import CmdArgumentParser
 from assistant.common import confirm
+from assistant.common import error
+from assistant.indexes import BirthdayIndex
+from assistant.indexes import NameIndex
+from assistant.indexes import PhoneIndex
+from assistant.indexes import TrigramIndex
+from assistant.locking import LockTimeoutError
+from assistant.metrics import Metrics
+from assistant.metrics import instrument
+from assistant.metrics import operation
+from assistant.metrics import timed_open
 from assistant.model import Record
 from assistant.phones import Phones
-from assistant.repos import Repo, RepoType, PickleRepo, ShelveRepo
+from assistant.repos import CachedRepo, CachePolicy, Indexed, IndexedRepo, Repo, RepoType
+from assistant.repos import PickleRepo, ShelveRepo, TransactionRepo, begin_command
+from assistant.search import search_names
+from assistant.serialization import CODECS
+from assistant.serialization import CodecType
 
 
 class AssistantApp(Cmd):
+    # commands that change the addressbook
+    writes = frozenset({"import", "apply_changes", "migrate", "reindex", "dedupe", "wipe"})
+
     def __init__(
             self,
             addressbook: Repo[Record],
@@ -26,6 +48,158 @@ class AssistantApp(Cmd):
         self._phones = phones
         self._birthdays = birthdays
         self._yes = yes
+        self._serving = False
+
+    @cached_property
+    def _import_parser(self) -> CmdArgumentParser:
+        from assistant import transfer
+
+        parser = CmdArgumentParser("import", add_help=False)
+        parser.add_argument(
+            "file", type=Path, help="File to import records from, - for stdin")
+        parser.add_argument(
+            "--format", type=transfer.Format, choices=list(transfer.Format), default=None,
+            help="File format (default: guessed from the file extension)")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Number of records written to the repository at once")
+        return parser
+
+    @cached_property
+    def _export_parser(self) -> CmdArgumentParser:
+        from assistant import transfer
+
+        parser = CmdArgumentParser("export", add_help=False)
+        parser.add_argument(
+            "file", type=Path, help="File to export records to, - for stdout")
+        parser.add_argument(
+            "--format", type=transfer.Format, choices=list(transfer.Format), default=None,
+            help="File format (default: guessed from the file extension)")
+        return parser
+
+    @cached_property
+    def _export_changes_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("export_changes", add_help=False)
+        parser.add_argument(
+            "file", type=Path, help="File to write the changes to, - for stdout")
+        parser.add_argument(
+            "--since", type=int, default=0,
+            help="Sequence number printed by the last sync with the other book "
+                 "(default: 0, all records)")
+        return parser
+
+    @cached_property
+    def _apply_changes_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("apply_changes", add_help=False)
+        parser.add_argument(
+            "file", type=Path, help="File written by export_changes, - for stdin")
+        return parser
+
+    @cached_property
+    def _search_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("search", add_help=False)
+        parser.add_argument(
+            "query", help="Approximate name of the record")
+        parser.add_argument(
+            "--limit", type=int, default=10, help="Maximum number of records to show")
+        return parser
+
+    @cached_property
+    def _list_parser(self) -> CmdArgumentParser:
+        from assistant import listing
+
+        parser = CmdArgumentParser("list", add_help=False)
+        parser.add_argument(
+            "--prefix", default="", help="Only list records with names starting with this")
+        parser.add_argument(
+            "--sort", type=listing.SortKey, choices=list(listing.SortKey), default=None,
+            help="Order of the records (default: storage order)")
+        parser.add_argument(
+            "--offset", type=int, default=0, help="Number of records to skip")
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of records to list")
+        parser.add_argument(
+            "--format", type=listing.ListFormat, choices=list(listing.ListFormat),
+            default=listing.ListFormat.NAMES, help="Output format (default: names)")
+        return parser
+
+    @cached_property
+    def _find_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("find", add_help=False)
+        parser.add_argument(
+            "terms", nargs="+", metavar="field:value",
+            help="Conditions all records have to match: name:PREFIX, phone:PREFIX, "
+                 "type:home|mobile|work, birthday:MM[-DD][..MM[-DD]]")
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of records to show")
+        parser.add_argument(
+            "--explain", action="store_true", help="Show how the query is executed")
+        return parser
+
+    @cached_property
+    def _dedupe_parser(self) -> CmdArgumentParser:
+        from assistant import dedupe
+
+        parser = CmdArgumentParser("dedupe", add_help=False)
+        parser.add_argument(
+            "--threshold", type=int, default=dedupe.THRESHOLD,
+            help=f"Name similarity (0-100) from which records are merged (default: {dedupe.THRESHOLD})")
+        parser.add_argument(
+            "--max-block", type=int, default=dedupe.MAX_BLOCK_SIZE,
+            help="Records sharing a name key or phone number with more records than this "
+                 f"are not compared (default: {dedupe.MAX_BLOCK_SIZE})")
+        parser.add_argument(
+            "--yes", action="store_true", help="Apply the proposed merges without asking")
+        return parser
+
+    @cached_property
+    def _serve_parser(self) -> CmdArgumentParser:
+        from assistant import server
+
+        parser = CmdArgumentParser("serve", add_help=False)
+        parser.add_argument(
+            "--socket", type=Path, default=server.default_socket_path(),
+            help="Path to the unix socket to listen on")
+        return parser
+
+    @cached_property
+    def _profile_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("profile", add_help=False)
+        parser.add_argument(
+            "--sort", default="cumulative",
+            help="Sort key of the profile (default: cumulative)")
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Number of functions to show")
+        parser.add_argument(
+            "--output", type=Path, default=None,
+            help="File to save the raw profile to, for pstats or snakeviz")
+        parser.add_argument(
+            "command", nargs=REMAINDER, help="Command to profile")
+        return parser
+
+    def command_name(self, line: str) -> str:
+        """
+        Name of the command run by the line, including the subcommand for
+        phones and birthdays
+        """
+        cmd, arg, _ = self.parseline(line)
+        subshell = {"phones": self._phones, "birthdays": self._birthdays}.get(cmd)
+        if subshell is not None and arg:
+            subcmd, _, _ = subshell.parseline(arg)
+            return f"{cmd} {subcmd}"
+        return cmd or line
+
+    def begin(self, line):
+        cmd, _, _ = self.parseline(line)
+        if cmd in ("phones", "birthdays"):
+            # left to the subshell, which knows which of its commands write
+            return
+        begin_command(self._addressbook, cmd in self.writes)
+
+    def postcmd(self, stop, line):
+        # let other processes at the addressbook between interactive commands
+        self._addressbook.flush()
+        return stop
 
     def do_hello(self, arg):
         """
@@ -35,10 +209,62 @@ class AssistantApp(Cmd):
 
     def do_list(self, arg):
         """
-        List all records
+        List records
+        """
+        from assistant import listing
+
+        args = self._list_parser.parse_args(shlex.split(arg))
+        if args.offset < 0 or (args.limit is not None and args.limit < 0):
+            error("Offset and limit cannot be negative")
+            return
+        records = listing.list_records(
+            self._addressbook, args.sort, args.prefix, args.format != listing.ListFormat.NAMES)
+        stop = None if args.limit is None else args.offset + args.limit
+        lines = listing.format_lines(islice(records, args.offset, stop), args.format)
+        listing.write_lines(lines, sys.stdout)
+
+    def help_list(self):
+        print(self._list_parser.format_help())
+
+    def do_search(self, arg):
+        """
+        Search records by approximate name
+        """
+        args = self._search_parser.parse_args(shlex.split(arg))
+        found = search_names(self._addressbook, args.query, args.limit)
+        if not found:
+            error(f"Nothing found for {args.query}")
+        for score, name in found:
+            print(f"{name} ({score}%)")
+
+    def help_search(self):
+        print(self._search_parser.format_help())
+
+    def do_find(self, arg):
+        """
+        Find records matching all given conditions
         """
-        for _, record in self._addressbook.items():
-            print(f"{record.name}")
+        from assistant import query
+
+        args = self._find_parser.parse_args(shlex.split(arg))
+        if args.limit is not None and args.limit < 0:
+            error("Limit cannot be negative")
+            return
+        plan = query.plan(self._addressbook, query.parse(args.terms))
+        if args.explain:
+            print(plan.explain())
+        found = 0
+        for name, record in islice(query.execute(self._addressbook, plan), args.limit):
+            line = f"{name}: {'; '.join(str(p) for p in record.phones)}"
+            if record.birthday is not None:
+                line += f", born on {record.birthday.birthday.strftime('%Y.%m.%d')}"
+            print(line)
+            found += 1
+        if not found:
+            error("Nothing found")
+
+    def help_find(self):
+        print(self._find_parser.format_help())
 
     def do_phones(self, arg):
         """
@@ -55,7 +281,8 @@ class AssistantApp(Cmd):
         print(self._phones.do_help(""))
 
     def complete_phones(self, text, line, begidx, endidx):
-        return self._phones.completenames(text)
+        offset = line.index("phones") + len("phones")
+        return self._phones.completeline(text, line[offset:], begidx - offset, endidx - offset)
 
     def do_birthdays(self, arg):
         """
@@ -72,7 +299,250 @@ class AssistantApp(Cmd):
         print(self._birthdays.do_help(""))
 
     def complete_birthdays(self, text, line, begidx, endidx):
-        return self._birthdays.completenames(text)
+        offset = line.index("birthdays") + len("birthdays")
+        return self._birthdays.completeline(text, line[offset:], begidx - offset, endidx - offset)
+
+    def do_import(self, arg):
+        """
+        Import records from a CSV or JSONL file
+        """
+        from assistant import transfer
+
+        args = self._import_parser.parse_args(shlex.split(arg))
+        if args.batch_size < 1:
+            error("Batch size must be positive")
+            return
+        format = args.format or transfer.Format.from_path(args.file)
+        if str(args.file) == "-":
+            stats = transfer.import_rows(
+                self._addressbook, transfer.read_rows(sys.stdin, format), args.batch_size, "<stdin>")
+        else:
+            try:
+                src = args.file.open(newline="")
+            except OSError as ex:
+                error(f"Cannot open {args.file}: {ex.strerror}")
+                return
+            with src:
+                stats = transfer.import_rows(
+                    self._addressbook, transfer.read_rows(src, format), args.batch_size, str(args.file))
+        print(f"Imported {stats.records} records from {stats.rows} rows "
+              f"({stats.errors} errors) in {stats.elapsed:.2f}s, "
+              f"{stats.records_per_sec:.0f} records/sec")
+
+    def help_import(self):
+        print(self._import_parser.format_help())
+
+    def do_export(self, arg):
+        """
+        Export records to a CSV or JSONL file
+        """
+        from assistant import transfer
+
+        args = self._export_parser.parse_args(shlex.split(arg))
+        format = args.format or transfer.Format.from_path(args.file)
+        if str(args.file) == "-":
+            transfer.export_records(self._addressbook.items(), sys.stdout, format)
+            return
+        try:
+            dst = args.file.open("w", newline="", buffering=1024 * 1024)
+        except OSError as ex:
+            error(f"Cannot open {args.file}: {ex.strerror}")
+            return
+        with dst:
+            count = transfer.export_records(self._addressbook.items(), dst, format)
+        print(f"Exported {count} records to {args.file}")
+
+    def help_export(self):
+        print(self._export_parser.format_help())
+
+    def do_export_changes(self, arg):
+        """
+        Export records changed since a sequence number, for apply_changes in another book
+        """
+        from assistant import changes
+
+        args = self._export_changes_parser.parse_args(shlex.split(arg))
+        changelog = changes.find_changelog(self._addressbook)
+        if changelog is None:
+            error("The repository does not log changes")
+            return
+        if args.since < 0:
+            error("Sequence number cannot be negative")
+            return
+        if str(args.file) == "-":
+            changes.export_changes(changelog, sys.stdout, args.since)
+            return
+        try:
+            dst = args.file.open("w", buffering=1024 * 1024)
+        except OSError as ex:
+            error(f"Cannot open {args.file}: {ex.strerror}")
+            return
+        with dst:
+            stats = changes.export_changes(changelog, dst, args.since)
+        print(f"Exported {stats.changes} changes to {args.file}, "
+              f"next time export with --since {stats.until}")
+
+    def help_export_changes(self):
+        print(self._export_changes_parser.format_help())
+
+    def do_apply_changes(self, arg):
+        """
+        Merge changes exported from another book, the latest change of a record wins
+        """
+        from assistant import changes
+
+        args = self._apply_changes_parser.parse_args(shlex.split(arg))
+        changelog = changes.find_changelog(self._addressbook)
+        if changelog is None:
+            error("The repository does not log changes")
+            return
+        if str(args.file) == "-":
+            stats = changes.apply_changes(changelog, sys.stdin, "<stdin>")
+        else:
+            try:
+                src = args.file.open()
+            except OSError as ex:
+                error(f"Cannot open {args.file}: {ex.strerror}")
+                return
+            with src:
+                stats = changes.apply_changes(changelog, src, str(args.file))
+        print(f"Applied {stats.applied} of {stats.changes} changes from book {stats.book}, "
+              f"up to its sequence number {stats.until}")
+
+    def help_apply_changes(self):
+        print(self._apply_changes_parser.format_help())
+
+    def do_migrate(self, arg):
+        """
+        Rewrite all records in the current storage format
+        """
+        names = [str(name) for name, _ in self._addressbook.items()]
+        migrated = 0
+        for name in names:
+            # the flush of the previous thousand let other writers in
+            self._addressbook.lock_for_write()
+            record = self._addressbook.get(name)
+            if record is None:
+                # deleted meanwhile
+                continue
+            self._addressbook.set(name, record)
+            migrated += 1
+            if migrated % 1000 == 0:
+                self._addressbook.flush()
+        self._addressbook.flush()
+        print(f"{migrated} records have been migrated")
+
+    def do_reindex(self, arg):
+        """
+        Rebuild secondary indexes from a full scan of the addressbook
+        """
+        if not isinstance(self._addressbook, Indexed):
+            error("The repository has no indexes")
+            return
+        self._addressbook.reindex()
+        print("Indexes have been rebuilt")
+
+    def do_dedupe(self, arg):
+        """
+        Find records of the same person and merge their phones and birthdays
+        """
+        from assistant import dedupe
+
+        args = self._dedupe_parser.parse_args(shlex.split(arg))
+        if not 0 <= args.threshold <= 100:
+            error("Threshold must be between 0 and 100")
+            return
+        if args.max_block < 2:
+            error("Block size must be at least 2")
+            return
+        found = dedupe.find_duplicates(self._addressbook, args.threshold, args.max_block)
+        for merge in found.merges:
+            print(merge.describe())
+        print(f"{len(found.merges)} merges proposed, {found.compared} pairs of "
+              f"{found.records} records compared")
+        if found.skipped:
+            print(f"{found.skipped} blocks larger than {args.max_block} records were skipped")
+        if not found.merges:
+            return
+        if not (args.yes or self._yes or confirm(f"Apply {len(found.merges)} merges?")):
+            return
+        for merge in found.merges:
+            dedupe.apply_merge(self._addressbook, merge)
+        merged = sum(len(merge.merged) for merge in found.merges)
+        print(f"Merged {merged} duplicates into {len(found.merges)} records")
+
+    def help_dedupe(self):
+        print(self._dedupe_parser.format_help())
+
+    def do_serve(self, arg):
+        """
+        Serve commands from assistant-client over a unix socket
+        """
+        import asyncio
+        import socket
+
+        from assistant import server
+
+        args = self._serve_parser.parse_args(shlex.split(arg))
+        if self._serving:
+            error("Already serving")
+            return
+        with socket.socket(socket.AF_UNIX) as probe:
+            if probe.connect_ex(str(args.socket)) == 0:
+                error(f"Another server is listening on {args.socket}")
+                return
+        print(f"Serving on {args.socket}, press Ctrl-C to stop")
+        self._serving = True
+        try:
+            asyncio.run(server.serve(self, self._addressbook, args.socket))
+        finally:
+            self._serving = False
+        print("Server has been stopped")
+
+    def help_serve(self):
+        print(self._serve_parser.format_help())
+
+    def do_cache(self, arg):
+        """
+        Show record cache statistics
+        """
+        cache = self._addressbook
+        while not isinstance(cache, CachedRepo) and hasattr(cache, "repo"):
+            cache = cache.repo
+        if not isinstance(cache, CachedRepo):
+            error("Record cache is disabled, enable it with --repo-cache-size")
+            return
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+
+    def do_stats(self, arg):
+        """
+        Show latencies of commands and repository operations in this session
+        """
+        if self.metrics is None:
+            error("Statistics are not collected, run with --stats")
+            return
+        print(self.metrics.report())
+
+    def do_profile(self, arg):
+        """
+        Run a command under cProfile and show where the time went
+        """
+        import cProfile
+        import pstats
+
+        args = self._profile_parser.parse_args(shlex.split(arg))
+        if not args.command:
+            error("Command to profile is required")
+            return
+        profiler = cProfile.Profile()
+        profiler.runcall(self.onecmd, shlex.join(args.command))
+        if args.output is not None:
+            profiler.dump_stats(args.output)
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats(args.sort).print_stats(args.limit)
+
+    def help_profile(self):
+        print(self._profile_parser.format_help())
 
     def do_wipe(self, arg):
         """
@@ -85,6 +555,8 @@ class AssistantApp(Cmd):
 
 
 def read_init_file(path: Path):
+    import readline
+
     try:
         readline.read_init_file(str(path))
     except FileNotFoundError:
@@ -92,6 +564,8 @@ def read_init_file(path: Path):
 
 
 def read_history(path: Path):
+    import readline
+
     try:
         readline.read_history_file(str(path))
     except FileNotFoundError:
@@ -99,11 +573,13 @@ def read_history(path: Path):
 
 
 def write_history(path: Path):
+    import readline
+
     readline.set_history_length(1000)
     readline.write_history_file(str(path))
 
 
-def main():
+def make_argparser() -> ArgumentParser:
     ap = ArgumentParser()
     ap.add_argument("-y", "--yes", action="store_true",
                     help="Answer yes to all questions")
@@ -120,6 +596,31 @@ def main():
         default=Path("addressbook.pickle"),
         help="Path to the pickle file",
     )
+    ap.add_argument(
+        "--repo-pickle-journal-limit",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="Journal size in bytes after which the pickle file is rewritten",
+    )
+    ap.add_argument(
+        "--repo-pickle-checkpoint-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between background rewrites of the pickle file while the "
+             "addressbook is open, 0 to disable",
+    )
+    ap.add_argument(
+        "--repo-pickle-checkpoint-entries",
+        type=int,
+        default=10000,
+        help="Number of changes after which the pickle file is rewritten in the background",
+    )
+    ap.add_argument(
+        "--repo-lock-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds to wait for other processes using the addressbook",
+    )
     ap.add_argument(
         "--repo-shelve-db-dir",
         type=Path,
@@ -132,34 +633,290 @@ def main():
         default="addressbook",
         help="Name of the shelve db",
     )
-    args, cmd_args = ap.parse_known_args()
-
-    init_file = Path(os.environ.get("ASSISTANT_INIT_FILE", ".assistant_init"))
-    read_init_file(init_file)
+    ap.add_argument(
+        "--repo-mmap-filepath",
+        type=Path,
+        default=Path("addressbook.records"),
+        help="Path to the memory-mapped record store",
+    )
+    ap.add_argument(
+        "--repo-mmap-compact-limit",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="Size in bytes of unindexed records after which the record store is compacted",
+    )
+    ap.add_argument(
+        "--repo-blocks-filepath",
+        type=Path,
+        default=Path("addressbook.blocks"),
+        help="Path to the block-compressed record store",
+    )
+    ap.add_argument(
+        "--repo-blocks-compression",
+        # values of blockstore.Compression, which is imported for the blocks
+        # backend only
+        choices=["none", "zlib", "lzma"],
+        default="zlib",
+        help="Compression of the blocks of the block store",
+    )
+    ap.add_argument(
+        "--repo-blocks-level",
+        type=int,
+        choices=range(10),
+        default=6,
+        metavar="0-9",
+        help="Compression level of the block store, higher is smaller and slower to write",
+    )
+    ap.add_argument(
+        "--repo-blocks-size",
+        type=int,
+        default=4096,
+        help="Size in bytes of uncompressed records in a block, smaller blocks make lookups "
+             "faster and compress worse",
+    )
+    ap.add_argument(
+        "--repo-blocks-compact-limit",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="Size in bytes of the journal after which the blocks are rewritten",
+    )
+    ap.add_argument(
+        "--repo-codec",
+        type=CodecType,
+        choices=list(CodecType),
+        default=CodecType.BINARY,
+        help="Encoding of records written to shelve, mmap and blocks repositories",
+    )
+    ap.add_argument(
+        "--repo-shards-dir",
+        type=Path,
+        default=Path("addressbook.shards"),
+        help="Directory with the shards of the sharded repository",
+    )
+    ap.add_argument(
+        "--repo-shards",
+        type=int,
+        default=None,
+        help="Number of shards of a new sharded repository (default: number of CPUs)",
+    )
+    ap.add_argument(
+        "--repo-sqlite-filepath",
+        type=Path,
+        default=Path("addressbook.sqlite3"),
+        help="Path to the sqlite database",
+    )
+    ap.add_argument(
+        "--repo-cache-size",
+        type=int,
+        default=0,
+        help="Number of decoded records kept in an LRU cache (0 disables the cache)",
+    )
+    ap.add_argument(
+        "--repo-cache-policy",
+        type=CachePolicy,
+        choices=list(CachePolicy),
+        default=CachePolicy.WRITE_THROUGH,
+        help="When cached changes are written to the repository",
+    )
+    ap.add_argument(
+        "--repo-changes-compact-limit",
+        type=int,
+        default=4 * 1024 * 1024,
+        help="Size in bytes of the change log after which it is compacted",
+    )
+    ap.add_argument(
+        "--repo-index-journal-limit",
+        type=int,
+        default=256 * 1024,
+        help="Size in bytes of the index journal after which the indexes are saved",
+    )
+    ap.add_argument(
+        "--batch",
+        type=Path,
+        default=None,
+        help="Run commands from the file (one per line, - for stdin) in a single session",
+    )
+    ap.add_argument(
+        "--atomic",
+        action="store_true",
+        help="With --batch, keep no changes unless every command succeeds",
+    )
+    ap.add_argument(
+        "--continue-on-error",
+        action="store_true",
+        help="With --batch, run the remaining commands after a failed one",
+    )
+    ap.add_argument(
+        "--stats",
+        action="store_true",
+        help="Collect command and repository operation latencies for the stats command "
+             "(always on in the interactive shell)",
+    )
+    ap.add_argument(
+        "--stats-json",
+        type=Path,
+        default=None,
+        help="Write command and repository operation latencies to this file on exit",
+    )
+    ap.add_argument(
+        "--timing",
+        action="store_true",
+        help="Report time spent on imports, startup, opening the addressbook and commands on exit",
+    )
+    return ap
 
-    history_file = Path(os.environ.get(
-        "ASSISTANT_HISTORY_FILE", ".assistant_history"))
-    read_history(history_file)
-    atexit.register(write_history, history_file)
 
+def build_repo(args, metrics: Metrics | None = None) -> Repo[Record]:
+    """
+    Build the repository stack selected by the command line arguments
+    """
+    indexes = [NameIndex(), BirthdayIndex(), PhoneIndex(), TrigramIndex()]
     match args.repo_type:
         case RepoType.PICKLE:
-            repo = PickleRepo[Record](args.repo_pickle_filepath)
+            repo = PickleRepo[Record](
+                args.repo_pickle_filepath, args.repo_pickle_journal_limit, args.repo_lock_timeout,
+                args.repo_pickle_checkpoint_interval, args.repo_pickle_checkpoint_entries)
+            index_dir = args.repo_pickle_filepath.with_name(
+                args.repo_pickle_filepath.name + ".idx")
+            changes_filepath = args.repo_pickle_filepath.with_name(
+                args.repo_pickle_filepath.name + ".changes")
         case RepoType.SHELVE:
-            repo = ShelveRepo[Record](args.repo_shelve_db_dir, args.repo_shelve_db_name)
+            repo = ShelveRepo[Record](
+                args.repo_shelve_db_dir, args.repo_shelve_db_name, CODECS[args.repo_codec],
+                args.repo_lock_timeout)
+            index_dir = args.repo_shelve_db_dir / f"{args.repo_shelve_db_name}.idx"
+            changes_filepath = args.repo_shelve_db_dir / f"{args.repo_shelve_db_name}.changes"
+        case RepoType.MMAP:
+            from assistant.recordstore import RecordStoreRepo
+
+            repo = RecordStoreRepo[Record](
+                args.repo_mmap_filepath, args.repo_mmap_compact_limit, CODECS[args.repo_codec],
+                args.repo_lock_timeout)
+            index_dir = args.repo_mmap_filepath.with_name(
+                args.repo_mmap_filepath.name + ".idx")
+            changes_filepath = args.repo_mmap_filepath.with_name(
+                args.repo_mmap_filepath.name + ".changes")
+        case RepoType.BLOCKS:
+            from assistant.blockstore import BlockStoreRepo
+            from assistant.blockstore import Compression
+
+            repo = BlockStoreRepo[Record](
+                args.repo_blocks_filepath, Compression(args.repo_blocks_compression), args.repo_blocks_level,
+                args.repo_blocks_size, args.repo_blocks_compact_limit, CODECS[args.repo_codec],
+                args.repo_lock_timeout)
+            index_dir = args.repo_blocks_filepath.with_name(
+                args.repo_blocks_filepath.name + ".idx")
+            changes_filepath = args.repo_blocks_filepath.with_name(
+                args.repo_blocks_filepath.name + ".changes")
+        case RepoType.SHARDED:
+            from assistant.sharded import ShardedRepo
+
+            # scans over shards run in parallel instead of using indexes,
+            # except for completing and suggesting names
+            repo = ShardedRepo[Record](
+                args.repo_shards_dir, args.repo_shards, args.repo_pickle_journal_limit,
+                args.repo_lock_timeout)
+            index_dir = args.repo_shards_dir / "idx"
+            indexes = [NameIndex(), TrigramIndex()]
+            changes_filepath = args.repo_shards_dir / "changes"
+        case RepoType.SQLITE:
+            from assistant.sqlite import SqliteRepo
+
+            # sqlite maintains its own indexes
+            repo = SqliteRepo(args.repo_sqlite_filepath, args.repo_lock_timeout)
+            index_dir = None
+            changes_filepath = args.repo_sqlite_filepath.with_name(
+                args.repo_sqlite_filepath.name + ".changes")
         case _:
             raise ValueError(f"Unsupported repo type: {args.repo_type}")
-    with repo as addressbook:
-        phones = Phones(addressbook, args.yes)
-        birthdays = Birthdays(addressbook, args.yes)
-        app = AssistantApp(
-            addressbook,
-            phones,
-            birthdays,
-            args.yes,
-        )
-        app.prompt = f"hello, {os.environ.get('USER', 'user')} > "
-        if len(cmd_args) > 0:
-            app.onecmd(shlex.join(cmd_args))
+    if metrics is not None:
+        instrument(repo, metrics)
+    if args.repo_cache_size > 0:
+        repo = CachedRepo[Record](repo, args.repo_cache_size, args.repo_cache_policy)
+    if index_dir is not None:
+        repo = IndexedRepo[Record](repo, indexes, index_dir, args.repo_index_journal_limit)
+    from assistant.changes import ChangeLogRepo
+
+    # outermost, so changes applied from other books also reach the indexes
+    return ChangeLogRepo[Record](repo, changes_filepath, args.repo_changes_compact_limit,
+                                 args.repo_lock_timeout)
+
+
+def main():
+    # CPU time of the process before main(): interpreter startup and imports
+    imports = time.process_time()
+    started = time.perf_counter()
+    ap = make_argparser()
+    args, cmd_args = ap.parse_known_args()
+    interactive = args.batch is None and not cmd_args
+    # timing every repo call and write is only paid for when asked for
+    metrics = None
+    if args.stats or args.stats_json is not None or args.timing or interactive:
+        metrics = Metrics()
+        metrics.activate()
+        metrics.record("startup.imports", imports)
+        metrics.record("startup.arguments", time.perf_counter() - started)
+
+    try:
+        repo = build_repo(args, metrics)
+    except ValueError as ex:
+        # e.g. a number of shards other than the book's
+        ap.error(str(ex))
+    try:
+        with repo if metrics is None else timed_open(repo, metrics) as addressbook:
+            with operation("startup.shells"):
+                if args.batch is not None and args.atomic:
+                    addressbook = TransactionRepo[Record](addressbook)
+                phones = Phones(addressbook, args.yes)
+                birthdays = Birthdays(addressbook, args.yes)
+                app = AssistantApp(
+                    addressbook,
+                    phones,
+                    birthdays,
+                    args.yes,
+                )
+                app.metrics = metrics
+                app.prompt = f"hello, {os.environ.get('USER', 'user')} > "
+            if args.batch is not None:
+                failed = run_batch_file(app, addressbook, args.batch, args.atomic, args.continue_on_error)
+            elif not interactive:
+                app.onecmd(shlex.join(cmd_args))
+            else:
+                init_file = Path(os.environ.get("ASSISTANT_INIT_FILE", ".assistant_init"))
+                read_init_file(init_file)
+
+                history_file = Path(os.environ.get(
+                    "ASSISTANT_HISTORY_FILE", ".assistant_history"))
+                read_history(history_file)
+                atexit.register(write_history, history_file)
+
+                app.cmdloop("Welcome to the assistant app!")
+    except LockTimeoutError as ex:
+        error(str(ex))
+        sys.exit(1)
+    if args.timing:
+        error(metrics.timing_report())
+    if args.stats_json is not None:
+        metrics.dump(args.stats_json)
+    if args.batch is not None and failed:
+        sys.exit(1)
+
+
+def run_batch_file(app: AssistantApp, addressbook: Repo[Record], path: Path,
+                   atomic: bool, continue_on_error: bool) -> bool:
+    from assistant.batch import run_batch
+
+    if str(path) == "-":
+        stats = run_batch(app, sys.stdin, continue_on_error, app.command_name)
+    else:
+        with path.open() as src:
+            stats = run_batch(app, src, continue_on_error, app.command_name)
+    print(stats.summary())
+    if isinstance(addressbook, TransactionRepo):
+        if stats.failed:
+            addressbook.rollback()
+            print("Batch has been rolled back")
         else:
-            app.cmdloop("Welcome to the assistant app!")
+            addressbook.commit()
+            print("Batch has been committed")
+    return stats.failed > 0
@@ -0,0 +1,84 @@
+from collections import Counter
+from collections.abc import Iterable
+from contextlib import redirect_stderr
+from dataclasses import dataclass
+from dataclasses import field
+import io
+import sys
+import time
+
+from assistant.common import Cmd
+
+
+class _ErrorTracker(io.TextIOBase):
+    """
+    Passes writes through to stderr and remembers that there were some
+
+    Commands report failures with `error`, i.e. on stderr.
+    """
+
+    def __init__(self, stderr):
+        self._stderr = stderr
+        self.failed = False
+
+    def writable(self):
+        return True
+
+    def write(self, s: str) -> int:
+        if s:
+            self.failed = True
+        return self._stderr.write(s)
+
+    def flush(self):
+        self._stderr.flush()
+
+
+@dataclass
+class BatchStats:
+    commands: Counter = field(default_factory=Counter)
+    failures: Counter = field(default_factory=Counter)
+    stopped_at: int | None = None
+    elapsed: float = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.commands.values())
+
+    @property
+    def failed(self) -> int:
+        return sum(self.failures.values())
+
+    def summary(self) -> str:
+        lines = [f"{self.total} commands, {self.failed} failed in {self.elapsed:.2f}s"]
+        for command, count in sorted(self.commands.items()):
+            failed = self.failures[command]
+            lines.append(f"  {command}: {count}" + (f" ({failed} failed)" if failed else ""))
+        if self.stopped_at is not None:
+            lines.append(f"Stopped at line {self.stopped_at}")
+        return "\n".join(lines)
+
+
+def run_batch(
+        app: Cmd,
+        lines: Iterable[str],
+        continue_on_error: bool,
+        command_name=lambda line: line.split()[0],
+) -> BatchStats:
+    stats = BatchStats()
+    started = time.perf_counter()
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        command = command_name(line)
+        tracker = _ErrorTracker(sys.stderr)
+        with redirect_stderr(tracker):
+            app.onecmd(line)
+        stats.commands[command] += 1
+        if tracker.failed:
+            stats.failures[command] += 1
+            if not continue_on_error:
+                stats.stopped_at = lineno
+                break
+    stats.elapsed = time.perf_counter() - started
+    return stats
@@ -1,43 +1,91 @@
+import calendar
+from datetime import MAXYEAR
+from datetime import MINYEAR
 from datetime import date
 from datetime import timedelta
+from functools import cached_property
 import shlex
 
 from assistant.common import Cmd
 from assistant.common import CmdArgumentParser
 from assistant.common import confirm
 from assistant.common import error
+from assistant.congratulations import birthday_stats
+from assistant.congratulations import congratulation_date
+from assistant.congratulations import congratulation_ordinals
+from assistant.indexes import BirthdayIndex
 from assistant.model import Birthday
 from assistant.model import Name
 from assistant.model import Record
+from assistant.search import complete_name
+from assistant.search import did_you_mean
 from assistant import repos
 
 
 class Birthdays(Cmd):
     confirm_exit = False
     say_goodbye = False
-
-    _set_parser: CmdArgumentParser
-    _show_parser: CmdArgumentParser
-    _clear_parser: CmdArgumentParser
+    # commands that change the addressbook
+    writes = frozenset({"set", "clear"})
 
     def __init__(self, addressbook: repos.Repo[Record], yes: bool):
         super().__init__()
         self._addressbook = addressbook
         self._yes = yes
 
-        self._set_parser = CmdArgumentParser("set", add_help=False)
-        self._set_parser.add_argument(
+    def begin(self, line):
+        cmd, _, _ = self.parseline(line)
+        repos.begin_command(self._addressbook, cmd in self.writes)
+
+    def postcmd(self, stop, line):
+        # let other processes at the addressbook between interactive commands
+        self._addressbook.flush()
+        return stop
+
+    @cached_property
+    def _set_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("set", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record")
-        self._set_parser.add_argument(
+        parser.add_argument(
             "birthday", type=Birthday, help="Birthday of the record (YYYY.MM.DD)")
+        return parser
 
-        self._show_parser = CmdArgumentParser("show", add_help=False)
-        self._show_parser.add_argument(
+    @cached_property
+    def _show_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("show", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record")
+        return parser
 
-        self._clear_parser = CmdArgumentParser("clear", add_help=False)
-        self._clear_parser.add_argument(
+    @cached_property
+    def _clear_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("clear", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record to clear birthday")
+        return parser
+
+    @cached_property
+    def _upcoming_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("upcoming", add_help=False)
+        parser.add_argument(
+            "--days", type=int, default=None,
+            help="Number of days to look ahead (default: till the end of the year)")
+        return parser
+
+    @cached_property
+    def _calendar_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("calendar", add_help=False)
+        parser.add_argument(
+            "--year", type=int, default=None, help="Year of the calendar (default: current)")
+        return parser
+
+    @cached_property
+    def _stats_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("stats", add_help=False)
+        parser.add_argument(
+            "--year", type=int, default=None, help="Year of the statistics (default: current)")
+        return parser
 
     def do_set(self, arg):
         """
@@ -61,7 +109,7 @@ class Birthdays(Cmd):
         args = self._show_parser.parse_args(shlex.split(arg))
         record = self._addressbook.get(args.name)
         if record is None:
-            error(f"Record {args.name} does not exist")
+            error(f"Record {args.name} does not exist{did_you_mean(self._addressbook, args.name)}")
             return
         if record.birthday is None:
             print(f"{args.name} has no birthday")
@@ -79,7 +127,7 @@ class Birthdays(Cmd):
         args = self._clear_parser.parse_args(shlex.split(arg))
         record = self._addressbook.get(args.name)
         if record is None:
-            error(f"Record {args.name} does not exist")
+            error(f"Record {args.name} does not exist{did_you_mean(self._addressbook, args.name)}")
             return
         if not self._yes and not confirm(f"Are you sure you want to clear birthday from {args.name}?"):
             return
@@ -90,25 +138,129 @@ class Birthdays(Cmd):
     def help_clear(self):
         print(self._clear_parser.format_help())
 
+    def complete_set(self, text, line, begidx, endidx):
+        return complete_name(self._addressbook, text, line, endidx)
+
+    complete_show = complete_clear = complete_set
+
     def do_upcoming(self, arg):
         """
         Show upcoming birthdays
         """
+        args = self._upcoming_parser.parse_args(shlex.split(arg))
+        if args.days is not None and args.days < 0:
+            error("Number of days cannot be negative")
+            return
         current_date = date.today()
-        for name, record in self._addressbook.items():
-            if record.birthday is None:
-                continue
-            congratulation_date = _get_congratulation_date(
-                record.birthday.birthday, current_date.year)
-            if congratulation_date < current_date:
-                continue
+        end_date = None if args.days is None else current_date + timedelta(days=args.days)
+        for congratulation_date, name, record in self._upcoming(current_date, end_date):
             print(f"{name} was born on {record.birthday.birthday.strftime('%Y.%m.%d (%A)')}, "
                   f"congratulations on {congratulation_date.strftime('%Y.%m.%d (%A)')}")
 
+    def help_upcoming(self):
+        print(self._upcoming_parser.format_help())
+
+    def do_calendar(self, arg):
+        """
+        Show congratulation dates of all birthdays in a year grouped by week
+        """
+        args = self._calendar_parser.parse_args(shlex.split(arg))
+        year = date.today().year if args.year is None else args.year
+        if not MINYEAR <= year < MAXYEAR:
+            error(f"Year must be between {MINYEAR} and {MAXYEAR - 1}")
+            return
+        names, ordinals = self._birthday_ordinals()
+        birthdays, congratulations = congratulation_ordinals(ordinals, year)
+        week = None
+        for congratulated, born, name in sorted(zip(congratulations, birthdays, names)):
+            congratulation = date.fromordinal(congratulated)
+            monday = congratulation - timedelta(days=congratulation.weekday())
+            if monday != week:
+                week = monday
+                print(f"Week of {monday.strftime('%Y.%m.%d')}")
+            line = f"  {congratulation.strftime('%Y.%m.%d (%a)')} {name}"
+            if born != congratulated:
+                line += f" (birthday on {date.fromordinal(born).strftime('%Y.%m.%d (%a)')})"
+            print(line)
+
+    def help_calendar(self):
+        print(self._calendar_parser.format_help())
+
+    def do_stats(self, arg):
+        """
+        Show number of birthdays per month and per weekday in a year
+        """
+        args = self._stats_parser.parse_args(shlex.split(arg))
+        year = date.today().year if args.year is None else args.year
+        if not MINYEAR <= year < MAXYEAR:
+            error(f"Year must be between {MINYEAR} and {MAXYEAR - 1}")
+            return
+        _, ordinals = self._birthday_ordinals()
+        months, weekdays = birthday_stats(ordinals, year)
+        print(f"{len(ordinals)} birthdays in {year}")
+        print("Congratulations by month:")
+        for month, count in enumerate(months, 1):
+            print(f"  {calendar.month_name[month]:<10} {count}")
+        print("Birthdays by weekday:")
+        for weekday, count in enumerate(weekdays):
+            print(f"  {calendar.day_name[weekday]:<10} {count}")
+
+    def help_stats(self):
+        print(self._stats_parser.format_help())
+
+    def _birthday_ordinals(self) -> tuple[list[str], list[int]]:
+        found = repos.scan(self._addressbook, _birthday_ordinals, key=lambda item: item[0])
+        names = []
+        ordinals = []
+        for name, ordinal in found:
+            names.append(name)
+            ordinals.append(ordinal)
+        return names, ordinals
+
+    def _upcoming(self, start_date: date, end_date: date | None):
+        # Birthdays on a weekend (or on February 29) are congratulated up to
+        # three days later, so look a bit before the window and re-check
+        # every candidate against the actual congratulation date.
+        lookup_from = start_date - timedelta(days=3)
+        if end_date is None:
+            lookup_from = max(lookup_from, date(start_date.year, 1, 1))
+            lookup_to = date(start_date.year, 12, 31)
+        else:
+            lookup_to = end_date + timedelta(days=1)
+        found = []
+        for year in range(lookup_from.year, lookup_to.year + 1):
+            lo = max(lookup_from, date(year, 1, 1))
+            hi = min(lookup_to, date(year, 12, 31))
+            for name, record in self._birthdays_between((lo.month, lo.day), (hi.month, hi.day)):
+                congratulation = congratulation_date(
+                    record.birthday.birthday, year)
+                if congratulation < start_date:
+                    continue
+                if end_date is not None and congratulation > end_date:
+                    continue
+                found.append((congratulation, str(name), record))
+        found.sort(key=lambda item: item[:2])
+        return found
+
+    def _birthdays_between(self, lo: tuple[int, int], hi: tuple[int, int]):
+        index = repos.find_index(self._addressbook, BirthdayIndex.name)
+        if index is None:
+            return repos.scan(self._addressbook, _birthdays_between, lo, hi,
+                              key=lambda item: item[0])
+        return ((name, record) for name in index.range(lo, hi)
+                if (record := self._addressbook.get(name)) is not None
+                and record.birthday is not None)
+
+
+def _birthday_ordinals(addressbook: repos.Repo[Record]):
+    return sorted((str(name), record.birthday.ordinal) for name, record in addressbook.items()
+                  if record.birthday is not None)
+
 
-def _get_congratulation_date(birthdate: date, _current_year: int):
-    birthday = date(_current_year, birthdate.month, birthdate.day)
-    weekday = birthday.weekday()
-    if 0 <= weekday < 5:
-        return birthday
-    return date(_current_year, birthdate.month, birthday.day) + timedelta(days=(7 - weekday))
+def _birthdays_between(addressbook: repos.Repo[Record], lo: tuple[int, int], hi: tuple[int, int]):
+    return sorted(
+        ((str(name), record) for name, record in addressbook.items()
+         if record.birthday is not None
+         and lo <= (record.birthday.birthday.month, record.birthday.birthday.day) <= hi),
+        key=lambda item: item[0],
+    )
@@ -0,0 +1,431 @@
+from bisect import bisect_right
+from collections.abc import Iterable
+from collections.abc import Iterator
+from enum import StrEnum
+import os
+from pathlib import Path
+import struct
+from typing import IO
+import zlib
+
+from assistant.locking import FileLock
+from assistant.serialization import CODECS
+from assistant.serialization import Codec
+from assistant.serialization import CodecType
+from assistant.serialization import decode
+
+MAGIC = b"ABBK"
+# magic, compression of the blocks
+DATA_HEADER = struct.Struct("<4sB")
+# offset and compressed length of a block, length of its first key
+BLOCK_ENTRY = struct.Struct("<QII")
+# offset of the block index, number of blocks, magic
+FOOTER = struct.Struct("<QI4s")
+ENTRY_HEADER = struct.Struct("<II")
+# number of records in a block, then the offset of each record in the block
+COUNT = struct.Struct("<I")
+OFFSET = struct.Struct("<I")
+
+
+class BlockStoreError(ValueError):
+    ...
+
+
+class Compression(StrEnum):
+    NONE = "none"
+    ZLIB = "zlib"
+    LZMA = "lzma"
+
+
+# ids stored in data files, don't reorder
+COMPRESSIONS = [Compression.NONE, Compression.ZLIB, Compression.LZMA]
+
+
+def compress(compression: Compression, data: bytes, level: int) -> bytes:
+    match compression:
+        case Compression.NONE:
+            return data
+        case Compression.ZLIB:
+            return zlib.compress(data, level)
+        case Compression.LZMA:
+            # only books written with it pay for the import
+            import lzma
+
+            return lzma.compress(data, preset=level)
+    raise BlockStoreError(f"Unsupported compression: {compression}")
+
+
+def decompress(compression: Compression, data: bytes) -> bytes:
+    match compression:
+        case Compression.NONE:
+            return data
+        case Compression.ZLIB:
+            return zlib.decompress(data)
+        case Compression.LZMA:
+            import lzma
+
+            return lzma.decompress(data)
+    raise BlockStoreError(f"Unsupported compression: {compression}")
+
+
+class BlockStoreRepo[T]:
+    """
+    Records sorted by key and compressed in blocks of about `block_size`
+    bytes
+
+    The data file holds the compressed blocks followed by a block index
+    (offset, length and first key of every block) that is read on open, so
+    `get` reads and decompresses a single block and `items` streams the
+    book block by block. Each block starts with the offsets of its records
+    for a binary search, and the last block read is kept decompressed.
+
+    Changes are appended uncompressed to a journal next to the data file
+    and kept in memory. Once the journal grows past `compact_limit` bytes,
+    the blocks are rewritten with it merged in, using the current
+    compression, level and block size; blocks written with other settings
+    are still read. An entry with an empty value marks its record as
+    deleted, and replaying a journal is idempotent.
+
+    Several processes can share the files, with the locking of PickleRepo:
+    opening takes a shared lock, writing an exclusive one held until `flush`
+    or close, and a writer first replays what others appended to the journal
+    (or reopens the blocks they compacted) since it last looked.
+    """
+    _file: IO[bytes] | None
+    _journal: IO[bytes] | None
+
+    def __init__(self, filepath: Path, compression: Compression = Compression.ZLIB,
+                 level: int = 6, block_size: int = 4096,
+                 compact_limit: int = 4 * 1024 * 1024,
+                 codec: Codec = CODECS[CodecType.PICKLE], lock_timeout: float = 10.0):
+        self.filepath = filepath
+        self.journal_filepath = filepath.with_name(filepath.name + ".journal")
+        self.compression = compression
+        self.level = level
+        self.block_size = block_size
+        self.compact_limit = compact_limit
+        self.codec = codec
+        self.lock = FileLock(filepath.with_name(filepath.name + ".lock"), lock_timeout)
+        self.generation = 0
+        self.foreign_changes = 0
+        self.written = False
+        self._file = None
+        self._file_id: int | None = None
+        self._journal = None
+        self._journal_id: int | None = None
+        # end of the complete entries in the journal
+        self._position = 0
+        self._stored_compression = compression
+        self._first_keys: list[bytes] = []
+        self._blocks: list[tuple[int, int]] = []
+        self._cached: tuple[int, bytes] | None = None
+        # journal entries, an empty value marks a deleted record
+        self._tail: dict[str, bytes] = {}
+
+    def __enter__(self):
+        self.lock.acquire(exclusive=not self.filepath.exists())
+        try:
+            if not self.filepath.exists():
+                self._write_file(())
+            self._open()
+            self.generation = self.lock.generation()
+        finally:
+            self.lock.release()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._journal is not None:
+                self._close_journal(sync=True)
+                self.generation = self.lock.bump()
+            if self.written and self._position > self.compact_limit:
+                self.lock_for_write()
+                self.compact()
+                self.generation = self.lock.bump()
+        finally:
+            self.written = False
+            self.lock.release()
+            self._close()
+
+    def _open(self):
+        self._file = self.filepath.open("rb")
+        self._file_id = os.fstat(self._file.fileno()).st_ino
+        header = self._file.read(DATA_HEADER.size)
+        size = self._file.seek(0, os.SEEK_END)
+        if len(header) < DATA_HEADER.size or size < DATA_HEADER.size + FOOTER.size:
+            raise BlockStoreError(f"{self.filepath} is not a block store")
+        magic, compression = DATA_HEADER.unpack(header)
+        index_offset, count, footer_magic = FOOTER.unpack(
+            os.pread(self._file.fileno(), FOOTER.size, size - FOOTER.size))
+        if magic != MAGIC or footer_magic != MAGIC or compression >= len(COMPRESSIONS):
+            raise BlockStoreError(f"{self.filepath} is not a block store")
+        self._stored_compression = COMPRESSIONS[compression]
+        index = memoryview(os.pread(
+            self._file.fileno(), size - FOOTER.size - index_offset, index_offset))
+        self._first_keys = []
+        self._blocks = []
+        position = 0
+        for _ in range(count):
+            offset, length, key_len = BLOCK_ENTRY.unpack_from(index, position)
+            position += BLOCK_ENTRY.size
+            self._first_keys.append(bytes(index[position:position + key_len]))
+            self._blocks.append((offset, length))
+            position += key_len
+        self._cached = None
+        self._tail = {}
+        self._journal_id = _file_id(self.journal_filepath)
+        self._position = self._replay(0)
+
+    def _replay(self, position: int) -> int:
+        """
+        Apply journal entries from `position` on and return where they end
+        """
+        try:
+            with self.journal_filepath.open("rb") as src:
+                src.seek(position)
+                data = src.read()
+        except FileNotFoundError:
+            return 0
+        end = 0
+        while end + ENTRY_HEADER.size <= len(data):
+            key_len, value_len = ENTRY_HEADER.unpack_from(data, end)
+            start = end + ENTRY_HEADER.size
+            stop = start + key_len + value_len
+            if stop > len(data):
+                break
+            self._tail[data[start:start + key_len].decode()] = data[start + key_len:stop]
+            end = stop
+        if end != len(data):
+            # drop the incomplete entry left by an interrupted write,
+            # nobody can be writing it while we hold the lock
+            self.lock.acquire(exclusive=True)
+            with self.journal_filepath.open("r+b") as dst:
+                dst.truncate(position + end)
+        return position + end
+
+    def _catch_up(self):
+        generation = self.lock.generation()
+        if generation == self.generation and _file_size(self.journal_filepath) == self._position:
+            return
+        if (_file_id(self.filepath) != self._file_id
+                or _file_id(self.journal_filepath) != self._journal_id):
+            # compacted or cleared by another process
+            self._close()
+            self._open()
+        else:
+            self._position = self._replay(self._position)
+        if generation != self.generation:
+            self.foreign_changes += 1
+        self.generation = generation
+
+    def lock_for_write(self):
+        """
+        Take the exclusive lock, held until `flush` or close, and pick up
+        changes of other processes
+        """
+        if self.lock.held and self.lock.exclusive:
+            return
+        self.lock.acquire(exclusive=True)
+        self._catch_up()
+
+    def _close_journal(self, sync: bool):
+        self._journal.flush()
+        if sync:
+            os.fsync(self._journal.fileno())
+        self._position = self._journal.tell()
+        self._journal.close()
+        self._journal = None
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._cached = None
+
+    def _read_block(self, block: int) -> bytes:
+        offset, length = self._blocks[block]
+        return decompress(self._stored_compression, os.pread(self._file.fileno(), length, offset))
+
+    def _block(self, block: int) -> bytes:
+        if self._cached is None or self._cached[0] != block:
+            self._cached = block, self._read_block(block)
+        return self._cached[1]
+
+    def _find(self, key: bytes) -> memoryview | None:
+        block = bisect_right(self._first_keys, key) - 1
+        if block < 0:
+            return None
+        data = memoryview(self._block(block))
+        lo, hi = 0, COUNT.unpack_from(data)[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found, value = _entry(data, mid)
+            if found < key:
+                lo = mid + 1
+            elif found > key:
+                hi = mid
+            else:
+                return value
+        return None
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        id = str(id)
+        value = self._tail.get(id)
+        if value is None:
+            value = self._find(id.encode())
+        if not value:
+            return default
+        return decode(value)
+
+    def _append(self, id: str, encoded: bytes):
+        self.lock_for_write()
+        if self._journal is None:
+            self._journal = self.journal_filepath.open("ab")
+            self._journal_id = os.fstat(self._journal.fileno()).st_ino
+        key = id.encode()
+        self._journal.write(ENTRY_HEADER.pack(len(key), len(encoded)))
+        self._journal.write(key)
+        self._journal.write(encoded)
+        self._tail[id] = encoded
+        self.written = True
+
+    def set(self, id: str, value: T) -> None:
+        self._append(str(id), self.codec.encode(value))
+
+    def delete(self, id: str) -> None:
+        id = str(id)
+        if self.get(id) is None:
+            return
+        self._append(id, b"")
+
+    def _stored_items(self) -> Iterator[tuple[str, memoryview]]:
+        for block in range(len(self._blocks)):
+            data = memoryview(self._read_block(block))
+            for position in range(COUNT.unpack_from(data)[0]):
+                key, value = _entry(data, position)
+                yield key.decode(), value
+
+    def _encoded_items(self) -> Iterator[tuple[str, bytes | memoryview]]:
+        overlay = sorted(self._tail)
+        pending = 0
+        for key, value in self._stored_items():
+            while pending < len(overlay) and overlay[pending] < key:
+                yield overlay[pending], self._tail[overlay[pending]]
+                pending += 1
+            if key not in self._tail:
+                yield key, value
+        for key in overlay[pending:]:
+            yield key, self._tail[key]
+
+    def items(self) -> Iterator[tuple[str, T]]:
+        for key, value in self._encoded_items():
+            # deleted records are dropped
+            if value:
+                yield key, decode(value)
+
+    def clear(self):
+        self.lock_for_write()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._close()
+        self._write_file(())
+        self.journal_filepath.unlink(missing_ok=True)
+        self._open()
+        self.generation = self.lock.bump()
+
+    def flush(self):
+        """
+        End the current write, or pick up changes of other processes
+        """
+        if self.lock.held:
+            try:
+                if self._journal is not None:
+                    self._close_journal(sync=False)
+                    self.generation = self.lock.bump()
+            finally:
+                self.lock.release()
+            return
+        self.lock.acquire(exclusive=False)
+        try:
+            self._catch_up()
+        finally:
+            self.lock.release()
+
+    def compact(self):
+        """
+        Merge the journal into freshly written blocks, the exclusive lock
+        must be held
+        """
+        self._write_file((key, value) for key, value in self._encoded_items() if value)
+        # a crash before the journal is gone replays it on top of the new
+        # blocks, which already hold its changes
+        self.journal_filepath.unlink(missing_ok=True)
+        self._close()
+        self._open()
+
+    def _write_file(self, entries: Iterable[tuple[str, bytes | memoryview]]):
+        tmp = self.filepath.with_name(self.filepath.name + ".tmp")
+        index = []
+        with tmp.open("wb") as dst:
+            dst.write(DATA_HEADER.pack(MAGIC, COMPRESSIONS.index(self.compression)))
+            keys: list[bytes] = []
+            values: list[bytes | memoryview] = []
+            size = 0
+
+            def write_block():
+                offset = dst.tell()
+                dst.write(compress(self.compression, _pack_block(keys, values), self.level))
+                index.append((offset, dst.tell() - offset, keys[0]))
+                keys.clear()
+                values.clear()
+
+            for id, encoded in entries:
+                keys.append(id.encode())
+                values.append(encoded)
+                size += ENTRY_HEADER.size + OFFSET.size + len(keys[-1]) + len(encoded)
+                if size >= self.block_size:
+                    write_block()
+                    size = 0
+            if keys:
+                write_block()
+            index_offset = dst.tell()
+            for offset, length, key in index:
+                dst.write(BLOCK_ENTRY.pack(offset, length, len(key)))
+                dst.write(key)
+            dst.write(FOOTER.pack(index_offset, len(index), MAGIC))
+            dst.flush()
+            os.fsync(dst.fileno())
+        tmp.replace(self.filepath)
+
+
+def _file_id(path: Path) -> int | None:
+    try:
+        return path.stat().st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _pack_block(keys: list[bytes], values: list[bytes | memoryview]) -> bytes:
+    offsets = []
+    entries = []
+    position = COUNT.size + OFFSET.size * len(keys)
+    for key, value in zip(keys, values):
+        offsets.append(OFFSET.pack(position))
+        entries += [ENTRY_HEADER.pack(len(key), len(value)), key, value]
+        position += ENTRY_HEADER.size + len(key) + len(value)
+    return b"".join([COUNT.pack(len(keys)), *offsets, *entries])
+
+
+def _entry(block: memoryview, position: int) -> tuple[bytes, memoryview]:
+    offset = OFFSET.unpack_from(block, COUNT.size + position * OFFSET.size)[0]
+    key_len, value_len = ENTRY_HEADER.unpack_from(block, offset)
+    start = offset + ENTRY_HEADER.size
+    return bytes(block[start:start + key_len]), block[start + key_len:start + key_len + value_len]
@@ -0,0 +1,494 @@
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+import json
+import os
+from pathlib import Path
+import time
+from typing import IO, Any
+import uuid
+
+from assistant.locking import FileLock
+from assistant.model import Birthday
+from assistant.model import ModelError
+from assistant.model import Name
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+from assistant import repos
+from assistant.transfer import json_record
+
+FORMAT = "assistant-changes"
+VERSION = 1
+
+# json.dumps builds a new encoder for every call with non-default options
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+class ChangesError(ValueError):
+    ...
+
+
+@dataclass
+class Change:
+    seq: int
+    # wall clock in nanoseconds, the last writer wins by it
+    time: int
+    # book the change was made in, None for this one
+    origin: str | None
+    op: str
+    name: str | None = None
+
+    def key(self, book: str) -> tuple[int, str]:
+        return self.time, self.origin or book
+
+
+@dataclass
+class History:
+    latest: dict[str, Change] = field(default_factory=dict)
+    # the clear that deleted the most, records changed before it are gone
+    clear: Change | None = None
+    until: int = 0
+
+
+class ChangeLogRepo[T]:
+    """
+    Numbers every set/delete/clear in an append-only log next to the data
+
+    Each change gets the next sequence number of the book, the time it was
+    made and the book it came from, so `export_changes` can send only what
+    changed since a peer last synced and `apply_changes` can settle
+    conflicts by the last writer. The log only holds names, the records
+    themselves are read from the repo when they are exported.
+
+    Writers take an exclusive lock on the log until `flush` or close, like
+    PickleRepo, always after the write lock of the data: with the opposite
+    order somewhere, two writers could each wait for the lock the other one
+    holds. When the log grows past `compact_limit` bytes (and twice
+    its size after the last compaction) it is rewritten keeping only the
+    latest change of every name, with their sequence numbers, so exports
+    from any earlier point stay correct. Tombstones are kept.
+    """
+    log: IO[bytes] | None
+
+    def __init__(self, repo: repos.Repo[T], filepath: Path,
+                 compact_limit: int = 4 * 1024 * 1024, lock_timeout: float = 10.0):
+        self.repo = repo
+        self.filepath = filepath
+        self.compact_limit = compact_limit
+        self.lock = FileLock(filepath.with_name(filepath.name + ".lock"), lock_timeout)
+        self.log = None
+        self.seq = 0
+        self.written = False
+        self._book: str | None = None
+        self._compacted = 0
+
+    def __enter__(self):
+        self.repo.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._end(sync=True)
+            if self.written:
+                self._maybe_compact()
+        finally:
+            self.written = False
+            self.repo.__exit__(exc_type, exc_val, exc_tb)
+
+    @property
+    def book(self) -> str:
+        """
+        Random id of this book, made when the first change is logged
+        """
+        if self._book is None:
+            with self._reading() as src:
+                if src is not None:
+                    self._read_header(src)
+            if self._book is None:
+                self.lock_for_write()
+        return self._book
+
+    def _read_header(self, src: IO[bytes]) -> int | None:
+        """
+        Sequence number the log was compacted at, None if it has no header
+        """
+        header = src.readline()
+        if not header.endswith(b"\n"):
+            return None
+        try:
+            header = json.loads(header)
+        except ValueError:
+            raise ChangesError(f"{self.filepath} is not a change log")
+        self._book = header["book"]
+        self._compacted = header["compacted"]
+        return header["seq"]
+
+    def _begin(self):
+        """
+        Take the log for writing, numbering after the changes of other
+        processes
+        """
+        if self.log is not None:
+            return
+        self.lock.acquire(exclusive=True)
+        try:
+            log = self.filepath.open("a+b")
+            try:
+                log.seek(0)
+                seq = self._read_header(log)
+                if seq is None:
+                    # new log, or one whose header never made it to disk
+                    log.truncate(0)
+                    self._book = uuid.uuid4().hex
+                    self._compacted = 0
+                    log.write(_header(self._book, 0, 0))
+                    self.seq = 0
+                else:
+                    line, end = _last_line(log, log.tell())
+                    if end != log.seek(0, os.SEEK_END):
+                        # drop the incomplete entry left by an interrupted write
+                        log.truncate(end)
+                    self.seq = max(seq, json.loads(line)[0] if line else 0)
+            except BaseException:
+                log.close()
+                raise
+        except BaseException:
+            self.lock.release()
+            raise
+        self.log = log
+
+    def _end(self, sync: bool):
+        if self.log is None:
+            return
+        try:
+            self.log.flush()
+            if sync:
+                os.fsync(self.log.fileno())
+            self.log.close()
+        finally:
+            self.log = None
+            self.lock.release()
+
+    def _record(self, op: str, name: str | None, time_ns: int | None, origin: str | None):
+        self.lock_for_write()
+        self.seq += 1
+        if origin == self._book:
+            origin = None
+        entry = [self.seq, time.time_ns() if time_ns is None else time_ns, origin, op, name]
+        self.log.write(_line(entry))
+        self.written = True
+
+    @contextmanager
+    def _reading(self) -> Iterator[IO[bytes] | None]:
+        if self.log is not None:
+            self.log.flush()
+        if self.lock.held:
+            # reading back our own changes, or compacting
+            with self.filepath.open("rb") as src:
+                yield src
+            return
+        self.lock.acquire(exclusive=False)
+        try:
+            try:
+                src = self.filepath.open("rb")
+            except FileNotFoundError:
+                yield None
+                return
+            with src:
+                yield src
+        finally:
+            self.lock.release()
+
+    def _entries(self, src: IO[bytes]) -> Iterator[Change]:
+        for line in src:
+            if not line.endswith(b"\n"):
+                break
+            yield Change(*json.loads(line))
+
+    def history(self, since: int = 0) -> History:
+        """
+        Latest change of every name changed after `since`
+        """
+        history = History()
+        with self._reading() as src:
+            if src is None:
+                return history
+            history.until = self._read_header(src) or 0
+            book = self._book
+            for change in self._entries(src):
+                history.until = change.seq
+                if change.seq <= since:
+                    continue
+                if change.op != "clear":
+                    history.latest[change.name] = change
+                elif history.clear is None or change.key(book) > history.clear.key(book):
+                    history.clear = change
+        return history
+
+    def _maybe_compact(self):
+        try:
+            size = self.filepath.stat().st_size
+        except FileNotFoundError:
+            return
+        if size <= max(self.compact_limit, 2 * self._compacted):
+            return
+        self.lock.acquire(exclusive=True)
+        try:
+            self.compact()
+        finally:
+            self.lock.release()
+
+    def compact(self):
+        """
+        Rewrite the log with the latest change of every name, the lock must
+        be held
+        """
+        history = self.history()
+        book = self.book
+        clear = None if history.clear is None else history.clear.key(book)
+        changes = [history.clear] if history.clear is not None else []
+        for change in history.latest.values():
+            # tombstones older than the clear are covered by it
+            if change.op == "delete" and clear is not None and change.key(book) < clear:
+                continue
+            changes.append(change)
+        changes.sort(key=lambda change: change.seq)
+        body = b"".join(
+            _line([c.seq, c.time, c.origin, c.op, c.name]) for c in changes)
+        tmp = self.filepath.with_name(self.filepath.name + ".tmp")
+        with tmp.open("wb") as dst:
+            dst.write(_header(book, history.until, len(body)))
+            dst.write(body)
+            dst.flush()
+            os.fsync(dst.fileno())
+        tmp.replace(self.filepath)
+        self._compacted = len(body)
+
+    def index(self, name: str) -> Any | None:
+        return repos.find_index(self.repo, name)
+
+    def reindex(self):
+        if not isinstance(self.repo, repos.Indexed):
+            raise ValueError("The repository has no indexes")
+        self.repo.reindex()
+
+    def scan(self, func: Callable[..., list], *args) -> list[list]:
+        if isinstance(self.repo, repos.Scannable):
+            return self.repo.scan(func, *args)
+        return [func(self.repo, *args)]
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        return self.repo.get(id, default)
+
+    def set(self, id: str, value: T, *, time_ns: int | None = None,
+            origin: str | None = None) -> None:
+        # logged first, so a crash in between at worst sends an unchanged
+        # record to the peers
+        self._record("set", str(id), time_ns, origin)
+        self.repo.set(id, value)
+
+    def delete(self, id: str, *, time_ns: int | None = None,
+               origin: str | None = None) -> None:
+        # deletions made here are only logged for records that exist,
+        # applied ones always are, to pass them on to further peers
+        self.lock_for_write()
+        if time_ns is None and self.repo.get(id) is None:
+            return
+        self._record("delete", str(id), time_ns, origin)
+        self.repo.delete(id)
+
+    def items(self):
+        return self.repo.items()
+
+    def clear(self, *, time_ns: int | None = None, origin: str | None = None):
+        self._record("clear", None, time_ns, origin)
+        self.repo.clear()
+
+    def flush(self):
+        self._end(sync=False)
+        self.repo.flush()
+
+    def lock_for_write(self):
+        self.repo.lock_for_write()
+        self._begin()
+
+
+def find_changelog(repo: repos.Repo) -> ChangeLogRepo | None:
+    while not isinstance(repo, ChangeLogRepo):
+        repo = getattr(repo, "repo", None)
+        if repo is None:
+            return None
+    return repo
+
+
+def _line(obj) -> bytes:
+    return (_encoder.encode(obj) + "\n").encode()
+
+
+def _header(book: str, seq: int, compacted: int) -> bytes:
+    return _line({"book": book, "seq": seq, "compacted": compacted})
+
+
+def _last_line(src: IO[bytes], start: int) -> tuple[bytes, int]:
+    """
+    Last complete line after `start` and the position where complete lines
+    end
+    """
+    end = src.seek(0, os.SEEK_END)
+    window = 4096
+    while True:
+        position = max(start, end - window)
+        src.seek(position)
+        data = src.read(end - position)
+        newline = data.rfind(b"\n")
+        previous = data.rfind(b"\n", 0, max(newline, 0))
+        if previous < 0 and position > start:
+            window *= 2
+            continue
+        if newline < 0:
+            return b"", start
+        return data[previous + 1:newline], position + newline + 1
+
+
+@dataclass
+class ExportStats:
+    changes: int = 0
+    until: int = 0
+
+
+def export_changes(changelog: ChangeLogRepo[Record], dst: IO[str], since: int) -> ExportStats:
+    """
+    Write the records changed after `since`, tombstones of the deleted ones
+    and the latest clear
+
+    A full export (since 0) also carries the records that were never
+    changed through the log, as if they were written at time 0.
+    """
+    history = changelog.history(since)
+    book = changelog.book
+    stats = ExportStats(until=history.until)
+
+    def write(obj: dict):
+        dst.write(json.dumps(obj, ensure_ascii=False))
+        dst.write("\n")
+        stats.changes += 1
+
+    dst.write(json.dumps({
+        "format": FORMAT, "version": VERSION, "book": book, "since": since, "until": history.until,
+    }))
+    dst.write("\n")
+    clear = None
+    if history.clear is not None:
+        clear = history.clear.key(book)
+        write({"seq": history.clear.seq, "time": history.clear.time,
+               "origin": history.clear.origin or book, "clear": True})
+    if since == 0:
+        for name, record in changelog.items():
+            if str(name) not in history.latest:
+                write({"seq": 0, "time": 0, "origin": book, **json_record(name, record)})
+    for change in sorted(history.latest.values(), key=lambda change: change.seq):
+        record = changelog.get(change.name)
+        change_json = {"seq": change.seq, "time": change.time, "origin": change.origin or book}
+        if record is not None:
+            write({**change_json, **json_record(change.name, record)})
+        elif clear is None or change.key(book) > clear:
+            write({**change_json, "name": change.name, "deleted": True})
+    return stats
+
+
+@dataclass
+class ApplyStats:
+    book: str = ""
+    until: int = 0
+    changes: int = 0
+    applied: int = 0
+
+
+def apply_changes(changelog: ChangeLogRepo[Record], src: IO[str], source: str) -> ApplyStats:
+    """
+    Merge changes exported from another book, the later change of a record
+    wins
+
+    Applied changes keep their time and origin, so they are passed on
+    unchanged when this book is synced with further peers. The whole file
+    is parsed before anything is applied, so a malformed one changes
+    nothing.
+    """
+    stats = ApplyStats()
+    lines = enumerate(src, 1)
+    try:
+        header = json.loads(next(lines)[1])
+    except (StopIteration, ValueError):
+        raise ChangesError(f"{source} is not a change file")
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise ChangesError(f"{source} is not a change file")
+    if header.get("version") != VERSION:
+        raise ChangesError(f"{source} has unsupported version {header.get('version')}")
+    if not isinstance(header.get("book"), str) or not isinstance(header.get("until"), int):
+        raise ChangesError(f"{source} has a malformed header")
+    book = changelog.book
+    if header["book"] == book:
+        raise ChangesError(f"{source} was exported from this addressbook")
+    stats.book, stats.until = header["book"], header["until"]
+
+    # (incoming key, name or None for a clear, record or None for a deletion)
+    changes: list[tuple[tuple[int, str], str | None, Record | None]] = []
+    for lineno, line in lines:
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            incoming = (int(obj["time"]), str(obj["origin"]))
+            if obj.get("clear"):
+                changes.append((incoming, None, None))
+            elif obj.get("deleted"):
+                changes.append((incoming, str(obj["name"]), None))
+            else:
+                changes.append((incoming, str(obj["name"]), _parse_record(obj)))
+        except (ModelError, ValueError, KeyError, TypeError, AttributeError) as ex:
+            raise ChangesError(f"{source}:{lineno}: Malformed change: {ex}")
+
+    # other processes must not change the book between reading the log and
+    # applying what wins
+    changelog.lock_for_write()
+    history = changelog.history()
+    clear = (0, "") if history.clear is None else history.clear.key(book)
+
+    def local(name: str) -> tuple[int, str]:
+        change = history.latest.get(name)
+        return clear if change is None else max(change.key(book), clear)
+
+    for incoming, name, record in changes:
+        time_ns, origin = incoming
+        stats.changes += 1
+        if name is None:
+            if incoming <= clear:
+                continue
+            for name in [str(name) for name, _ in changelog.items()]:
+                if local(name) < incoming:
+                    changelog.repo.delete(name)
+            changelog._record("clear", None, time_ns, origin)
+            clear = incoming
+        else:
+            if incoming <= local(name):
+                continue
+            if record is None:
+                changelog.delete(name, time_ns=time_ns, origin=origin)
+            else:
+                changelog.set(name, record, time_ns=time_ns, origin=origin)
+            history.latest[name] = Change(
+                changelog.seq, time_ns, origin, "set" if record is not None else "delete", name)
+        stats.applied += 1
+    return stats
+
+
+def _parse_record(obj: dict) -> Record:
+    birthday = obj.get("birthday")
+    record = Record(Name(obj["name"]), None if birthday is None else Birthday(birthday))
+    for phone in obj.get("phones") or ():
+        record.add_phone(Phone(PhoneValue(phone["phone"]), PhoneType(phone.get("type") or PhoneType.MOBILE)))
+    return record
@@ -0,0 +1,46 @@
+from argparse import ArgumentParser
+import json
+from pathlib import Path
+import socket
+import sys
+
+from assistant.server import default_socket_path
+
+
+def request(path: Path, argv: list[str], stdin: str = "") -> int:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        sock.sendall(json.dumps({"argv": argv, "stdin": stdin}).encode() + b"\n")
+        with sock.makefile("rb") as responses:
+            for line in responses:
+                message = json.loads(line)
+                if "stdout" in message:
+                    sys.stdout.write(message["stdout"])
+                    sys.stdout.flush()
+                elif "stderr" in message:
+                    sys.stderr.write(message["stderr"])
+                    sys.stderr.flush()
+                elif "exit" in message:
+                    return message["exit"]
+    return 1
+
+
+def main():
+    ap = ArgumentParser(
+        prog="assistant-client",
+        description="Run an assistant command on a running `assistant serve`")
+    ap.add_argument(
+        "--socket",
+        type=Path,
+        default=default_socket_path(),
+        help="Path to the server socket",
+    )
+    args, cmd_args = ap.parse_known_args()
+    # Piped input is forwarded, e.g. to answer confirmations or for `import -`
+    stdin = "" if sys.stdin is None or sys.stdin.isatty() else sys.stdin.read()
+    try:
+        code = request(args.socket, cmd_args, stdin)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"No assistant server is listening on {args.socket}", file=sys.stderr)
+        code = 1
+    sys.exit(code)
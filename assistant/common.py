@@ -1,9 +1,10 @@
 import argparse
 import cmd
-import readline
 import sys
 from typing import Literal
-from thefuzz import fuzz
+
+from assistant.metrics import Metrics
+from assistant.metrics import operation
 
 
 def error(msg):
@@ -27,6 +28,10 @@ class CmdArgumentError(ValueError):
 
 
 class CmdArgumentParser(argparse.ArgumentParser):
+    def parse_known_args(self, args=None, namespace=None):
+        with operation("argparse"):
+            return super().parse_known_args(args, namespace)
+
     def error(self, message):
         raise CmdArgumentError(message, self.format_help())
 
@@ -34,6 +39,8 @@ class CmdArgumentParser(argparse.ArgumentParser):
 class Cmd(cmd.Cmd):
     confirm_exit = True
     say_goodbye = True
+    # Latencies of commands run by this shell are recorded here if set
+    metrics: Metrics | None = None
 
     def _all_commands(self):
         return [name[3:] for name in dir(self) if name.startswith("do_")]
@@ -65,12 +72,46 @@ class Cmd(cmd.Cmd):
                 super().cmdloop(intro="")
                 break
             except KeyboardInterrupt:
+                import readline
+
                 print("^C")
                 if readline.get_line_buffer() == "" and confirm("Exit the application?", "n"):
                     break
 
+    def completeline(self, text, line, begidx, endidx):
+        """
+        Complete a line typed after a command that delegates to this shell
+        """
+        stripped = line.lstrip()
+        shift = len(line) - len(stripped)
+        begidx, endidx = begidx - shift, endidx - shift
+        if begidx > 0:
+            cmd, _, _ = self.parseline(stripped)
+            if not cmd:
+                return []
+            compfunc = getattr(self, "complete_" + cmd, self.completedefault)
+            return compfunc(text, stripped, begidx, endidx)
+        return self.completenames(text, stripped, begidx, endidx)
+
+    def command_name(self, line: str) -> str:
+        cmd, _, _ = self.parseline(line)
+        return cmd or line
+
     def onecmd(self, line):
+        if self.metrics is None:
+            return self._onecmd(line)
+        with self.metrics.command(self.command_name(line)):
+            return self._onecmd(line)
+
+    def begin(self, line: str):
+        """
+        Called before running a command line, errors are reported like
+        those of the command
+        """
+
+    def _onecmd(self, line):
         try:
+            self.begin(line)
             return super().onecmd(line)
         except CmdArgumentError as ex:
             error(str(ex))
@@ -79,6 +120,9 @@ class Cmd(cmd.Cmd):
             error(str(ex))
 
     def default(self, line):
+        # thefuzz takes a while to import and is only needed for typos
+        from thefuzz import fuzz
+
         candidates = []
         for candidate in self._all_commands():
             rat = fuzz.ratio(candidate, line)
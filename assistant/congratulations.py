@@ -0,0 +1,103 @@
+from collections.abc import Sequence
+from datetime import date
+from datetime import timedelta
+from functools import cache
+
+# Below this many birthdays the scalar code finishes before numpy is imported
+NUMPY_THRESHOLD = 40_000
+
+# Ordinal of 1970-01-01, the epoch of numpy's datetime64
+EPOCH = date(1970, 1, 1).toordinal()
+
+
+def congratulation_date(birthdate: date, year: int) -> date:
+    try:
+        birthday = date(year, birthdate.month, birthdate.day)
+    except ValueError:
+        # February 29 in a non-leap year
+        birthday = date(year, 2, 28)
+    weekday = birthday.weekday()
+    if 0 <= weekday < 5:
+        return birthday
+    return birthday + timedelta(days=(7 - weekday))
+
+
+@cache
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _vectorized(ordinals: Sequence[int]):
+    return _numpy() if len(ordinals) >= NUMPY_THRESHOLD else None
+
+
+def congratulation_ordinals(ordinals: Sequence[int], year: int) -> tuple[list[int], list[int]]:
+    """
+    Birthdays (as date ordinals) moved to `year` and the dates they are
+    congratulated on, with the same rules as `congratulation_date`
+    """
+    np = _vectorized(ordinals)
+    if np is None:
+        birthdays = [_in_year(date.fromordinal(o), year).toordinal() for o in ordinals]
+        return birthdays, [
+            congratulation_date(date.fromordinal(o), year).toordinal() for o in ordinals]
+    birthdays, congratulations = _congratulation_days(np, ordinals, year)
+    return (birthdays + EPOCH).tolist(), (congratulations + EPOCH).tolist()
+
+
+def birthday_stats(ordinals: Sequence[int], year: int) -> tuple[list[int], list[int]]:
+    """
+    Number of congratulations per month and of birthdays per weekday in `year`
+    """
+    np = _vectorized(ordinals)
+    if np is None:
+        months = [0] * 12
+        weekdays = [0] * 7
+        for o in ordinals:
+            birthdate = date.fromordinal(o)
+            months[congratulation_date(birthdate, year).month - 1] += 1
+            weekdays[_in_year(birthdate, year).weekday()] += 1
+        return months, weekdays
+    birthdays, congratulations = _congratulation_days(np, ordinals, year)
+    # congratulations of late December birthdays may fall on next January
+    months = _months(np, congratulations) % 12
+    return (np.bincount(months, minlength=12).tolist(),
+            np.bincount(_weekdays(birthdays), minlength=7).tolist())
+
+
+def _in_year(birthdate: date, year: int) -> date:
+    try:
+        return date(year, birthdate.month, birthdate.day)
+    except ValueError:
+        return date(year, 2, 28)
+
+
+def _congratulation_days(np, ordinals: Sequence[int], year: int):
+    # All arithmetic is on days since the epoch, as int64
+    days = np.asarray(ordinals, dtype=np.int64) - EPOCH
+    born = days.astype("datetime64[D]")
+    month_start = born.astype("datetime64[M]")
+    months = (month_start - born.astype("datetime64[Y]")).astype(np.int64)
+    day = (born - month_start).astype(np.int64)
+    target_month = np.datetime64(f"{year:04d}-01", "M") + months
+    month_length = ((target_month + np.timedelta64(1, "M")).astype("datetime64[D]")
+                    - target_month.astype("datetime64[D]")).astype(np.int64)
+    # February 29 becomes February 28 in a non-leap year
+    day = np.minimum(day, month_length - 1)
+    birthdays = target_month.astype("datetime64[D]").astype(np.int64) + day
+    weekdays = _weekdays(birthdays)
+    congratulations = birthdays + np.where(weekdays >= 5, 7 - weekdays, 0)
+    return birthdays, congratulations
+
+
+def _weekdays(days):
+    # 1970-01-01 was a Thursday
+    return (days + 3) % 7
+
+
+def _months(np, days):
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
@@ -0,0 +1,191 @@
+from collections.abc import Hashable
+from dataclasses import dataclass
+from dataclasses import field
+
+from assistant.model import Birthday
+from assistant.model import Phone
+from assistant.model import Record
+from assistant import repos
+
+# Name similarity (0-100) from which two records are taken for one person
+THRESHOLD = 85
+# Added to the similarity of records sharing a phone number
+SHARED_PHONE_BONUS = 15
+# Keys shared by more records than this say little about them being the
+# same person, and comparing all of them would take too long
+MAX_BLOCK_SIZE = 100
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def name_keys(name: str) -> set[str]:
+    """
+    Keys of the blocks a record is put in by its name:
+
+    - the words of the name in sorted order, ignoring case and spacing
+    - the last word with the first initial and the first word with the
+      last initial, for typos ("Jon Doe", "John Deo")
+
+    Records are also put in a block for each of their phone numbers.
+    """
+    words = name.casefold().split()
+    keys = {" ".join(sorted(words))}
+    if len(words) > 1:
+        keys.add(f"{words[-1]} {words[0][0]}")
+        keys.add(f"{words[0]} {words[-1][0]}")
+    return keys
+
+
+def _add(blocks: dict[Hashable, int | list[int]], key: Hashable, id: int):
+    # a block is a list only once a second record joins it, most keys are
+    # unique
+    block = blocks.setdefault(key, id)
+    if block == id:
+        return
+    if isinstance(block, int):
+        blocks[key] = [block, id]
+    else:
+        block.append(id)
+
+
+@dataclass
+class Merge:
+    keep: str
+    merged: list[str]
+    # phones and birthday the kept record gets from the merged ones
+    phones: list[Phone] = field(default_factory=list)
+    birthday: Birthday | None = None
+    # birthdays of merged records that differ from the kept one
+    dropped: list[str] = field(default_factory=list)
+
+    def describe(self) -> str:
+        lines = [f"{self.keep} <- {', '.join(repr(name) for name in self.merged)}"]
+        if self.phones:
+            lines.append(f"  add phones: {', '.join(str(p) for p in self.phones)}")
+        if self.birthday is not None:
+            lines.append(f"  set birthday: {self.birthday.birthday.strftime('%Y.%m.%d')}")
+        lines += [f"  drop {dropped}" for dropped in self.dropped]
+        return "\n".join(lines)
+
+
+@dataclass
+class Duplicates:
+    merges: list[Merge]
+    records: int
+    compared: int
+    # blocks larger than the limit, their records were not compared
+    skipped: int
+
+
+def find_duplicates(
+        addressbook: repos.Repo[Record],
+        threshold: int = THRESHOLD,
+        max_block: int = MAX_BLOCK_SIZE,
+) -> Duplicates:
+    """
+    Group records that likely belong to one person
+
+    Records are put in blocks by name keys and phone numbers in one pass
+    over the book, and names are scored with thefuzz only within the
+    blocks, so the work grows with the number of records rather than the
+    number of pairs.
+    """
+    from thefuzz import fuzz
+
+    names: list[str] = []
+    name_blocks: dict[Hashable, int | list[int]] = {}
+    phone_blocks: dict[Hashable, int | list[int]] = {}
+    for name, record in addressbook.items():
+        id = len(names)
+        name = str(name)
+        names.append(name)
+        for key in name_keys(name):
+            _add(name_blocks, key, id)
+        for key in record.phone_keys():
+            _add(phone_blocks, key, id)
+
+    # candidate pairs and whether they share a phone number
+    pairs: dict[tuple[int, int], bool] = {}
+    skipped = 0
+    for blocks, shared_phone in ((name_blocks, False), (phone_blocks, True)):
+        for block in blocks.values():
+            if isinstance(block, int):
+                continue
+            if len(block) > max_block:
+                skipped += 1
+                continue
+            for i, first in enumerate(block):
+                for second in block[i + 1:]:
+                    pair = (first, second) if first < second else (second, first)
+                    pairs[pair] = pairs.get(pair, False) or shared_phone
+        blocks.clear()
+
+    parent = list(range(len(names)))
+
+    def root(id: int) -> int:
+        while parent[id] != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    for (first, second), shared_phone in pairs.items():
+        score = fuzz.token_sort_ratio(normalize(names[first]), normalize(names[second]))
+        if score + (SHARED_PHONE_BONUS if shared_phone else 0) >= threshold:
+            parent[root(first)] = root(second)
+
+    groups: dict[int, list[str]] = {}
+    for id in {id for pair in pairs for id in pair}:
+        groups.setdefault(root(id), []).append(names[id])
+    merges = []
+    for group in groups.values():
+        if len(group) > 1:
+            merge = plan_merge(addressbook, sorted(group))
+            if merge is not None:
+                merges.append(merge)
+    merges.sort(key=lambda merge: merge.keep)
+    return Duplicates(merges, len(names), len(pairs), skipped)
+
+
+def plan_merge(addressbook: repos.Repo[Record], names: list[str]) -> Merge | None:
+    records = [(name, addressbook.get(name)) for name in names]
+    records = [(name, record) for name, record in records if record is not None]
+    if len(records) < 2:
+        return None
+    # keep a record with a tidy name and the most data
+    keep, kept = max(records, key=lambda item: (
+        item[0] == " ".join(item[0].split()),
+        len(item[1].phones) + (item[1].birthday is not None),
+    ))
+    merge = Merge(keep, [name for name, _ in records if name != keep])
+    phones = {str(p.phone) for p in kept.phones}
+    birthday = kept.birthday
+    for name, record in records:
+        if name == keep:
+            continue
+        for phone in record.phones:
+            if str(phone.phone) not in phones:
+                phones.add(str(phone.phone))
+                merge.phones.append(phone)
+        if record.birthday is None:
+            continue
+        if birthday is None:
+            birthday = merge.birthday = record.birthday
+        elif record.birthday.birthday != birthday.birthday:
+            merge.dropped.append(
+                f"birthday {record.birthday.birthday.strftime('%Y.%m.%d')} of {name!r}")
+    return merge
+
+
+def apply_merge(addressbook: repos.Repo[Record], merge: Merge):
+    record = addressbook.get(merge.keep)
+    if record is None:
+        return
+    for phone in merge.phones:
+        record.add_phone(phone)
+    if merge.birthday is not None:
+        record.set_birthday(merge.birthday)
+    addressbook.set(merge.keep, record)
+    for name in merge.merged:
+        addressbook.delete(name)
@@ -0,0 +1,218 @@
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+from collections import Counter
+from collections.abc import Hashable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from typing import Protocol
+
+from assistant.model import Record
+
+
+class SecondaryIndex(Protocol):
+    name: str
+
+    def add(self, id: str, record: Record):
+        ...
+
+    def discard(self, id: str):
+        ...
+
+    def clear(self):
+        ...
+
+    def rebuild(self, items: Iterable[tuple[str, Record]]):
+        ...
+
+
+class Index[K: Hashable]:
+    """
+    Secondary index mapping keys derived from a record to record ids
+
+    Keys are also kept in a sorted list, so range lookups are a bisect
+    away. Ids are remembered together with the keys they were indexed
+    under, so a record can be re-indexed even if it was mutated in place.
+    That mapping isn't pickled: it is derived from the postings by the
+    first update, so loading an index only for lookups is cheaper.
+    """
+    name: str
+
+    def __init__(self):
+        self._ids: dict[K, set[str]] = {}
+        self._keys: dict[str, tuple[K, ...]] | None = {}
+        self._sorted: list[K] = []
+
+    def __getstate__(self):
+        return {**self.__dict__, "_keys": None}
+
+    def _keys_by_id(self) -> dict[str, tuple[K, ...]]:
+        if self._keys is None:
+            keys: dict[str, list[K]] = {}
+            for key, ids in self._ids.items():
+                for id in ids:
+                    keys.setdefault(id, []).append(key)
+            self._keys = {id: tuple(id_keys) for id, id_keys in keys.items()}
+        return self._keys
+
+    def keys(self, record: Record) -> Iterable[K]:
+        raise NotImplementedError
+
+    def add(self, id: str, record: Record):
+        id = str(id)
+        self.discard(id)
+        keys = tuple(set(self.keys(record)))
+        if not keys:
+            return
+        self._remember(id, keys)
+        for key in keys:
+            ids = self._ids.get(key)
+            if ids is None:
+                ids = self._ids[key] = set()
+                insort(self._sorted, key)
+            ids.add(id)
+
+    def discard(self, id: str):
+        id = str(id)
+        for key in self._forget(id):
+            ids = self._ids.get(key)
+            if ids is None or id not in ids:
+                continue
+            ids.discard(id)
+            if not ids:
+                del self._ids[key]
+                del self._sorted[bisect_left(self._sorted, key)]
+
+    def _remember(self, id: str, keys: tuple[K, ...]):
+        self._keys_by_id()[id] = keys
+
+    def _forget(self, id: str) -> Iterable[K]:
+        return self._keys_by_id().pop(id, ())
+
+    def clear(self):
+        self._ids.clear()
+        self._keys = {}
+        self._sorted.clear()
+
+    def rebuild(self, items: Iterable[tuple[str, Record]]):
+        self.clear()
+        for id, record in items:
+            id = str(id)
+            keys = tuple(set(self.keys(record)))
+            if not keys:
+                continue
+            self._remember(id, keys)
+            for key in keys:
+                self._ids.setdefault(key, set()).add(id)
+        self._sorted = sorted(self._ids)
+
+    def get(self, key: K) -> set[str]:
+        return self._ids.get(key, set())
+
+    def range(self, lo: K, hi: K) -> Iterator[str]:
+        """
+        Yield ids indexed under keys in the [lo, hi] range, in key order
+        """
+        start = bisect_left(self._sorted, lo)
+        stop = bisect_right(self._sorted, hi)
+        for key in self._sorted[start:stop]:
+            yield from sorted(self._ids[key])
+
+
+class BirthdayIndex(Index[tuple[int, int]]):
+    name = "birthday"
+
+    def keys(self, record: Record):
+        if record.birthday is None:
+            return ()
+        return ((record.birthday.birthday.month, record.birthday.birthday.day),)
+
+
+class PrefixIndex(Index[str]):
+    def prefix(self, prefix: str) -> Iterator[str]:
+        """
+        Yield ids indexed under keys starting with the prefix, in key order
+        """
+        return self.range(prefix, prefix + "\U0010ffff")
+
+
+class PhoneIndex(PrefixIndex):
+    name = "phone"
+
+    def keys(self, record: Record):
+        return (str(p.phone) for p in record.phones)
+
+
+def trigrams(name: str) -> set[str]:
+    normalized = " ".join(name.lower().split())
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex(Index[str]):
+    name = "trigram"
+    # Trigrams shared by that many names say little about the query, they
+    # are only counted if nothing more selective matched.
+    max_postings = 10000
+
+    def keys(self, record: Record):
+        return trigrams(str(record.name))
+
+    def _remember(self, id: str, keys: tuple[str, ...]):
+        # keys are derived from the id, no need to keep them
+        pass
+
+    def _forget(self, id: str) -> Iterable[str]:
+        return trigrams(id)
+
+    def similar(self, query: str, limit: int) -> list[str]:
+        """
+        Return up to `limit` ids sharing the most trigrams with the query
+        """
+        postings = sorted((self._ids[g] for g in trigrams(query) if g in self._ids), key=len)
+        counts = Counter()
+        for ids in postings:
+            if len(ids) > self.max_postings and counts:
+                break
+            counts.update(ids)
+        return [id for id, _ in counts.most_common(limit)]
+
+
+class NameIndex:
+    """
+    Sorted array of record names, for prefix lookups and ordered iteration
+    """
+    name = "name"
+
+    def __init__(self):
+        self._names: list[str] = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def add(self, id: str, record: Record):
+        id = str(id)
+        pos = bisect_left(self._names, id)
+        if pos == len(self._names) or self._names[pos] != id:
+            self._names.insert(pos, id)
+
+    def discard(self, id: str):
+        id = str(id)
+        pos = bisect_left(self._names, id)
+        if pos < len(self._names) and self._names[pos] == id:
+            del self._names[pos]
+
+    def clear(self):
+        self._names.clear()
+
+    def rebuild(self, items: Iterable[tuple[str, Record]]):
+        self._names = sorted(str(id) for id, _ in items)
+
+    def prefix(self, prefix: str) -> Iterator[str]:
+        pos = bisect_left(self._names, prefix)
+        while pos < len(self._names) and self._names[pos].startswith(prefix):
+            yield self._names[pos]
+            pos += 1
@@ -0,0 +1,139 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
+from enum import StrEnum
+import json
+from typing import IO
+
+from assistant.indexes import BirthdayIndex
+from assistant.indexes import NameIndex
+from assistant.model import Record
+from assistant import repos
+from assistant.transfer import json_record
+
+# Lines written to the output at once
+CHUNK_SIZE = 8192
+NAME_WIDTH = 30
+
+
+class ListFormat(StrEnum):
+    NAMES = "names"
+    TABLE = "table"
+    TSV = "tsv"
+    JSONL = "jsonl"
+
+
+class SortKey(StrEnum):
+    NAME = "name"
+    BIRTHDAY = "birthday"
+
+
+def list_records(
+        addressbook: repos.Repo[Record],
+        sort: SortKey | None,
+        prefix: str,
+        with_records: bool = True,
+) -> Iterator[tuple[str, Record | None]]:
+    """
+    Yield (name, record) pairs in the requested order
+
+    Sorted listings walk an ordered index when the repo has one. Records
+    are fetched lazily, `record` is None when listing by name without
+    `with_records`.
+    """
+    match sort:
+        case None:
+            return ((str(name), record) for name, record in addressbook.items()
+                    if str(name).startswith(prefix))
+        case SortKey.NAME:
+            return ((name, addressbook.get(name) if with_records else None)
+                    for name in _names(addressbook, prefix))
+        case SortKey.BIRTHDAY:
+            return _by_birthday(addressbook, prefix)
+
+
+def _names(addressbook: repos.Repo[Record], prefix: str) -> Iterable[str]:
+    index = repos.find_index(addressbook, NameIndex.name)
+    if index is not None:
+        return index.prefix(prefix)
+    return repos.scan(addressbook, _record_names, prefix)
+
+
+def _record_names(addressbook: repos.Repo[Record], prefix: str) -> list[str]:
+    return sorted(str(name) for name, _ in addressbook.items() if str(name).startswith(prefix))
+
+
+def _by_birthday(addressbook: repos.Repo[Record], prefix: str) -> Iterator[tuple[str, Record]]:
+    index = repos.find_index(addressbook, BirthdayIndex.name)
+    if index is None:
+        yield from repos.scan(addressbook, _sorted_by_birthday, prefix, key=_birthday_key)
+        return
+    listed = set()
+    for name in index.range((1, 1), (12, 31)):
+        if name.startswith(prefix):
+            record = addressbook.get(name)
+            if record is not None:
+                listed.add(name)
+                yield name, record
+    # records without a birthday go last, in name order
+    for name in _names(addressbook, prefix):
+        if name in listed:
+            continue
+        record = addressbook.get(name)
+        if record is not None and record.birthday is None:
+            yield name, record
+
+
+def _birthday_key(item: tuple[str, Record]):
+    name, record = item
+    if record.birthday is None:
+        return (1, 0, 0, name)
+    birthday = record.birthday.birthday
+    return (0, birthday.month, birthday.day, name)
+
+
+def _sorted_by_birthday(addressbook: repos.Repo[Record], prefix: str) -> list[tuple[str, Record]]:
+    return sorted(
+        ((str(name), record) for name, record in addressbook.items()
+         if str(name).startswith(prefix)),
+        key=_birthday_key,
+    )
+
+
+def format_lines(records: Iterable[tuple[str, Record | None]], format: ListFormat) -> Iterator[str]:
+    if format == ListFormat.TABLE:
+        yield f"{'Name':<{NAME_WIDTH}} {'Birthday':<10} Phones"
+    elif format == ListFormat.TSV:
+        yield "name\tbirthday\tphones"
+    for name, record in records:
+        if format == ListFormat.NAMES:
+            yield name
+            continue
+        if record is None:
+            continue
+        birthday = "" if record.birthday is None else record.birthday.birthday.strftime("%Y.%m.%d")
+        match format:
+            case ListFormat.TABLE:
+                phones = "; ".join(p.phone + " (" + p.type + ")" for p in record.phones)
+                yield f"{name:<{NAME_WIDTH}} {birthday:<10} {phones}"
+            case ListFormat.TSV:
+                # concatenation, formatting the enum is several times slower
+                phones = ",".join(p.phone + ":" + p.type for p in record.phones)
+                yield f"{name}\t{birthday}\t{phones}"
+            case ListFormat.JSONL:
+                yield json.dumps(json_record(name, record))
+
+
+def write_lines(lines: Iterable[str], dst: IO[str], chunk_size: int = CHUNK_SIZE):
+    """
+    Write lines in large chunks instead of one write per line
+    """
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            chunk.append("")
+            dst.write("\n".join(chunk))
+            chunk.clear()
+    if chunk:
+        chunk.append("")
+        dst.write("\n".join(chunk))
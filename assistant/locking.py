@@ -0,0 +1,91 @@
+import fcntl
+import os
+from pathlib import Path
+import time
+
+
+class LockTimeoutError(ValueError):
+    ...
+
+
+class FileLock:
+    """
+    Advisory reader/writer lock on a lock file next to the data
+
+    The lock file also holds a generation number that writers bump when
+    they are done, so a process can tell whether the data changed since it
+    last looked at it.
+    """
+
+    def __init__(self, path: Path, timeout: float = 10.0):
+        self.path = path
+        self.timeout = timeout
+        self.exclusive = False
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, exclusive: bool, timeout: float | None = None):
+        """
+        Take a shared or exclusive lock, waiting at most `timeout` seconds
+        (the lock's own timeout by default)
+
+        Converting a shared lock to an exclusive one is not atomic, another
+        writer may get in between.
+        """
+        if self.held and (self.exclusive or not exclusive):
+            return
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.release()
+                    raise LockTimeoutError(
+                        f"Timed out after {timeout}s waiting for {self.path}, "
+                        "another assistant is using the addressbook")
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.1)
+        self.exclusive = exclusive
+
+    def release(self):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        self.exclusive = False
+        os.close(fd)  # closing the only descriptor drops the lock
+
+    def generation(self) -> int:
+        """
+        Generation of the data, read without locking if the lock isn't held
+        """
+        if self._fd is not None:
+            data = os.pread(self._fd, 8, 0)
+        else:
+            try:
+                fd = os.open(self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                return 0
+            try:
+                data = os.pread(fd, 8, 0)
+            finally:
+                os.close(fd)
+        return int.from_bytes(data, "little") if len(data) == 8 else 0
+
+    def bump(self) -> int:
+        """
+        Record a change of the data, the exclusive lock must be held
+        """
+        generation = self.generation() + 1
+        os.pwrite(self._fd, generation.to_bytes(8, "little"), 0)
+        return generation
@@ -0,0 +1,232 @@
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextlib import redirect_stdout
+import io
+import json
+from pathlib import Path
+import sys
+import time
+
+# Operations timed through `operation` are recorded here, if anywhere
+_active: "Metrics | None" = None
+
+
+class Histogram:
+    """
+    Latencies in power-of-two buckets of microseconds
+    """
+
+    def __init__(self):
+        self.buckets: Counter[int] = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.buckets[int(seconds * 1_000_000).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """
+        Upper bound of the bucket holding the p-th percentile, in seconds
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1_000_000, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets_us": {2 ** bucket: n for bucket, n in sorted(self.buckets.items())},
+        }
+
+
+class _TimedOutput(io.TextIOBase):
+    """
+    Passes writes through and records the time they take as "output"
+    """
+
+    def __init__(self, stdout, metrics: "Metrics"):
+        self._stdout = stdout
+        self._metrics = metrics
+
+    def writable(self):
+        return True
+
+    def write(self, s: str) -> int:
+        started = time.perf_counter()
+        try:
+            return self._stdout.write(s)
+        finally:
+            self._metrics.record("output", time.perf_counter() - started)
+
+    def flush(self):
+        self._stdout.flush()
+
+
+class Metrics:
+    def __init__(self):
+        self.commands: dict[str, Histogram] = {}
+        self.operations: dict[str, Histogram] = {}
+
+    def activate(self):
+        global _active
+        _active = self
+
+    def record(self, operation: str, seconds: float):
+        histogram = self.operations.get(operation)
+        if histogram is None:
+            histogram = self.operations[operation] = Histogram()
+        histogram.add(seconds)
+
+    @contextmanager
+    def command(self, name: str):
+        started = time.perf_counter()
+        try:
+            with redirect_stdout(_TimedOutput(sys.stdout, self)):
+                yield
+        finally:
+            histogram = self.commands.get(name)
+            if histogram is None:
+                histogram = self.commands[name] = Histogram()
+            histogram.add(time.perf_counter() - started)
+
+    def report(self) -> str:
+        lines = []
+        for title, histograms in (("Commands", self.commands), ("Operations", self.operations)):
+            if not histograms:
+                continue
+            lines.append(f"{title}:")
+            lines.append(f"  {'name':<20} {'count':>8} {'total ms':>10} {'mean ms':>9} "
+                         f"{'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+            for name, h in sorted(histograms.items()):
+                lines.append(
+                    f"  {name:<20} {h.count:>8} {h.total * 1000:>10.2f} "
+                    f"{h.total / h.count * 1000:>9.3f} {h.percentile(50) * 1000:>8.3f} "
+                    f"{h.percentile(95) * 1000:>8.3f} {h.max * 1000:>8.3f}")
+        return "\n".join(lines) or "Nothing has been recorded yet"
+
+    def timing_report(self) -> str:
+        """
+        Time spent in each phase of a run, in the order they happen
+        """
+        def total(name: str) -> float:
+            histogram = self.operations.get(name)
+            return 0.0 if histogram is None else histogram.total
+
+        rows = [
+            ("startup and imports (CPU)", total("startup.imports")),
+            ("arguments", total("startup.arguments")),
+            ("open", total("repo.open")),
+            ("shells", total("startup.shells")),
+        ]
+        rows += [(f"command {name}", h.total) for name, h in self.commands.items()]
+        rows.append(("close", total("repo.close")))
+        rows.append(("total", sum(seconds for _, seconds in rows)))
+        return "\n".join(["Timing:"] + [f"  {name:<30} {seconds * 1000:>10.2f} ms" for name, seconds in rows])
+
+    def to_dict(self) -> dict:
+        return {
+            "commands": {name: h.to_dict() for name, h in sorted(self.commands.items())},
+            "operations": {name: h.to_dict() for name, h in sorted(self.operations.items())},
+        }
+
+    def dump(self, path: Path):
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+
+
+@contextmanager
+def operation(name: str):
+    metrics = _active
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record(name, time.perf_counter() - started)
+
+
+class _TimedRepo:
+    """
+    Times opening and closing of a repo
+    """
+
+    def __init__(self, repo, metrics: Metrics):
+        self._repo = repo
+        self._metrics = metrics
+
+    def __enter__(self):
+        started = time.perf_counter()
+        try:
+            return self._repo.__enter__()
+        finally:
+            self._metrics.record("repo.open", time.perf_counter() - started)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        started = time.perf_counter()
+        try:
+            return self._repo.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._metrics.record("repo.close", time.perf_counter() - started)
+
+
+def timed_open(repo, metrics: Metrics) -> _TimedRepo:
+    return _TimedRepo(repo, metrics)
+
+
+def instrument(repo, metrics: Metrics):
+    """
+    Time every repo method as "repo.<method>"
+
+    The methods are wrapped on the instance rather than by a wrapper repo,
+    so optional capabilities such as indexes and scans stay visible to
+    callers.
+    """
+    for method in ("get", "set", "delete", "clear", "flush", "lock_for_write", "scan", "index",
+                   "reindex"):
+        if hasattr(repo, method):
+            setattr(repo, method, _timed(getattr(repo, method), f"repo.{method}", metrics))
+    items = repo.items
+    repo.items = lambda: _timed_items(items(), metrics)
+
+
+def _timed(func, name: str, metrics: Metrics):
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            metrics.record(name, time.perf_counter() - started)
+    return timed
+
+
+def _timed_items(items, metrics: Metrics) -> Iterator:
+    # Only the time spent producing items is counted, not consuming them
+    elapsed = 0.0
+    items = iter(items)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        metrics.record("repo.items", elapsed)
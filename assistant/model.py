@@ -1,8 +1,11 @@
-from collections import UserString
-from datetime import datetime
+from datetime import date
 from enum import StrEnum
 import re
 
+# Version of the pickled Record state. Version 0 is the pre-slots model,
+# pickled as plain instance dicts with UserString-based names and phones.
+SCHEMA_VERSION = 1
+
 
 class ModelError(ValueError):
     ...
@@ -20,18 +23,30 @@ class InvalidBirthdayError(ModelError):
     ...
 
 
-class Name(UserString):
+class Name(str):
+    __slots__ = ()
+
+    # Validation lives in __init__, unpickling only calls __new__
     def __init__(self, name: str):
         if not name.strip():
             raise InvalidNameError("Name cannot be empty")
-        super().__init__(name)
 
+    def __setstate__(self, state):
+        # schema 0 pickles carry UserString's {"data": ...} state
+        pass
+
+
+class PhoneValue(str):
+    __slots__ = ()
 
-class PhoneValue(UserString):
+    # Exactly 10 digits. Schema 0 checked only that the number started with
+    # 10 digits, books may still hold longer numbers, see PHONE_RAW.
     def __init__(self, phone: str):
-        if not re.match(r"\d{10}", phone):
+        if not re.fullmatch(r"\d{10}", phone):
             raise InvalidPhoneError("Invalid phone number format")
-        super().__init__(phone)
+
+    def __setstate__(self, state):
+        pass
 
 
 class PhoneType(StrEnum):
@@ -40,7 +55,18 @@ class PhoneType(StrEnum):
     WORK = "work"
 
 
+PHONE_TYPE_CODES = {PhoneType.HOME: 0, PhoneType.MOBILE: 1, PhoneType.WORK: 2}
+PHONE_TYPES = {code: type for type, code in PHONE_TYPE_CODES.items()}
+# Phones are packed as a type code followed by the number as a 5-byte
+# integer. Numbers that don't fit (only possible in schema 0 data, which
+# was validated less strictly) set this bit and are stored as a
+# length-prefixed string instead.
+PHONE_RAW = 0x80
+
+
 class Phone:
+    __slots__ = ("phone", "type")
+
     def __init__(self, phone: PhoneValue, type: PhoneType):
         self.phone = phone
         self.type = type
@@ -48,28 +74,156 @@ class Phone:
     def __str__(self):
         return f"{self.phone} ({self.type})"
 
+    def __getstate__(self):
+        return str(self.phone), str(self.type)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = state["phone"], state["type"]
+        phone, type = state
+        self.phone = str.__new__(PhoneValue, phone)
+        self.type = PhoneType(type)
+
+
+def pack_phones(phones: list[Phone]) -> bytes:
+    packed = bytearray()
+    for p in phones:
+        code = PHONE_TYPE_CODES[p.type]
+        if len(p.phone) == 10 and p.phone.isdigit() and p.phone.isascii():
+            packed.append(code)
+            packed += int(p.phone).to_bytes(5, "big")
+        else:
+            raw = str(p.phone).encode()
+            if len(raw) > 255:
+                raise InvalidPhoneError(f"Phone number is too long to store: {p.phone[:20]}...")
+            packed.append(code | PHONE_RAW)
+            packed.append(len(raw))
+            packed += raw
+    return bytes(packed)
+
+
+def unpack_phones(packed: bytes) -> list[Phone]:
+    phones = []
+    pos = 0
+    while pos < len(packed):
+        code = packed[pos]
+        if code & PHONE_RAW:
+            size = packed[pos + 1]
+            value = packed[pos + 2:pos + 2 + size].decode()
+            pos += 2 + size
+        else:
+            value = f"{int.from_bytes(packed[pos + 1:pos + 6], 'big'):010d}"
+            pos += 6
+        phones.append(Phone(str.__new__(PhoneValue, value), PHONE_TYPES[code & ~PHONE_RAW]))
+    return phones
+
 
 class Birthday:
+    __slots__ = ("ordinal",)
+
     def __init__(self, birthday: str):
+        match = re.fullmatch(r"(\d{4})\.(\d{1,2})\.(\d{1,2})", birthday)
         try:
-            v = datetime.strptime(birthday, "%Y.%m.%d")
+            if match is None:
+                raise ValueError(birthday)
+            v = date(int(match[1]), int(match[2]), int(match[3]))
         except ValueError:
             raise InvalidBirthdayError("Invalid date format. Use DD.MM.YYYY")
-        self.birthday = v
+        self.ordinal = v.toordinal()
+
+    @classmethod
+    def from_ordinal(cls, ordinal: int) -> "Birthday":
+        birthday = cls.__new__(cls)
+        birthday.ordinal = ordinal
+        return birthday
+
+    @property
+    def birthday(self) -> date:
+        return date.fromordinal(self.ordinal)
 
     def __str__(self):
         return f"{self.birthday}"
 
+    def __getstate__(self):
+        return self.ordinal
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = state["birthday"].toordinal()
+        self.ordinal = state
+
 
 class Record:
+    # Phones stay packed until first accessed and the birthday is kept as
+    # an ordinal, so loading a book doesn't build objects nobody looks at.
+    __slots__ = ("name", "_phones", "_birthday")
+
     def __init__(self, name: Name, birthday: Birthday | None = None):
         self.name = name
-        self.phones: list[Phone] = []
+        self.phones = []
         self.birthday = birthday
 
     def __str__(self):
         return f"Contact name: {self.name}, phones: {'; '.join(str(p) for p in self.phones)}"
 
+    @property
+    def phones(self) -> list[Phone]:
+        if isinstance(self._phones, bytes):
+            self._phones = unpack_phones(self._phones)
+        return self._phones
+
+    @phones.setter
+    def phones(self, phones: list[Phone]):
+        self._phones = phones
+
+    @property
+    def birthday(self) -> Birthday | None:
+        return Birthday.from_ordinal(self._birthday) if self._birthday else None
+
+    @birthday.setter
+    def birthday(self, birthday: Birthday | None):
+        self._birthday = 0 if birthday is None else birthday.ordinal
+
+    def __getstate__(self):
+        phones = self._phones
+        return (
+            SCHEMA_VERSION,
+            str(self.name),
+            phones if isinstance(phones, bytes) else pack_phones(phones),
+            self._birthday,
+        )
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.name = str.__new__(Name, state["name"])
+            self.phones = list(state["phones"])
+            self.birthday = state["birthday"]
+            return
+        version, name, self._phones, self._birthday = state
+        if version != SCHEMA_VERSION:
+            raise ModelError(f"Unsupported record schema version: {version}")
+        self.name = str.__new__(Name, name)
+
+    def phone_keys(self) -> list[bytes | str]:
+        """
+        Phone numbers in a form that compares equal for equal numbers, read
+        without unpacking the phones
+        """
+        packed = self._phones
+        if not isinstance(packed, bytes):
+            packed = pack_phones(packed)
+        keys = []
+        pos = 0
+        while pos < len(packed):
+            if packed[pos] & PHONE_RAW:
+                size = packed[pos + 1]
+                keys.append(packed[pos + 2:pos + 2 + size].decode())
+                pos += 2 + size
+            else:
+                keys.append(packed[pos + 1:pos + 6])
+                pos += 6
+        return keys
+
     def add_phone(self, phone: Phone):
         self.phones.append(phone)
 
@@ -1,59 +1,93 @@
-import shelve
+from functools import cached_property
+from itertools import islice
+import re
 import shlex
 
 from assistant.common import Cmd
 from assistant.common import CmdArgumentParser
 from assistant.common import confirm
 from assistant.common import error
+from assistant.indexes import PhoneIndex
 from assistant.model import Name
 from assistant.model import Phone
 from assistant.model import PhoneType
 from assistant.model import PhoneValue
 from assistant.model import Record
+from assistant.search import complete_name
+from assistant.search import did_you_mean
 from assistant import repos
 
 
 class Phones(Cmd):
     confirm_exit = False
     say_goodbye = False
-
-    _add_parser: CmdArgumentParser
-    _edit_parser: CmdArgumentParser
-    _show_parser: CmdArgumentParser
-    _delete_parser: CmdArgumentParser
+    # commands that change the addressbook
+    writes = frozenset({"add", "edit", "delete"})
 
     def __init__(self, addressbook: repos.Repo[Record], yes: bool):
         super().__init__()
         self._addressbook = addressbook
         self._yes = yes
 
-        self._add_parser = CmdArgumentParser("add", add_help=False)
-        self._add_parser.add_argument(
+    def begin(self, line):
+        cmd, _, _ = self.parseline(line)
+        repos.begin_command(self._addressbook, cmd in self.writes)
+
+    def postcmd(self, stop, line):
+        # let other processes at the addressbook between interactive commands
+        self._addressbook.flush()
+        return stop
+
+    @cached_property
+    def _add_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("add", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record")
-        self._add_parser.add_argument(
+        parser.add_argument(
             "phone", type=PhoneValue, help="Phone number of the record (XXXXXXXXXX)")
-        self._add_parser.add_argument("--type", type=PhoneType, default=PhoneType.MOBILE,
-                                      help="Type of the phone number (home, mobile, work)")
-
-        self._edit_parser = CmdArgumentParser("edit", add_help=False)
-        self._edit_parser.add_argument(
+        parser.add_argument("--type", type=PhoneType, default=PhoneType.MOBILE,
+                            help="Type of the phone number (home, mobile, work)")
+        return parser
+
+    @cached_property
+    def _edit_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("edit", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record")
-        self._edit_parser.add_argument(
+        parser.add_argument(
             "index", type=int, help="Index of the phone number to edit")
-        self._edit_parser.add_argument(
+        parser.add_argument(
             "--phone", type=PhoneValue, default=None, help="Phone number of the record (XXXXXXXXXX)")
-        self._edit_parser.add_argument(
+        parser.add_argument(
             "--type", type=PhoneType, default=None, help="Type of the phone number (home, mobile, work)")
+        return parser
 
-        self._show_parser = CmdArgumentParser("show", add_help=False)
-        self._show_parser.add_argument(
+    @cached_property
+    def _show_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("show", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record")
+        return parser
 
-        self._delete_parser = CmdArgumentParser("delete", add_help=False)
-        self._delete_parser.add_argument(
+    @cached_property
+    def _delete_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("delete", add_help=False)
+        parser.add_argument(
             "name", type=Name, help="Name of the record to delete a phone number from")
-        self._delete_parser.add_argument(
+        parser.add_argument(
             "index", type=int, help="Index of the phone number to delete")
+        return parser
+
+    @cached_property
+    def _find_parser(self) -> CmdArgumentParser:
+        parser = CmdArgumentParser("find", add_help=False)
+        parser.add_argument(
+            "number", help="Phone number to look up (XXXXXXXXXX), or its first digits with --prefix")
+        parser.add_argument(
+            "--prefix", action="store_true", help="Find all phone numbers starting with the given digits")
+        parser.add_argument(
+            "--limit", type=int, default=100, help="Maximum number of records to show for --prefix")
+        return parser
 
     def do_add(self, arg):
         """
@@ -77,7 +111,7 @@ class Phones(Cmd):
         args = self._edit_parser.parse_args(shlex.split(arg))
         record = self._addressbook.get(args.name)
         if record is None:
-            error(f"Record {args.name} does not exist")
+            error(f"Record {args.name} does not exist{did_you_mean(self._addressbook, args.name)}")
             return
         if not (0 <= args.index < len(record.phones)):
             error(f"Phone number index {args.index} out of range")
@@ -105,7 +139,7 @@ class Phones(Cmd):
         args = self._show_parser.parse_args(shlex.split(arg))
         record = self._addressbook.get(args.name)
         if record is None:
-            error(f"Record {args.name} does not exist")
+            error(f"Record {args.name} does not exist{did_you_mean(self._addressbook, args.name)}")
             return
         if not record.phones:
             print(f"No phone numbers found for {args.name}")
@@ -122,7 +156,7 @@ class Phones(Cmd):
         args = self._delete_parser.parse_args(shlex.split(arg))
         record = self._addressbook.get(args.name)
         if record is None:
-            error(f"Record {args.name} does not exist")
+            error(f"Record {args.name} does not exist{did_you_mean(self._addressbook, args.name)}")
             return
         if not self._yes and not confirm(f"Are you sure you want to delete a phone number from {args.name}?"):
             return
@@ -135,3 +169,52 @@ class Phones(Cmd):
 
     def help_delete(self):
         print(self._delete_parser.format_help())
+
+    def complete_add(self, text, line, begidx, endidx):
+        return complete_name(self._addressbook, text, line, endidx)
+
+    complete_edit = complete_show = complete_delete = complete_add
+
+    def do_find(self, arg):
+        """
+        Find records by phone number
+        """
+        args = self._find_parser.parse_args(shlex.split(arg))
+        if args.prefix:
+            if not re.fullmatch(r"\d+", args.number):
+                error("Phone number prefix must consist of digits")
+                return
+            names = islice(_unique(self._find_names(args.number, True)), args.limit)
+        else:
+            names = self._find_names(str(PhoneValue(args.number)), False)
+        found = False
+        for name in names:
+            record = self._addressbook.get(name)
+            if record is None:
+                continue
+            for phone in record.phones:
+                number = str(phone.phone)
+                if number == args.number or (args.prefix and number.startswith(args.number)):
+                    print(f"{number}: {name} ({phone.type})")
+                    found = True
+        if not found:
+            error(f"Phone number {args.number} not found")
+
+    def help_find(self):
+        print(self._find_parser.format_help())
+
+    def _find_names(self, number: str, prefix: bool):
+        index = repos.find_index(self._addressbook, PhoneIndex.name)
+        if index is not None:
+            return index.prefix(number) if prefix else sorted(index.get(number))
+        return (name for name, record in self._addressbook.items()
+                if any(str(p.phone).startswith(number) if prefix else str(p.phone) == number
+                       for p in record.phones))
+
+
+def _unique(names):
+    seen = set()
+    for name in names:
+        if name not in seen:
+            seen.add(name)
+            yield name
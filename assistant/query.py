@@ -0,0 +1,201 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+import re
+
+from assistant.indexes import BirthdayIndex
+from assistant.indexes import NameIndex
+from assistant.indexes import PhoneIndex
+from assistant.model import PhoneType
+from assistant.model import Record
+from assistant import repos
+
+
+class QueryError(ValueError):
+    ...
+
+
+class Predicate:
+    # Index the predicate can be answered from, and how early the planner
+    # should prefer it (lower is more selective)
+    index_name: str | None = None
+    selectivity = 0
+
+    def matches(self, record: Record) -> bool:
+        raise NotImplementedError
+
+    def candidates(self, index) -> Iterable[str]:
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class NamePrefix(Predicate):
+    prefix: str
+    index_name = NameIndex.name
+    selectivity = 1
+
+    def matches(self, record: Record) -> bool:
+        return str(record.name).startswith(self.prefix)
+
+    def candidates(self, index) -> Iterable[str]:
+        return index.prefix(self.prefix)
+
+    def __str__(self):
+        return f"name starts with {self.prefix!r}"
+
+
+@dataclass(frozen=True)
+class PhonePrefix(Predicate):
+    prefix: str
+    index_name = PhoneIndex.name
+    selectivity = 0
+
+    def matches(self, record: Record) -> bool:
+        return any(str(p.phone).startswith(self.prefix) for p in record.phones)
+
+    def candidates(self, index) -> Iterable[str]:
+        return index.prefix(self.prefix)
+
+    def __str__(self):
+        return f"phone starts with {self.prefix!r}"
+
+
+@dataclass(frozen=True)
+class HasPhoneType(Predicate):
+    type: PhoneType
+
+    def matches(self, record: Record) -> bool:
+        return any(p.type == self.type for p in record.phones)
+
+    def __str__(self):
+        return f"has a {self.type} phone"
+
+
+@dataclass(frozen=True)
+class BirthdayBetween(Predicate):
+    lo: tuple[int, int]
+    hi: tuple[int, int]
+    index_name = BirthdayIndex.name
+    selectivity = 2
+
+    def _ranges(self) -> list[tuple[tuple[int, int], tuple[int, int]]]:
+        if self.lo <= self.hi:
+            return [(self.lo, self.hi)]
+        # wraps around the end of the year
+        return [(self.lo, (12, 31)), ((1, 1), self.hi)]
+
+    def matches(self, record: Record) -> bool:
+        if record.birthday is None:
+            return False
+        birthday = record.birthday.birthday
+        return any(lo <= (birthday.month, birthday.day) <= hi for lo, hi in self._ranges())
+
+    def candidates(self, index) -> Iterable[str]:
+        for lo, hi in self._ranges():
+            yield from index.range(lo, hi)
+
+    def __str__(self):
+        return f"birthday between {self.lo[0]:02d}-{self.lo[1]:02d} and {self.hi[0]:02d}-{self.hi[1]:02d}"
+
+
+MONTH_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _month_day(text: str, end: bool) -> tuple[int, int]:
+    match = re.fullmatch(r"(\d{1,2})(?:-(\d{1,2}))?", text)
+    if match is None:
+        raise QueryError(f"Invalid birthday {text!r}, use MM or MM-DD")
+    month = int(match[1])
+    if not 1 <= month <= 12:
+        raise QueryError(f"Invalid month in {text!r}")
+    if match[2] is None:
+        return month, MONTH_DAYS[month - 1] if end else 1
+    day = int(match[2])
+    if not 1 <= day <= MONTH_DAYS[month - 1]:
+        raise QueryError(f"Invalid day in {text!r}")
+    return month, day
+
+
+def parse(terms: Iterable[str]) -> list[Predicate]:
+    """
+    Parse `field:value` terms, all of which have to match:
+
+    - name:PREFIX
+    - phone:PREFIX (digits)
+    - type:home|mobile|work
+    - birthday:MM[-DD] or birthday:MM[-DD]..MM[-DD]
+    """
+    predicates = []
+    for term in terms:
+        key, sep, value = term.partition(":")
+        if not sep or not value:
+            raise QueryError(f"Invalid term {term!r}, use field:value")
+        match key:
+            case "name":
+                predicates.append(NamePrefix(value))
+            case "phone":
+                if not value.isdigit():
+                    raise QueryError("Phone prefix must consist of digits")
+                predicates.append(PhonePrefix(value))
+            case "type":
+                try:
+                    predicates.append(HasPhoneType(PhoneType(value)))
+                except ValueError:
+                    raise QueryError(
+                        f"Invalid phone type {value!r}, use one of: {', '.join(PhoneType)}")
+            case "birthday":
+                lo, sep, hi = value.partition("..")
+                predicates.append(
+                    BirthdayBetween(_month_day(lo, False), _month_day(hi if sep else lo, True)))
+            case _:
+                raise QueryError(f"Unknown field {key!r}, use name, phone, type or birthday")
+    if not predicates:
+        raise QueryError("At least one term is required")
+    return predicates
+
+
+@dataclass
+class Plan:
+    predicates: list[Predicate]
+    # predicate whose index produces the candidates, None for a full scan
+    driver: Predicate | None = None
+    index: object = field(default=None, repr=False)
+
+    def explain(self) -> str:
+        if self.driver is None:
+            lines = ["scan all records"]
+        else:
+            lines = [f"look up {self.driver.index_name} index: {self.driver}"]
+        filters = [p for p in self.predicates if p is not self.driver]
+        lines += [f"filter: {p}" for p in filters]
+        return "\n".join(lines)
+
+
+def plan(repo: repos.Repo[Record], predicates: list[Predicate]) -> Plan:
+    """
+    Drive the query from the index of its most selective indexed predicate
+    """
+    for predicate in sorted(
+            (p for p in predicates if p.index_name is not None), key=lambda p: p.selectivity):
+        index = repos.find_index(repo, predicate.index_name)
+        if index is not None:
+            return Plan(predicates, predicate, index)
+    return Plan(predicates)
+
+
+def execute(repo: repos.Repo[Record], query: Plan) -> Iterator[tuple[str, Record]]:
+    if query.driver is None:
+        for name, record in repo.items():
+            if all(p.matches(record) for p in query.predicates):
+                yield str(name), record
+        return
+    seen = set()
+    for name in query.driver.candidates(query.index):
+        if name in seen:
+            continue
+        seen.add(name)
+        record = repo.get(name)
+        # the driving predicate is checked again, the index may be stale
+        if record is not None and all(p.matches(record) for p in query.predicates):
+            yield name, record
@@ -0,0 +1,364 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
+import mmap
+import os
+from pathlib import Path
+import struct
+
+from assistant.locking import FileLock
+from assistant.serialization import CODECS
+from assistant.serialization import Codec
+from assistant.serialization import CodecType
+from assistant.serialization import decode
+
+DATA_HEADER = struct.Struct("<4sQ")
+DATA_MAGIC = b"ABRD"
+INDEX_HEADER = struct.Struct("<4sQQQ")
+INDEX_MAGIC = b"ABRI"
+ENTRY_HEADER = struct.Struct("<II")
+OFFSET = struct.Struct("<Q")
+
+
+class RecordStoreError(ValueError):
+    ...
+
+
+class RecordStoreRepo[T]:
+    """
+    Memory-mapped store of length-prefixed records
+
+    The data file is a sequence of (key, value) entries, the offsets file is
+    an array of entry offsets sorted by key. Both are mmapped on open, so
+    `get` decodes a single record found by binary search, and `items`
+    streams records in key order. Entries appended past the indexed part
+    of the data file (the tail) are kept in memory and merged into a fresh
+    pair of files once the tail grows past `compact_limit` bytes. An entry
+    with an empty value marks its record as deleted.
+
+    Several processes can share the files, with the locking of PickleRepo:
+    opening takes a shared lock, writing an exclusive one held until `flush`
+    or close, and a writer first maps what others appended or compacted
+    since it last looked. Reads need no lock, compaction replaces the files
+    rather than changing the mapped ones.
+    """
+
+    def __init__(self, filepath: Path, compact_limit: int = 4 * 1024 * 1024,
+                 codec: Codec = CODECS[CodecType.PICKLE], lock_timeout: float = 10.0):
+        self.filepath = filepath
+        self.codec = codec
+        self.offsets_filepath = filepath.with_name(filepath.name + ".offsets")
+        self.compact_limit = compact_limit
+        self.lock = FileLock(filepath.with_name(filepath.name + ".lock"), lock_timeout)
+        self.generation = 0
+        self.foreign_changes = 0
+        self.written = False
+        self._file_id: int | None = None
+        self._data: mmap.mmap | None = None
+        self._offsets: mmap.mmap | None = None
+        self._count = 0
+        # end of the complete entries in the data file
+        self._end = 0
+        self._tail: dict[str, int] = {}
+        # records written since the data file was last mapped, None marks a
+        # deleted record
+        self._written: dict[str, T | None] = {}
+        self._appender = None
+
+    def __enter__(self):
+        self.lock.acquire(exclusive=not self.filepath.exists())
+        try:
+            if not self.filepath.exists():
+                self._write_files(())
+            self._open()
+            self.generation = self.lock.generation()
+        finally:
+            self.lock.release()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._appender is not None:
+                self._close_appender(sync=True)
+                self.generation = self.lock.bump()
+            if self.written and self._end - self._data_end > self.compact_limit:
+                self.lock_for_write()
+                self.compact()
+                self.generation = self.lock.bump()
+        finally:
+            self.written = False
+            self.lock.release()
+            self._close()
+
+    def _open(self):
+        with self.filepath.open("rb") as src:
+            self._data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            self._file_id = os.fstat(src.fileno()).st_ino
+        magic, generation = DATA_HEADER.unpack_from(self._data)
+        if magic != DATA_MAGIC:
+            raise RecordStoreError(f"{self.filepath} is not a record store")
+        try:
+            with self.offsets_filepath.open("rb") as src:
+                self._offsets = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            self._offsets = None
+        if self._offsets is not None:
+            magic, index_generation, data_end, count = INDEX_HEADER.unpack_from(self._offsets)
+            if magic != INDEX_MAGIC or index_generation != generation:
+                self._offsets.close()
+                self._offsets = None
+        if self._offsets is None:
+            # The offsets don't belong to this data file (e.g. interrupted
+            # compaction), treat the whole data file as the tail.
+            data_end, count = DATA_HEADER.size, 0
+        self._data_end = data_end
+        self._count = count
+        self._tail = {}
+        self._written = {}
+        self._scan_tail(data_end)
+
+    def _scan_tail(self, offset: int):
+        while offset < len(self._data):
+            end = self._entry_end(offset)
+            if end is None:
+                # drop the incomplete entry left by an interrupted write,
+                # nobody can be writing it while we hold the lock
+                self.lock.acquire(exclusive=True)
+                self._close()
+                with self.filepath.open("r+b") as dst:
+                    dst.truncate(offset)
+                return self._open()
+            self._tail[self._read_key(offset).decode()] = offset
+            offset = end
+        self._end = offset
+
+    def _catch_up(self):
+        generation = self.lock.generation()
+        if generation == self.generation and self.filepath.stat().st_size == self._end:
+            return
+        if _file_id(self.filepath) != self._file_id:
+            # compacted or cleared by another process
+            self._close()
+            self._open()
+        else:
+            # appended to by another process, or left with an interrupted
+            # write that isn't in the mapped part yet
+            self._remap()
+            self._scan_tail(self._end)
+        if generation != self.generation:
+            self.foreign_changes += 1
+        self.generation = generation
+
+    def lock_for_write(self):
+        """
+        Take the exclusive lock, held until `flush` or close, and pick up
+        changes of other processes
+        """
+        if self.lock.held and self.lock.exclusive:
+            return
+        self.lock.acquire(exclusive=True)
+        self._catch_up()
+
+    def _close_appender(self, sync: bool):
+        self._appender.flush()
+        if sync:
+            os.fsync(self._appender.fileno())
+        self._end = self._appender.tell()
+        self._appender.close()
+        self._appender = None
+        self._remap()
+
+    def _remap(self):
+        """
+        Map the data file again, including everything appended to it
+        """
+        # Not closed, records being read may still refer to the old map,
+        # it is unmapped once they are gone.
+        with self.filepath.open("rb") as src:
+            self._data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        # records written here are all in the data file by now
+        self._written = {}
+
+    def _close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._offsets is not None:
+            self._offsets.close()
+            self._offsets = None
+
+    def _entry_end(self, offset: int) -> int | None:
+        if offset + ENTRY_HEADER.size > len(self._data):
+            return None
+        key_len, value_len = ENTRY_HEADER.unpack_from(self._data, offset)
+        end = offset + ENTRY_HEADER.size + key_len + value_len
+        return end if end <= len(self._data) else None
+
+    def _read_entry(self, offset: int) -> tuple[bytes, memoryview, int]:
+        key_len, value_len = ENTRY_HEADER.unpack_from(self._data, offset)
+        start = offset + ENTRY_HEADER.size
+        view = memoryview(self._data)
+        key = bytes(view[start:start + key_len])
+        value = view[start + key_len:start + key_len + value_len]
+        return key, value, start + key_len + value_len
+
+    def _read_key(self, offset: int) -> bytes:
+        key_len, _ = ENTRY_HEADER.unpack_from(self._data, offset)
+        start = offset + ENTRY_HEADER.size
+        return self._data[start:start + key_len]
+
+    def _sorted_offset(self, position: int) -> int:
+        return OFFSET.unpack_from(self._offsets, INDEX_HEADER.size + position * OFFSET.size)[0]
+
+    def _find(self, key: bytes) -> int | None:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._read_key(self._sorted_offset(mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count:
+            offset = self._sorted_offset(lo)
+            if self._read_key(offset) == key:
+                return offset
+        return None
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        id = str(id)
+        if id in self._written:
+            value = self._written[id]
+            return default if value is None else value
+        offset = self._tail.get(id)
+        if offset is None:
+            offset = self._find(id.encode())
+        if offset is None:
+            return default
+        _, value, _ = self._read_entry(offset)
+        if not value:
+            return default
+        return decode(value)
+
+    def _append(self, id: str, encoded: bytes):
+        self.lock_for_write()
+        if self._appender is None:
+            self._appender = self.filepath.open("ab")
+        key = id.encode()
+        # read from there once the data file is mapped again
+        self._tail[id] = self._appender.tell()
+        self._appender.write(ENTRY_HEADER.pack(len(key), len(encoded)))
+        self._appender.write(key)
+        self._appender.write(encoded)
+        self.written = True
+
+    def set(self, id: str, value: T) -> None:
+        id = str(id)
+        self._append(id, self.codec.encode(value))
+        self._written[id] = value
+
+    def delete(self, id: str) -> None:
+        id = str(id)
+        if self.get(id) is None:
+            return
+        self._append(id, b"")
+        self._written[id] = None
+
+    def _sorted_keys(self) -> Iterator[tuple[str, int]]:
+        for position in range(self._count):
+            offset = self._sorted_offset(position)
+            yield self._read_key(offset).decode(), offset
+
+    def _encoded(self, id: str) -> bytes | memoryview:
+        if id in self._written:
+            value = self._written[id]
+            return b"" if value is None else self.codec.encode(value)
+        _, value, _ = self._read_entry(self._tail[id])
+        return value
+
+    def _encoded_items(self) -> Iterator[tuple[str, bytes | memoryview]]:
+        # deleted records are dropped
+        return ((key, value) for key, value in self._merged_items() if value)
+
+    def _merged_items(self) -> Iterator[tuple[str, bytes | memoryview]]:
+        overlay = sorted(self._tail.keys() | self._written.keys())
+        pending = 0
+        for key, offset in self._sorted_keys():
+            while pending < len(overlay) and overlay[pending] <= key:
+                yield overlay[pending], self._encoded(overlay[pending])
+                pending += 1
+            if key in self._tail or key in self._written:
+                continue
+            _, value, _ = self._read_entry(offset)
+            yield key, value
+        for key in overlay[pending:]:
+            yield key, self._encoded(key)
+
+    def items(self) -> Iterator[tuple[str, T]]:
+        for key, value in self._encoded_items():
+            yield key, decode(value)
+
+    def clear(self):
+        self.lock_for_write()
+        if self._appender is not None:
+            self._appender.close()
+            self._appender = None
+        self._close()
+        self._write_files(())
+        self._open()
+        self.generation = self.lock.bump()
+
+    def flush(self):
+        """
+        End the current write, or pick up changes of other processes
+        """
+        if self.lock.held:
+            try:
+                if self._appender is not None:
+                    self._close_appender(sync=False)
+                    self.generation = self.lock.bump()
+            finally:
+                self.lock.release()
+            return
+        self.lock.acquire(exclusive=False)
+        try:
+            self._catch_up()
+        finally:
+            self.lock.release()
+
+    def compact(self):
+        """
+        Merge the tail into a fresh pair of files, the exclusive lock must
+        be held
+        """
+        self._write_files(self._encoded_items())
+
+    def _write_files(self, entries: Iterable[tuple[str, bytes | memoryview]]):
+        generation = int.from_bytes(os.urandom(8), "little")
+        data_tmp = self.filepath.with_name(self.filepath.name + ".tmp")
+        offsets_tmp = self.offsets_filepath.with_name(self.offsets_filepath.name + ".tmp")
+        offsets = []
+        with data_tmp.open("wb") as dst:
+            dst.write(DATA_HEADER.pack(DATA_MAGIC, generation))
+            for id, encoded in entries:
+                offsets.append(dst.tell())
+                key = id.encode()
+                dst.write(ENTRY_HEADER.pack(len(key), len(encoded)))
+                dst.write(key)
+                dst.write(encoded)
+            data_end = dst.tell()
+            dst.flush()
+            os.fsync(dst.fileno())
+        with offsets_tmp.open("wb") as dst:
+            dst.write(INDEX_HEADER.pack(INDEX_MAGIC, generation, data_end, len(offsets)))
+            for offset in offsets:
+                dst.write(OFFSET.pack(offset))
+            dst.flush()
+            os.fsync(dst.fileno())
+        data_tmp.replace(self.filepath)
+        offsets_tmp.replace(self.offsets_filepath)
+
+
+def _file_id(path: Path) -> int | None:
+    try:
+        return path.stat().st_ino
+    except FileNotFoundError:
+        return None
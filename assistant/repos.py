@@ -1,10 +1,25 @@
+from collections import OrderedDict
+from collections.abc import Callable
 from collections.abc import Iterable
+import copy
+import heapq
+import json
+import os
 import pickle
+import sys
+import threading
 from enum import StrEnum
-import shelve
-from typing import IO, Protocol, cast
+from typing import IO, Any, Protocol, cast, runtime_checkable
 from pathlib import Path
 
+from assistant.indexes import SecondaryIndex
+from assistant.locking import FileLock
+from assistant.locking import LockTimeoutError
+from assistant.serialization import CODECS
+from assistant.serialization import Codec
+from assistant.serialization import CodecType
+from assistant.serialization import decode
+
 
 class Repo[T](Protocol):
     def get(self, id: str, default: T | None = None) -> T | None:
@@ -13,76 +28,1041 @@ class Repo[T](Protocol):
     def set(self, id: str, value: T) -> None:
         ...
 
+    def delete(self, id: str) -> None:
+        ...
+
     def items(self) -> Iterable[tuple[str, T]]:
         ...
 
     def clear(self):
         ...
 
+    def flush(self):
+        ...
+
+    def lock_for_write(self):
+        ...
+
+
+def begin_command(repo: Repo, writes: bool):
+    """
+    Get the repo ready for a command
+
+    A command that writes takes the write lock (held until `flush`) before
+    it reads anything, so it updates records as other processes left them
+    rather than a stale copy. Other commands just pick up what changed.
+    """
+    if writes:
+        repo.lock_for_write()
+    else:
+        repo.flush()
+
+
+@runtime_checkable
+class Indexed(Protocol):
+    def index(self, name: str) -> Any | None:
+        ...
+
+    def reindex(self):
+        ...
+
+
+def find_index(repo: Repo, name: str) -> Any | None:
+    if isinstance(repo, Indexed):
+        return repo.index(name)
+    return None
+
+
+@runtime_checkable
+class Scannable(Protocol):
+    def scan(self, func: Callable[..., list], *args) -> list[list]:
+        ...
+
+
+def scan(repo: Repo, func: Callable[..., list], *args, key=None) -> Iterable:
+    """
+    Run func(repo, *args), in parallel over partitions if the repo supports
+    it
+
+    func must be a picklable module-level function returning a list sorted
+    by `key`, partial results are merged in that order.
+    """
+    if isinstance(repo, Scannable):
+        return heapq.merge(*repo.scan(func, *args), key=key)
+    return func(repo, *args)
+
+
+@runtime_checkable
+class Versioned(Protocol):
+    """
+    Repo shared with other processes
+
+    `generation` is the version of the stored data last seen and
+    `foreign_changes` counts how many times changes made by other processes
+    were picked up, so layers keeping derived state know when to drop it.
+    """
+    generation: int | None
+    foreign_changes: int
+
+
+def find_versioned(repo: Repo) -> Versioned | None:
+    while not isinstance(repo, Versioned):
+        repo = getattr(repo, "repo", None)
+        if repo is None:
+            return None
+    return repo
+
+
+class CachePolicy(StrEnum):
+    WRITE_THROUGH = "write-through"
+    WRITE_BEHIND = "write-behind"
+
 
 class RepoType(StrEnum):
     PICKLE = "pickle"
     SHELVE = "shelve"
+    SQLITE = "sqlite"
+    MMAP = "mmap"
+    SHARDED = "sharded"
+    BLOCKS = "blocks"
 
 
 class ShelveRepo[T]:
-    db: shelve.Shelf
+    """
+    dbm database laid out like a shelve, with values encoded by `codec`
+
+    Values written by shelve itself are pickles and are still read.
 
-    def __init__(self, db_dir: Path, db_name: str):
+    The database is opened read-only under a shared lock by the first read,
+    and reopened for writing under an exclusive lock by the first change.
+    `flush` closes it and releases the lock, so other processes can get in
+    between commands.
+    """
+    db: Any
+
+    def __init__(self, db_dir: Path, db_name: str, codec: Codec = CODECS[CodecType.PICKLE],
+                 lock_timeout: float = 10.0):
         self.db_dir = db_dir
         self.db_name = db_name
+        self.codec = codec
+        self.lock = FileLock(db_dir / f"{db_name}.lock", lock_timeout)
+        self.db = None
+        self.writable = False
+        self.generation: int | None = None
+        self.foreign_changes = 0
 
     def __enter__(self):
-        self.db = shelve.open(str(self.db_dir / self.db_name))
+        # only shelve books pay for the import
+        import dbm
+
+        path = str(self.db_dir / self.db_name)
+        if dbm.whichdb(path) is None:
+            self.lock.acquire(exclusive=True)
+            try:
+                dbm.open(path, "c").close()
+            finally:
+                self.lock.release()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.db.close()
+        self._close()
+
+    def _open(self, writable: bool):
+        if self.db is not None and (self.writable or not writable):
+            return self.db
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+        self.lock.acquire(exclusive=writable)
+        generation = self.lock.generation()
+        if self.generation is not None and generation != self.generation:
+            self.foreign_changes += 1
+        self.generation = generation
+        import dbm
+
+        self.db = dbm.open(str(self.db_dir / self.db_name), "w" if writable else "r")
+        self.writable = writable
+        return self.db
+
+    def _close(self):
+        if self.db is None:
+            return
+        try:
+            self.db.close()
+            if self.writable:
+                self.generation = self.lock.bump()
+        finally:
+            self.db = None
+            self.writable = False
+            self.lock.release()
 
     def get(self, id: str, default: T | None = None) -> T | None:
-        ret = self.db.get(id, default)
-        if ret is None:
-            return None
-        return cast(T, ret)
+        data = self._open(writable=False).get(str(id).encode())
+        if data is None:
+            return default
+        return cast(T, decode(data))
 
     def set(self, id: str, value: T) -> None:
-        self.db[id] = value
+        self._open(writable=True)[str(id).encode()] = self.codec.encode(value)
+
+    def delete(self, id: str) -> None:
+        db = self._open(writable=True)
+        key = str(id).encode()
+        if key in db:
+            del db[key]
 
     def items(self):
-        return self.db.items()
+        db = self._open(writable=False)
+        for key in db.keys():
+            yield key.decode(), cast(T, decode(db[key]))
 
     def clear(self):
-        self.db.clear()
+        db = self._open(writable=True)
+        for key in list(db.keys()):
+            del db[key]
+
+    def flush(self):
+        self._close()
+
+    def lock_for_write(self):
+        self._open(writable=True)
 
 
 class PickleRepo[T]:
+    """
+    Pickle snapshot of the whole addressbook plus an append-only journal
+
+    Every set/delete/clear is appended to the journal next to the snapshot, and
+    the journal is replayed on top of the snapshot when the repo is opened.
+    The snapshot is only rewritten (atomically) when the journal grows past
+    `journal_limit` bytes. Replaying a journal is idempotent, so a crash
+    between replacing the snapshot and removing the journal is harmless.
+
+    Several processes can share the files. Loading takes a shared lock;
+    writing takes an exclusive one, held until `flush` or close. Taking it
+    replays what other processes wrote since this one last looked, so
+    callers that read records to update them call `lock_for_write` first.
+
+    With `checkpoint_interval`, a background thread also rewrites the
+    snapshot every that many seconds (or after `checkpoint_entries`
+    changes) while the repo is open, see `checkpoint`.
+    """
     data: dict[str, T]
+    journal: IO[bytes] | None
 
-    def __init__(self, filepath: Path):
+    def __init__(self, filepath: Path, journal_limit: int = 4 * 1024 * 1024,
+                 lock_timeout: float = 10.0, checkpoint_interval: float = 0,
+                 checkpoint_entries: int = 10000):
         self.filepath = filepath
+        self.journal_filepath = filepath.with_name(filepath.name + ".journal")
+        # journal being folded into the snapshot by a checkpoint
+        self.rotated_filepath = filepath.with_name(filepath.name + ".journal.1")
+        self.journal_limit = journal_limit
+        self.lock = FileLock(filepath.with_name(filepath.name + ".lock"), lock_timeout)
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_entries = checkpoint_entries
         self.data = {}
-
+        self.journal = None
+        self.generation = 0
+        self.foreign_changes = 0
+        self.written = False
+        self._snapshot: tuple | None = None
+        self._journal_id: int | None = None
+        self._position = 0
+        self._pending = 0
+        # the checkpoint thread and the repo's users take turns through this
+        self._mutex = threading.RLock()
+        self._checkpointer: threading.Thread | None = None
+        self._wake = threading.Event()
+        self._stopping = False
 
     def __enter__(self):
+        self.lock.acquire(exclusive=False)
+        try:
+            self._load()
+        finally:
+            self.lock.release()
+        if self.checkpoint_interval > 0:
+            self._stopping = False
+            self._checkpointer = threading.Thread(
+                target=self._run_checkpoints, name=f"checkpoint {self.filepath}", daemon=True)
+            self._checkpointer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._checkpointer is not None:
+            self._stopping = True
+            self._wake.set()
+            self._checkpointer.join()
+            self._checkpointer = None
+        if not self.written:
+            # locked for changes that never came
+            self.lock.release()
+            return
+        with self._mutex:
+            self._lock_for_write()
+            try:
+                self._close_journal(sync=True)
+                if self._position > self.journal_limit or not self.data:
+                    self.compact()
+                    self.generation = self.lock.bump()
+            finally:
+                self.lock.release()
+                self.written = False
+
+    def _load(self):
         try:
             with self.filepath.open("rb") as src:
                 self.data = pickle.load(src)
+                self._snapshot = _file_id(os.fstat(src.fileno()))
         except FileNotFoundError:
             self.data = {}
-        return self
+            self._snapshot = None
+        self._replay(self.rotated_filepath, 0)
+        self._position = self._replay(self.journal_filepath, 0)
+        self._journal_id = _journal_id(self.journal_filepath)
+        self.generation = self.lock.generation()
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        with self.filepath.open("wb") as dst:
-            pickle.dump(self.data, dst)
+    def _replay(self, path: Path, position: int) -> int:
+        """
+        Apply journal entries from `position` on and return where the
+        complete entries end
+        """
+        try:
+            src = path.open("rb")
+        except FileNotFoundError:
+            return 0
+        with src:
+            src.seek(position)
+            good = position
+            while True:
+                try:
+                    entry = pickle.load(src)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                self._apply(entry)
+                good = src.tell()
+        return good
+
+    def _catch_up(self):
+        generation = self.lock.generation()
+        if generation == self.generation:
+            return
+        try:
+            snapshot = _file_id(self.filepath.stat())
+        except FileNotFoundError:
+            snapshot = None
+        if snapshot != self._snapshot or _journal_id(self.journal_filepath) != self._journal_id:
+            # compacted or checkpointed by another process
+            self._load()
+        else:
+            self._position = self._replay(self.journal_filepath, self._position)
+        self.generation = generation
+        self.foreign_changes += 1
+
+    def lock_for_write(self):
+        """
+        Take the exclusive lock, held until `flush` or close, and pick up
+        changes of other processes
+        """
+        with self._mutex:
+            self._lock_for_write()
+
+    def _lock_for_write(self):
+        if self.lock.held and self.lock.exclusive:
+            return
+        self.lock.acquire(exclusive=True)
+        self._catch_up()
+
+    def _close_journal(self, sync: bool):
+        if self.journal is None:
+            return
+        self.journal.flush()
+        if sync:
+            os.fsync(self.journal.fileno())
+        self._position = self.journal.tell()
+        self.journal.close()
+        self.journal = None
+        self.generation = self.lock.bump()
+
+    def _apply(self, entry):
+        match entry:
+            case ("set", id, value):
+                self.data[id] = value
+            case ("delete", id):
+                self.data.pop(id, None)
+            case ("clear",):
+                self.data.clear()
+            case _:
+                raise ValueError(f"Unknown journal entry: {entry!r}")
+
+    def _append(self, entry):
+        self._lock_for_write()
+        if self.journal is None:
+            self.journal = self.journal_filepath.open("ab")
+            self._journal_id = os.fstat(self.journal.fileno()).st_ino
+            if self.journal.tell() != self._position:
+                # drop the incomplete entry left by an interrupted write
+                self.journal.truncate(self._position)
+        pickle.dump(entry, self.journal)
+        self.written = True
+        self._pending += 1
+        if self._pending >= self.checkpoint_entries:
+            self._wake.set()
+
+    def compact(self):
+        tmp = self.filepath.with_name(self.filepath.name + ".tmp")
+        self._snapshot = _write_snapshot(self.data, tmp)
+        tmp.replace(self.filepath)
+        _fsync_dir(self.filepath.parent)
+        self.journal_filepath.unlink(missing_ok=True)
+        self.rotated_filepath.unlink(missing_ok=True)
+        self._journal_id = None
+        self._position = 0
+        self._pending = 0
+
+    def checkpoint(self) -> bool:
+        """
+        Fold the journal into the snapshot without stopping other users
+
+        The journal is set aside and the records copied (by reference)
+        under the mutex, the copy is pickled outside of it, and the new
+        snapshot replaces the old one only if nobody compacted the book
+        meanwhile. Until then, the set-aside journal is replayed on open
+        like the current one. Returns whether the snapshot was replaced.
+        """
+        with self._mutex:
+            if not self._pending and not self.rotated_filepath.exists():
+                return False
+            data = self._rotate_journal()
+            if data is None:
+                return False
+            snapshot = self._snapshot
+        tmp = self.filepath.with_name(f"{self.filepath.name}.{threading.get_native_id()}.tmp")
+        try:
+            written = _write_snapshot(data, tmp)
+            with self._mutex:
+                return self._install_checkpoint(tmp, snapshot, written)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def _rotate_journal(self) -> dict[str, T] | None:
+        acquired = not self.lock.held
+        try:
+            # never wait for other processes here, the next round will retry
+            self.lock.acquire(exclusive=True, timeout=0)
+        except LockTimeoutError:
+            return None
+        try:
+            if self.lock.generation() != self.generation:
+                # other processes' changes are picked up by the next write
+                return None
+            self._close_journal(sync=True)
+            if self.journal_filepath.exists():
+                if self.rotated_filepath.exists():
+                    # left over by a checkpoint that couldn't finish
+                    with self.rotated_filepath.open("ab") as dst:
+                        dst.write(self.journal_filepath.read_bytes())
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                    self.journal_filepath.unlink()
+                else:
+                    self.journal_filepath.replace(self.rotated_filepath)
+            self._journal_id = None
+            self._position = 0
+            self._pending = 0
+            self.generation = self.lock.bump()
+            return dict(self.data)
+        finally:
+            if acquired:
+                self.lock.release()
+
+    def _install_checkpoint(self, tmp: Path, snapshot: tuple | None, written: tuple) -> bool:
+        acquired = not self.lock.held
+        try:
+            self.lock.acquire(exclusive=True, timeout=0)
+        except LockTimeoutError:
+            return False
+        try:
+            try:
+                current = _file_id(self.filepath.stat())
+            except FileNotFoundError:
+                current = None
+            if current != snapshot or not self.rotated_filepath.exists():
+                return False
+            tmp.replace(self.filepath)
+            _fsync_dir(self.filepath.parent)
+            self.rotated_filepath.unlink()
+            if self._snapshot == snapshot:
+                self._snapshot = written
+            self.generation = self.lock.bump()
+            return True
+        finally:
+            if acquired:
+                self.lock.release()
+
+    def _run_checkpoints(self):
+        while not self._stopping:
+            self._wake.wait(self.checkpoint_interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                self.checkpoint()
+            except OSError as ex:
+                print(f"Checkpoint of {self.filepath} failed: {ex}", file=sys.__stderr__)
 
     def get(self, id: str, default: T | None = None) -> T | None:
         return self.data.get(id, default)
 
     def set(self, id: str, value: T) -> None:
-        self.data[id] = value
+        with self._mutex:
+            self._append(("set", id, value))
+            self.data[id] = value
+
+    def delete(self, id: str) -> None:
+        with self._mutex:
+            if id not in self.data:
+                return
+            self._append(("delete", id))
+            del self.data[id]
 
     def items(self):
         return self.data.items()
 
     def clear(self):
-        self.data.clear()
+        with self._mutex:
+            self._append(("clear",))
+            self.data.clear()
+
+    def flush(self):
+        """
+        End the current write, or pick up changes of other processes
+        """
+        with self._mutex:
+            if self.lock.held:
+                try:
+                    self._close_journal(sync=False)
+                finally:
+                    self.lock.release()
+                return
+            self.lock.acquire(exclusive=False)
+            try:
+                self._catch_up()
+            finally:
+                self.lock.release()
+
+
+def _write_snapshot(data: dict, path: Path) -> tuple:
+    with path.open("wb") as dst:
+        pickle.dump(data, dst)
+        dst.flush()
+        os.fsync(dst.fileno())
+        return _file_id(os.fstat(dst.fileno()))
+
+
+def _file_id(st: os.stat_result) -> tuple:
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _journal_id(path: Path) -> int | None:
+    try:
+        return path.stat().st_ino
+    except FileNotFoundError:
+        return None
+
+
+def _json_line(obj) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode()
+
+
+def _create_journal(path: Path, replace: bool) -> str:
+    """
+    Write an index journal with a new id, atomically, and return the id
+    """
+    journal_id = os.urandom(8).hex()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(_json_line({"id": journal_id}))
+    try:
+        if replace:
+            tmp.replace(path)
+        else:
+            # whoever creates the journal first wins
+            os.link(tmp, path)
+    except FileExistsError:
+        pass
+    finally:
+        tmp.unlink(missing_ok=True)
+    return journal_id
+
+
+def _fsync_dir(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class IndexedRepo[T]:
+    """
+    Secondary indexes of a repo, kept in a directory next to it
+
+    Every index is pickled to a file of its own and only loaded when a
+    command looks something up in it. Changes don't rewrite those files:
+    the names of changed records are appended to a journal, and an index
+    replays the journal after its snapshot when it is loaded, re-reading
+    the records named there. Once the journal grows past `journal_limit`
+    bytes, the writer saves all indexes and starts a new journal.
+
+    Names are journaled under the repo's write lock, after a line with the
+    repo generation the writer started from. A process replays names only
+    up to the first such line not older than the data it has loaded, so it
+    never indexes records from a change it can't see yet; the rest is
+    replayed once it picks the change up.
+    """
+    FORMAT_VERSION = 2
+
+    def __init__(self, repo: Repo[T], indexes: Iterable[SecondaryIndex], directory: Path,
+                 journal_limit: int = 256 * 1024):
+        self.repo = repo
+        self.indexes = {idx.name: idx for idx in indexes}
+        self.directory = directory
+        self.journal_filepath = directory / "journal"
+        self.journal_limit = journal_limit
+        self.written = False
+        # journal offset up to which each loaded index is current
+        self._positions: dict[str, int] = {}
+        # journal size and repo generation at the last replay of an index
+        self._seen: dict[str, tuple] = {}
+        # indexes rebuilt from the records, saved on close
+        self._rebuilt: set[str] = set()
+        self._versioned = find_versioned(repo)
+        self._journal: int | None = None
+        self._journal_id = ""
+        self._header_end = 0
+        # offset of the generation line of this process's current write
+        self._marker: int | None = None
+
+    def __enter__(self):
+        self.repo.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._journal is not None and exc_type is None:
+                if not self._compact_if_long():
+                    self._save_rebuilt()
+        finally:
+            if self._journal is not None:
+                os.close(self._journal)
+                self._journal = None
+            self._marker = None
+            self.written = False
+            self.repo.__exit__(exc_type, exc_val, exc_tb)
+
+    def _generation(self) -> int | None:
+        return None if self._versioned is None else self._versioned.generation
+
+    def _open_journal(self):
+        """
+        Open the journal, or reopen it if another process started a new one
+        """
+        if self._journal is not None:
+            try:
+                current = self.journal_filepath.stat().st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(self._journal).st_ino:
+                return
+            os.close(self._journal)
+            self._journal = None
+        if self.directory.is_file():
+            # all indexes in one file, as written by older versions
+            self.directory.unlink(missing_ok=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not self.journal_filepath.exists():
+            _create_journal(self.journal_filepath, replace=False)
+        self._journal = os.open(self.journal_filepath, os.O_RDWR | os.O_APPEND)
+        header = os.pread(self._journal, 256, 0)
+        self._header_end = header.index(b"\n") + 1
+        journal_id = json.loads(header[:self._header_end])["id"]
+        if journal_id != self._journal_id:
+            # the loaded indexes are current relative to another journal
+            self._journal_id = journal_id
+            self._positions.clear()
+            self._seen.clear()
+            self._rebuilt.clear()
+            self._marker = None
+
+    def _snapshot_path(self, name: str) -> Path:
+        return self.directory / f"{name}.pickle"
+
+    def _load(self, name: str):
+        self._open_journal()
+        try:
+            with self._snapshot_path(name).open("rb") as src:
+                stored = pickle.load(src)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            stored = None
+        if (isinstance(stored, dict) and stored.get("version") == self.FORMAT_VERSION
+                and stored.get("journal") == self._journal_id
+                and isinstance(stored.get("index"), type(self.indexes[name]))):
+            self.indexes[name] = stored["index"]
+            self._positions[name] = stored["position"]
+        else:
+            self.indexes[name].rebuild(self.repo.items())
+            self._positions[name] = self._header_end
+            self._rebuilt.add(name)
+        self._replay([name])
+
+    def _replay(self, names: list[str], limited: bool = True):
+        """
+        Re-index the records named in the journal after the positions of
+        the indexes, up to the first write the loaded data doesn't include
+        yet unless not `limited`
+        """
+        size = os.fstat(self._journal).st_size
+        generation = self._generation()
+        if limited:
+            names = [name for name in names if self._seen.get(name) != (size, generation)]
+            for name in names:
+                self._seen[name] = size, generation
+        if not names:
+            return
+        start = min(self._positions[name] for name in names)
+        position = start
+        for line in os.pread(self._journal, size - start, start).splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # left incomplete by an interrupted write
+                entry = ()
+            if isinstance(entry, dict):
+                after = entry.get("after")
+                if (limited and generation is not None and after is not None
+                        and position != self._marker and after >= generation):
+                    break
+            elif isinstance(entry, str) or entry is None:
+                targets = [name for name in names if self._positions[name] <= position]
+                if entry is None:
+                    # the repo was cleared
+                    for name in targets:
+                        self.indexes[name].clear()
+                else:
+                    value = self.repo.get(entry)
+                    for name in targets:
+                        self.indexes[name].discard(entry)
+                        if value is not None:
+                            self.indexes[name].add(entry, value)
+            position += len(line)
+        for name in names:
+            self._positions[name] = max(self._positions[name], position)
+
+    def _log(self, id: str | None):
+        # under the lock the change is made with, before the change, so a
+        # crash in between at worst re-indexes an unchanged record
+        self.repo.lock_for_write()
+        if self._marker is None:
+            self._open_journal()
+        end = os.fstat(self._journal).st_size
+        if self._marker is None:
+            # a line left incomplete by an interrupted write is ended first
+            prefix = b"" if os.pread(self._journal, 1, end - 1) == b"\n" else b"\n"
+            os.write(self._journal, prefix + _json_line({"after": self._generation()}))
+            self._marker = end + len(prefix)
+        os.write(self._journal, _json_line(id))
+        # the loaded indexes are updated along with the change
+        for name, position in self._positions.items():
+            if position >= end:
+                self._positions[name] = os.fstat(self._journal).st_size
+        self.written = True
+
+    def _save(self, name: str, position: int):
+        path = self._snapshot_path(name)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as dst:
+            pickle.dump({
+                "version": self.FORMAT_VERSION,
+                "journal": self._journal_id,
+                "position": position,
+                "index": self.indexes[name],
+            }, dst)
+        tmp.replace(path)
+
+    def _save_rebuilt(self):
+        if not self._rebuilt:
+            return
+        self._open_journal()
+        for name in self._rebuilt:
+            self._save(name, self._positions[name])
+        self._rebuilt.clear()
+
+    def _restart_journal(self):
+        """
+        Save every index and start an empty journal, the repo's write lock
+        must be held and the indexes current
+        """
+        journal_id = _create_journal(self.journal_filepath, replace=True)
+        os.close(self._journal)
+        self._journal = None
+        self._open_journal()
+        assert self._journal_id == journal_id
+        for name in self.indexes:
+            self._save(name, self._header_end)
+            self._positions[name] = self._header_end
+        self._seen.clear()
+        self._rebuilt.clear()
+        self._marker = None
+
+    def _compact_if_long(self) -> bool:
+        """
+        Start a new journal if this process wrote past the limit, before
+        the write lock is released
+        """
+        if not self.written or os.fstat(self._journal).st_size <= self.journal_limit:
+            return False
+        self.repo.lock_for_write()
+        self._open_journal()
+        for name in self.indexes:
+            if name not in self._positions:
+                self._load(name)
+        # with the lock held, every journaled change is in the data
+        self._replay(list(self.indexes), limited=False)
+        self._restart_journal()
+        return True
+
+    def index(self, name: str) -> SecondaryIndex | None:
+        if name not in self.indexes:
+            return None
+        self._open_journal()
+        if name in self._positions:
+            self._replay([name])
+        else:
+            self._load(name)
+        return self.indexes[name]
+
+    def reindex(self):
+        self.repo.lock_for_write()
+        self._open_journal()
+        for idx in self.indexes.values():
+            idx.rebuild(self.repo.items())
+        self._restart_journal()
+
+    def scan(self, func: Callable[..., list], *args) -> list[list]:
+        if isinstance(self.repo, Scannable):
+            return self.repo.scan(func, *args)
+        return [func(self.repo, *args)]
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        return self.repo.get(id, default)
+
+    def set(self, id: str, value: T) -> None:
+        self._log(str(id))
+        self.repo.set(id, value)
+        for name in self._positions:
+            self.indexes[name].add(id, value)
+
+    def delete(self, id: str) -> None:
+        self._log(str(id))
+        self.repo.delete(id)
+        for name in self._positions:
+            self.indexes[name].discard(id)
+
+    def items(self):
+        return self.repo.items()
+
+    def clear(self):
+        self._log(None)
+        self.repo.clear()
+        for idx in self.indexes.values():
+            idx.clear()
+        self._restart_journal()
+
+    def flush(self):
+        if self._journal is not None:
+            self._compact_if_long()
+        self.written = False
+        self.repo.flush()
+        # the next change is made under a new lock
+        self._marker = None
+
+    def lock_for_write(self):
+        self.repo.lock_for_write()
+
+
+class CachedRepo[T]:
+    """
+    Bounded LRU cache of decoded records in front of another repo
+
+    With write-through every set goes straight to the repo, with
+    write-behind changed records are written when they are evicted, on
+    flush and when the repo is closed.
+    """
+
+    def __init__(self, repo: Repo[T], size: int, policy: CachePolicy = CachePolicy.WRITE_THROUGH):
+        self.repo = repo
+        self.size = size
+        self.policy = policy
+        self.cache: OrderedDict[str, T] = OrderedDict()
+        self.dirty: set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._versioned = find_versioned(repo)
+        self._foreign_seen = 0 if self._versioned is None else self._versioned.foreign_changes
+
+    def __enter__(self):
+        self.repo.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._write_dirty()
+        finally:
+            self.repo.__exit__(exc_type, exc_val, exc_tb)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self.cache),
+            "capacity": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "dirty": len(self.dirty),
+        }
+
+    def _put(self, id: str, value: T):
+        self.cache[id] = value
+        self.cache.move_to_end(id)
+        while len(self.cache) > self.size:
+            evicted, evicted_value = self.cache.popitem(last=False)
+            self.evictions += 1
+            if evicted in self.dirty:
+                self.dirty.discard(evicted)
+                self.repo.set(evicted, evicted_value)
+
+    def _write_dirty(self):
+        for id in self.dirty:
+            self.repo.set(id, self.cache[id])
+        self.dirty.clear()
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        id = str(id)
+        if id in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(id)
+            return self.cache[id]
+        self.misses += 1
+        value = self.repo.get(id)
+        if value is None:
+            return default
+        self._put(id, value)
+        return value
+
+    def set(self, id: str, value: T) -> None:
+        id = str(id)
+        if self.policy == CachePolicy.WRITE_THROUGH:
+            self.repo.set(id, value)
+        else:
+            self.dirty.add(id)
+        self._put(id, value)
+
+    def delete(self, id: str) -> None:
+        id = str(id)
+        self.cache.pop(id, None)
+        self.dirty.discard(id)
+        self.repo.delete(id)
+
+    def items(self):
+        self._write_dirty()
+        return self.repo.items()
+
+    def clear(self):
+        self.cache.clear()
+        self.dirty.clear()
+        self.repo.clear()
+
+    def flush(self):
+        self._write_dirty()
+        self.repo.flush()
+        self._drop_foreign()
+
+    def lock_for_write(self):
+        self.repo.lock_for_write()
+        self._drop_foreign()
+
+    def _drop_foreign(self):
+        if self._versioned is not None and self._versioned.foreign_changes != self._foreign_seen:
+            # records changed by other processes may be cached
+            self._foreign_seen = self._versioned.foreign_changes
+            self.cache.clear()
+
+
+class TransactionRepo[T]:
+    """
+    Buffers changes in memory until `commit`, `rollback` drops them
+
+    Records read from the underlying repo are copied, so changes made to
+    them in place don't leak into it before the commit.
+    """
+
+    def __init__(self, repo: Repo[T]):
+        self.repo = repo
+        # None marks a deleted record
+        self.changes: dict[str, T | None] = {}
+        self.cleared = False
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        id = str(id)
+        if id in self.changes:
+            value = self.changes[id]
+            return default if value is None else value
+        if self.cleared:
+            return default
+        value = self.repo.get(id)
+        return default if value is None else copy.deepcopy(value)
+
+    def set(self, id: str, value: T) -> None:
+        self.changes[str(id)] = value
+
+    def delete(self, id: str) -> None:
+        self.changes[str(id)] = None
+
+    def items(self):
+        if not self.cleared:
+            for id, value in self.repo.items():
+                if str(id) not in self.changes:
+                    yield id, value
+        for id, value in self.changes.items():
+            if value is not None:
+                yield id, value
+
+    def clear(self):
+        self.changes.clear()
+        self.cleared = True
+
+    def flush(self):
+        # nothing reaches the underlying repo before the commit
+        pass
+
+    def lock_for_write(self):
+        # held until the commit, so the records read stay current
+        self.repo.lock_for_write()
+
+    def commit(self):
+        if self.cleared:
+            self.repo.clear()
+        for id, value in self.changes.items():
+            if value is None:
+                self.repo.delete(id)
+            else:
+                self.repo.set(id, value)
+        self.repo.flush()
+        self.rollback()
+
+    def rollback(self):
+        self.changes = {}
+        self.cleared = False
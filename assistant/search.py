@@ -0,0 +1,70 @@
+from itertools import islice
+import shlex
+
+from assistant.indexes import NameIndex
+from assistant.indexes import TrigramIndex
+from assistant.model import Record
+from assistant import repos
+
+SUGGESTION_THRESHOLD = 60
+MAX_COMPLETIONS = 1000
+
+
+def search_names(
+        addressbook: repos.Repo[Record],
+        query: str,
+        limit: int,
+        candidates: int = 200,
+) -> list[tuple[int, str]]:
+    """
+    Return up to `limit` (score, name) pairs best matching the query
+
+    Names sharing trigrams with the query are taken from the trigram index
+    and re-ranked with `fuzz.ratio`; without the index every name is scored.
+    """
+    index = repos.find_index(addressbook, TrigramIndex.name)
+    if index is not None:
+        names = index.similar(query, candidates)
+    else:
+        names = (str(name) for name, _ in addressbook.items())
+    from thefuzz import fuzz
+
+    query = query.lower()
+    scored = [(fuzz.ratio(query, name.lower()), name) for name in names]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(score, name) for score, name in scored[:limit] if score > 0]
+
+
+def did_you_mean(addressbook: repos.Repo[Record], name: str) -> str:
+    found = search_names(addressbook, str(name), 1)
+    if found and found[0][0] >= SUGGESTION_THRESHOLD:
+        return f", did you mean {found[0][1]}?"
+    return ""
+
+
+def complete_name(addressbook: repos.Repo[Record], text: str, line: str, endidx: int) -> list[str]:
+    """
+    Complete a record name given as the first argument of a command
+    """
+    _, _, partial = line[:endidx].lstrip().partition(" ")
+    partial = partial.lstrip()
+    quote = partial[:1] if partial[:1] in {"'", '"'} else ""
+    if quote:
+        partial = partial[1:]
+        if quote in partial:
+            return []
+    elif any(c.isspace() for c in partial):
+        return []
+    index = repos.find_index(addressbook, NameIndex.name)
+    if index is not None:
+        names = index.prefix(partial)
+    else:
+        names = (str(name) for name, _ in addressbook.items() if str(name).startswith(partial))
+    completions = []
+    for name in islice(names, MAX_COMPLETIONS):
+        if not quote and any(c.isspace() for c in name):
+            # the whole partial name is replaced by the quoted one
+            completions.append(shlex.quote(name) if text == partial else name[len(partial) - len(text):])
+        else:
+            completions.append(name[len(partial) - len(text):])
+    return completions
@@ -0,0 +1,130 @@
+from datetime import date
+from enum import StrEnum
+import json
+import pickle
+import struct
+from typing import Any, Protocol
+
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+from assistant.model import SCHEMA_VERSION
+
+# Encoded values start with a byte telling the codec, so stores can hold a
+# mix of them and records are re-encoded one by one (e.g. by `migrate`).
+PICKLE_MAGIC = 0x80  # PROTO opcode, first byte of every pickle since protocol 2
+BINARY_MAGIC = 0xB1
+JSON_MAGIC = ord("{")
+
+# magic, birthday ordinal, length of the name, length of the packed phones
+BINARY_HEADER = struct.Struct("<BIHH")
+
+
+class CodecError(ValueError):
+    ...
+
+
+class CodecType(StrEnum):
+    PICKLE = "pickle"
+    BINARY = "binary"
+    JSON = "json"
+
+
+class Codec(Protocol):
+    def encode(self, value: Any) -> bytes:
+        ...
+
+    def decode(self, data: bytes | memoryview) -> Any:
+        ...
+
+
+class PickleCodec:
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes | memoryview) -> Any:
+        return pickle.loads(data)
+
+
+class BinaryCodec:
+    """
+    Records as a fixed header followed by the name and the phones packed
+    the same way as in pickled records
+    """
+
+    def encode(self, value: Record) -> bytes:
+        if not isinstance(value, Record):
+            raise CodecError(f"Cannot encode {type(value).__name__} in binary")
+        _, name, phones, birthday = value.__getstate__()
+        name = name.encode()
+        if len(name) > 0xFFFF or len(phones) > 0xFFFF:
+            raise CodecError(f"Record {value.name} is too large to encode in binary")
+        return BINARY_HEADER.pack(BINARY_MAGIC, birthday, len(name), len(phones)) + name + phones
+
+    def decode(self, data: bytes | memoryview) -> Record:
+        magic, birthday, name_len, phones_len = BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC:
+            raise CodecError(f"Not a binary record: {magic:#x}")
+        start = BINARY_HEADER.size
+        name = str(data[start:start + name_len], "utf-8")
+        start += name_len
+        record = Record.__new__(Record)
+        record.__setstate__(
+            (SCHEMA_VERSION, name, bytes(data[start:start + phones_len]), birthday))
+        return record
+
+
+class JsonCodec:
+    """
+    Records as JSON objects, readable when debugging a store
+    """
+
+    def encode(self, value: Record) -> bytes:
+        if not isinstance(value, Record):
+            raise CodecError(f"Cannot encode {type(value).__name__} in JSON")
+        return json.dumps({
+            "name": str(value.name),
+            "phones": [[str(p.phone), str(p.type)] for p in value.phones],
+            "birthday": None if value.birthday is None else value.birthday.birthday.isoformat(),
+        }, ensure_ascii=False).encode()
+
+    def decode(self, data: bytes | memoryview) -> Record:
+        # json has no buffer interface, this is the one codec that copies
+        obj = json.loads(bytes(data))
+        birthday = obj["birthday"]
+        record = Record.__new__(Record)
+        record.__setstate__((
+            SCHEMA_VERSION,
+            obj["name"],
+            b"",
+            0 if birthday is None else date.fromisoformat(birthday).toordinal(),
+        ))
+        record.phones = [Phone(str.__new__(PhoneValue, phone), PhoneType(type))
+                         for phone, type in obj["phones"]]
+        return record
+
+
+CODECS: dict[CodecType, Codec] = {
+    CodecType.PICKLE: PickleCodec(),
+    CodecType.BINARY: BinaryCodec(),
+    CodecType.JSON: JsonCodec(),
+}
+
+_BY_MAGIC: dict[int, Codec] = {
+    PICKLE_MAGIC: CODECS[CodecType.PICKLE],
+    BINARY_MAGIC: CODECS[CodecType.BINARY],
+    JSON_MAGIC: CODECS[CodecType.JSON],
+}
+
+
+def decode(data: bytes | memoryview) -> Any:
+    """
+    Decode a value encoded with any of the codecs
+    """
+    if not data:
+        raise CodecError("Empty value")
+    codec = _BY_MAGIC.get(data[0])
+    if codec is None:
+        raise CodecError(f"Unknown encoding: {data[0]:#x}")
+    return codec.decode(data)
@@ -0,0 +1,110 @@
+import asyncio
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import shlex
+import signal
+import sys
+import traceback
+
+from assistant.common import Cmd
+from assistant.common import error
+from assistant import repos
+
+DEFAULT_SOCKET = ".assistant.sock"
+
+
+def default_socket_path() -> Path:
+    return Path(os.environ.get("ASSISTANT_SOCKET", DEFAULT_SOCKET))
+
+
+class _StreamOutput(io.TextIOBase):
+    """
+    File-like object forwarding everything written to it to the client
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, stream: str):
+        self._writer = writer
+        self._stream = stream
+        self.written = False
+
+    def writable(self):
+        return True
+
+    def write(self, s: str) -> int:
+        if s:
+            self.written = True
+            _send(self._writer, {self._stream: s})
+        return len(s)
+
+
+def _send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode() + b"\n")
+
+
+def run_request(app: Cmd, addressbook: repos.Repo, request: dict, writer: asyncio.StreamWriter) -> int:
+    """
+    Run the command of a request and return its exit status
+
+    Commands report failures with `error`, so anything written to stderr
+    makes the status 1.
+    """
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(request.get("stdin", ""))
+    stderr = _StreamOutput(writer, "stderr")
+    try:
+        with redirect_stdout(_StreamOutput(writer, "stdout")), redirect_stderr(stderr):
+            try:
+                app.onecmd(shlex.join(request["argv"]))
+            except Exception:
+                error(traceback.format_exc())
+            finally:
+                try:
+                    addressbook.flush()
+                except Exception:
+                    error(traceback.format_exc())
+    finally:
+        sys.stdin = stdin
+    return 1 if stderr.written else 0
+
+
+async def _handle(app: Cmd, addressbook: repos.Repo, reader: asyncio.StreamReader,
+                  writer: asyncio.StreamWriter):
+    try:
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                if not isinstance(request.get("argv"), list):
+                    raise ValueError("argv must be a list")
+            except ValueError as ex:
+                _send(writer, {"stderr": f"Malformed request: {ex}\n"})
+                _send(writer, {"exit": 2})
+            else:
+                # Commands run one at a time on the loop thread, so clients
+                # never observe each other's partial changes.
+                _send(writer, {"exit": run_request(app, addressbook, request, writer)})
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(app: Cmd, addressbook: repos.Repo, path: Path):
+    path.unlink(missing_ok=True)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _handle(app, addressbook, reader, writer), path=str(path))
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: stopped.done() or stopped.set_result(None))
+    try:
+        async with server:
+            await stopped
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        path.unlink(missing_ok=True)
@@ -0,0 +1,166 @@
+from itertools import repeat
+import json
+import os
+from pathlib import Path
+import zlib
+
+from assistant.locking import FileLock
+from assistant.repos import PickleRepo
+
+MANIFEST = "manifest.json"
+LOCK = "book.lock"
+
+
+class ShardingError(ValueError):
+    ...
+
+
+def shard_of(id: str, count: int) -> int:
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(str(id).encode()) % count
+
+
+class ShardedRepo[T]:
+    """
+    Records partitioned by hash of the name across `count` pickle files
+
+    Shards are only loaded when a record in them is accessed. Scans run in
+    a process pool, one worker per shard, so a full scan of a large book
+    uses all cores instead of unpickling every shard in this process.
+
+    Every shard is locked like a PickleRepo. `lock_for_write` takes a lock
+    on the whole book as well, since the shards a command is going to
+    update aren't known up front. Its generation is bumped once the shards
+    are written, so the shards opened after reading it include every
+    change made before.
+    """
+
+    def __init__(self, directory: Path, count: int | None = None,
+                 journal_limit: int = 4 * 1024 * 1024, lock_timeout: float = 10.0):
+        self.directory = directory
+        self.journal_limit = journal_limit
+        self.lock_timeout = lock_timeout
+        self.lock = FileLock(directory / LOCK, lock_timeout)
+        self.shards: dict[int, PickleRepo[T]] = {}
+        self.generation: int | None = None
+        self.foreign_changes = 0
+        self.written = False
+        try:
+            stored = json.loads((directory / MANIFEST).read_text())["shards"]
+        except FileNotFoundError:
+            stored = None
+        if stored is not None and count is not None and stored != count:
+            raise ShardingError(
+                f"{directory} has {stored} shards, cannot open it with {count}")
+        self.created = stored is None
+        self.count = stored or count or os.cpu_count() or 1
+
+    def __enter__(self):
+        if self.created:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / MANIFEST).write_text(json.dumps({"shards": self.count}))
+            self.created = False
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._close_shards(exc_type, exc_val, exc_tb)
+            if self.written:
+                self.generation = self.lock.bump()
+        finally:
+            self.written = False
+            self.lock.release()
+
+    def _shard_repo(self, shard: int) -> PickleRepo[T]:
+        return _shard_repo(self.directory, shard, self.journal_limit, self.lock_timeout)
+
+    def _seen(self, generation: int):
+        if self.generation is not None and generation != self.generation:
+            self.foreign_changes += 1
+        self.generation = generation
+
+    def _open(self, shard: int) -> PickleRepo[T]:
+        repo = self.shards.get(shard)
+        if repo is None:
+            if not self.shards and not self.lock.held:
+                self._seen(self.lock.generation())
+            repo = self.shards[shard] = self._shard_repo(shard).__enter__()
+        return repo
+
+    def _shard(self, id: str) -> PickleRepo[T]:
+        return self._open(shard_of(id, self.count))
+
+    def _close_shards(self, exc_type=None, exc_val=None, exc_tb=None):
+        shards, self.shards = self.shards, {}
+        for repo in shards.values():
+            repo.__exit__(exc_type, exc_val, exc_tb)
+
+    def get(self, id: str, default: T | None = None) -> T | None:
+        return self._shard(id).get(id, default)
+
+    def set(self, id: str, value: T) -> None:
+        self.lock_for_write()
+        self._shard(id).set(id, value)
+        self.written = True
+
+    def delete(self, id: str) -> None:
+        self.lock_for_write()
+        self._shard(id).delete(id)
+        self.written = True
+
+    def items(self):
+        for shard in range(self.count):
+            yield from self._open(shard).items()
+
+    def clear(self):
+        self.lock_for_write()
+        self.scan(_clear)
+        self.written = True
+
+    def flush(self):
+        try:
+            for repo in self.shards.values():
+                repo.flush()
+            if self.written:
+                self.generation = self.lock.bump()
+        finally:
+            self.written = False
+            self.lock.release()
+
+    def lock_for_write(self):
+        if self.lock.held:
+            return
+        self.lock.acquire(exclusive=True)
+        # shards are loaded from scratch, the loaded ones catch up
+        for repo in self.shards.values():
+            repo.lock_for_write()
+        self._seen(self.lock.generation())
+
+    def scan(self, func, *args) -> list:
+        """
+        Run func(repo, *args) on every shard in a process pool and return
+        the results in shard order
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Workers read the shards from disk, so everything changed here
+        # has to be written first.
+        self._close_shards()
+        with ProcessPoolExecutor(max_workers=self.count) as pool:
+            return list(pool.map(
+                _scan_shard, repeat(self.directory), range(self.count), repeat(self.journal_limit),
+                repeat(self.lock_timeout), repeat(func), repeat(args)))
+
+
+def _shard_repo(directory: Path, shard: int, journal_limit: int, lock_timeout: float) -> PickleRepo:
+    return PickleRepo(directory / f"shard-{shard:03d}.pickle", journal_limit, lock_timeout)
+
+
+def _scan_shard(directory: Path, shard: int, journal_limit: int, lock_timeout: float, func, args):
+    # repos hold locks and threads, so workers open their own
+    with _shard_repo(directory, shard, journal_limit, lock_timeout) as repo:
+        return func(repo, *args)
+
+
+def _clear(repo):
+    repo.clear()
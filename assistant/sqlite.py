@@ -0,0 +1,264 @@
+from collections.abc import Iterator
+from pathlib import Path
+import sqlite3
+
+from assistant.indexes import BirthdayIndex
+from assistant.indexes import NameIndex
+from assistant.indexes import PhoneIndex
+from assistant.indexes import TrigramIndex
+from assistant.indexes import trigrams
+from assistant.model import Birthday
+from assistant.model import Name
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    name TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS phones (
+    name TEXT NOT NULL REFERENCES records (name) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    phone TEXT NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (name, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+
+CREATE TABLE IF NOT EXISTS birthdays (
+    name TEXT PRIMARY KEY REFERENCES records (name) ON DELETE CASCADE,
+    birthday TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    day INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS birthdays_month_day ON birthdays (month, day);
+
+CREATE TABLE IF NOT EXISTS name_trigrams (
+    trigram TEXT NOT NULL,
+    name TEXT NOT NULL REFERENCES records (name) ON DELETE CASCADE,
+    PRIMARY KEY (trigram, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS name_trigrams_name ON name_trigrams (name);
+"""
+
+SCHEMA_VERSION = 1
+
+
+class SqliteNameIndex:
+    name = NameIndex.name
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        for name, in self.db.execute("SELECT name FROM records ORDER BY name"):
+            yield name
+
+    def prefix(self, prefix: str) -> Iterator[str]:
+        rows = self.db.execute(
+            "SELECT name FROM records WHERE name >= ? AND name < ? ORDER BY name",
+            (prefix, prefix + "\U0010ffff"),
+        )
+        for name, in rows:
+            yield name
+
+
+class SqliteBirthdayIndex:
+    name = BirthdayIndex.name
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def get(self, key: tuple[int, int]) -> set[str]:
+        rows = self.db.execute(
+            "SELECT name FROM birthdays WHERE month = ? AND day = ?", key)
+        return {name for name, in rows}
+
+    def range(self, lo: tuple[int, int], hi: tuple[int, int]) -> Iterator[str]:
+        rows = self.db.execute(
+            "SELECT name FROM birthdays WHERE (month, day) BETWEEN (?, ?) AND (?, ?) "
+            "ORDER BY month, day, name",
+            (*lo, *hi),
+        )
+        for name, in rows:
+            yield name
+
+
+class SqlitePhoneIndex:
+    name = PhoneIndex.name
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def get(self, key: str) -> set[str]:
+        rows = self.db.execute("SELECT name FROM phones WHERE phone = ?", (key,))
+        return {name for name, in rows}
+
+    def prefix(self, prefix: str) -> Iterator[str]:
+        rows = self.db.execute(
+            "SELECT DISTINCT phone, name FROM phones WHERE phone >= ? AND phone < ? "
+            "ORDER BY phone, name",
+            (prefix, prefix + "\U0010ffff"),
+        )
+        for _, name in rows:
+            yield name
+
+
+class SqliteTrigramIndex:
+    name = TrigramIndex.name
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def similar(self, query: str, limit: int) -> list[str]:
+        grams = list(trigrams(query))
+        rows = self.db.execute(
+            f"SELECT name FROM name_trigrams WHERE trigram IN ({', '.join('?' * len(grams))}) "
+            "GROUP BY name ORDER BY COUNT(*) DESC, name LIMIT ?",
+            (*grams, limit),
+        )
+        return [name for name, in rows]
+
+
+class SqliteRepo:
+    db: sqlite3.Connection
+
+    def __init__(self, filepath: Path, lock_timeout: float = 10.0):
+        self.filepath = filepath
+        self.lock_timeout = lock_timeout
+        self.indexes = {}
+
+    def __enter__(self):
+        self.db = sqlite3.connect(self.filepath, timeout=self.lock_timeout)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self._migrate()
+        self.indexes = {
+            NameIndex.name: SqliteNameIndex(self.db),
+            BirthdayIndex.name: SqliteBirthdayIndex(self.db),
+            PhoneIndex.name: SqlitePhoneIndex(self.db),
+            TrigramIndex.name: SqliteTrigramIndex(self.db),
+        }
+        return self
+
+    def _migrate(self):
+        """
+        Create the schema of a new database or bring an older one up to date,
+        an up to date one is only read
+        """
+        version, = self.db.execute("PRAGMA user_version").fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+        self.db.executescript(SCHEMA)
+        self.db.execute("BEGIN IMMEDIATE")
+        # another process may have migrated it meanwhile
+        version, = self.db.execute("PRAGMA user_version").fetchone()
+        if version < 1:
+            names = [name for name, in self.db.execute("SELECT name FROM records")]
+            for name in names:
+                self._insert_trigrams(name)
+        if version < SCHEMA_VERSION:
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.commit()
+
+    def _insert_trigrams(self, name: str):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO name_trigrams (trigram, name) VALUES (?, ?)",
+            ((gram, name) for gram in trigrams(name)),
+        )
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.db.commit()
+        else:
+            self.db.rollback()
+        self.db.close()
+
+    def index(self, name: str):
+        return self.indexes.get(name)
+
+    def reindex(self):
+        self.db.execute("DELETE FROM name_trigrams")
+        for name, in self.db.execute("SELECT name FROM records").fetchall():
+            self._insert_trigrams(name)
+        self.db.execute("REINDEX")
+
+    def get(self, id: str, default: Record | None = None) -> Record | None:
+        row = self.db.execute(
+            "SELECT r.name, b.birthday FROM records r LEFT JOIN birthdays b USING (name) "
+            "WHERE r.name = ?",
+            (str(id),),
+        ).fetchone()
+        if row is None:
+            return default
+        phones = self.db.execute(
+            "SELECT name, phone, type FROM phones WHERE name = ? ORDER BY position",
+            (str(id),),
+        )
+        return _make_record(row, phones)
+
+    def set(self, id: str, value: Record) -> None:
+        id = str(id)
+        inserted = self.db.execute(
+            "INSERT INTO records (name) VALUES (?) ON CONFLICT DO NOTHING", (id,))
+        if inserted.rowcount:
+            self._insert_trigrams(id)
+        self.db.execute("DELETE FROM phones WHERE name = ?", (id,))
+        self.db.executemany(
+            "INSERT INTO phones (name, position, phone, type) VALUES (?, ?, ?, ?)",
+            ((id, position, str(p.phone), str(p.type))
+             for position, p in enumerate(value.phones)),
+        )
+        if value.birthday is None:
+            self.db.execute("DELETE FROM birthdays WHERE name = ?", (id,))
+        else:
+            birthday = value.birthday.birthday
+            self.db.execute(
+                "INSERT OR REPLACE INTO birthdays (name, birthday, month, day) "
+                "VALUES (?, ?, ?, ?)",
+                (id, birthday.strftime("%Y.%m.%d"), birthday.month, birthday.day),
+            )
+
+    def delete(self, id: str) -> None:
+        # phones, birthdays and trigrams go with the record
+        self.db.execute("DELETE FROM records WHERE name = ?", (str(id),))
+
+    def items(self) -> Iterator[tuple[str, Record]]:
+        records = self.db.execute(
+            "SELECT r.name, b.birthday FROM records r LEFT JOIN birthdays b USING (name) "
+            "ORDER BY r.name")
+        phones = self.db.execute(
+            "SELECT name, phone, type FROM phones ORDER BY name, position")
+        pending = next(phones, None)
+        for row in records:
+            record_phones = []
+            while pending is not None and pending[0] == row[0]:
+                record_phones.append(pending)
+                pending = next(phones, None)
+            yield row[0], _make_record(row, record_phones)
+
+    def clear(self):
+        self.db.execute("DELETE FROM name_trigrams")
+        self.db.execute("DELETE FROM phones")
+        self.db.execute("DELETE FROM birthdays")
+        self.db.execute("DELETE FROM records")
+
+    def flush(self):
+        self.db.commit()
+
+    def lock_for_write(self):
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN IMMEDIATE")
+
+
+def _make_record(row, phones) -> Record:
+    name, birthday = row
+    record = Record(Name(name), None if birthday is None else Birthday(birthday))
+    for _, phone, type in phones:
+        record.add_phone(Phone(PhoneValue(phone), PhoneType(type)))
+    return record
@@ -0,0 +1,168 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
+import csv
+from dataclasses import dataclass
+from dataclasses import field
+from enum import StrEnum
+import json
+from pathlib import Path
+import time
+from typing import IO
+
+from assistant.common import error
+from assistant.model import Birthday
+from assistant.model import ModelError
+from assistant.model import Name
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+from assistant import repos
+
+CSV_FIELDS = ["name", "phone", "type", "birthday"]
+
+
+class Format(StrEnum):
+    CSV = "csv"
+    JSONL = "jsonl"
+
+    @classmethod
+    def from_path(cls, path: Path) -> "Format":
+        if path.suffix.lower() in {".jsonl", ".json", ".ndjson"}:
+            return cls.JSONL
+        return cls.CSV
+
+
+@dataclass
+class Row:
+    name: str
+    phones: list[tuple[str, str]] = field(default_factory=list)
+    birthday: str | None = None
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    records: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def records_per_sec(self) -> float:
+        return self.records / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def read_rows(src: IO[str], format: Format) -> Iterator[tuple[int, Row | ValueError]]:
+    """
+    Yield (line number, row) pairs, or (line number, error) for rows that
+    cannot be parsed at all
+    """
+    match format:
+        case Format.CSV:
+            reader = csv.DictReader(src)
+            for row in reader:
+                if not row.get("name"):
+                    yield reader.line_num, ValueError("Missing name")
+                    continue
+                phones = [(row["phone"], row.get("type") or PhoneType.MOBILE)] if row.get("phone") else []
+                yield reader.line_num, Row(row["name"], phones, row.get("birthday") or None)
+        case Format.JSONL:
+            for lineno, line in enumerate(src, 1):
+                if not line.strip():
+                    continue
+                try:
+                    obj = json.loads(line)
+                    phones = [(p["phone"], p.get("type") or PhoneType.MOBILE)
+                              for p in obj.get("phones") or ()]
+                    yield lineno, Row(obj["name"], phones, obj.get("birthday"))
+                except (ValueError, KeyError, TypeError, AttributeError) as ex:
+                    yield lineno, ValueError(f"Malformed row: {ex}")
+
+
+def import_rows(
+        addressbook: repos.Repo[Record],
+        rows: Iterable[tuple[int, Row | ValueError]],
+        batch_size: int,
+        source: str,
+) -> ImportStats:
+    stats = ImportStats()
+    started = time.perf_counter()
+    pending: dict[str, Record] = {}
+
+    def flush():
+        for name, record in pending.items():
+            addressbook.set(name, record)
+        addressbook.flush()
+        stats.records += len(pending)
+        pending.clear()
+
+    for lineno, row in rows:
+        stats.rows += 1
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            name = Name(row.name)
+            phones = [Phone(PhoneValue(phone), PhoneType(type)) for phone, type in row.phones]
+            birthday = None if row.birthday is None else Birthday(row.birthday)
+        except (ModelError, ValueError) as ex:
+            stats.errors += 1
+            error(f"{source}:{lineno}: {ex}")
+            continue
+        record = pending.get(str(name))
+        if record is None:
+            # the flush of the previous batch let other writers in
+            addressbook.lock_for_write()
+            record = addressbook.get(name) or Record(name)
+        existing = {(str(p.phone), p.type) for p in record.phones}
+        for phone in phones:
+            if (str(phone.phone), phone.type) not in existing:
+                record.add_phone(phone)
+                existing.add((str(phone.phone), phone.type))
+        if birthday is not None:
+            record.set_birthday(birthday)
+        pending[str(name)] = record
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def export_records(
+        records: Iterable[tuple[str, Record]],
+        dst: IO[str],
+        format: Format,
+) -> int:
+    count = 0
+    match format:
+        case Format.CSV:
+            writer = csv.writer(dst)
+            writer.writerow(CSV_FIELDS)
+            for name, record in records:
+                birthday = _format_birthday(record)
+                if record.phones:
+                    writer.writerows(
+                        (name, p.phone, p.type, birthday) for p in record.phones)
+                else:
+                    writer.writerow((name, "", "", birthday))
+                count += 1
+        case Format.JSONL:
+            for name, record in records:
+                dst.write(json.dumps(json_record(name, record)))
+                dst.write("\n")
+                count += 1
+    return count
+
+
+def json_record(name: str, record: Record) -> dict:
+    return {
+        "name": str(name),
+        "phones": [{"phone": str(p.phone), "type": str(p.type)} for p in record.phones],
+        "birthday": _format_birthday(record) or None,
+    }
+
+
+def _format_birthday(record: Record) -> str:
+    if record.birthday is None:
+        return ""
+    return record.birthday.birthday.strftime("%Y.%m.%d")
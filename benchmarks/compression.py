@@ -0,0 +1,91 @@
+"""
+Compare bytes on disk and lookup latency of block store settings
+
+    python benchmarks/compression.py --records 100000 --block-sizes 4096 32768
+
+Every combination of compression, level and block size is written once
+from the same records, then timed on random lookups and a full scan. The
+mmap record store, which compresses nothing, is shown for reference.
+"""
+from argparse import ArgumentParser
+import os
+from pathlib import Path
+import random
+import tempfile
+import time
+
+from assistant.blockstore import BlockStoreRepo
+from assistant.blockstore import Compression
+from assistant.recordstore import RecordStoreRepo
+from assistant.serialization import CODECS
+from assistant.serialization import CodecType
+from synthetic import make_records
+
+
+def disk_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir())
+
+
+def bench(repo, records, lookups: list[str], repeat: int, directory: Path) -> tuple[int, float, float, float]:
+    # everything is written in one go and compacted on close
+    with repo:
+        for record in records:
+            repo.set(str(record.name), record)
+    size = disk_size(directory)
+    get = scan = opened = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with repo:
+            opened = min(opened, time.perf_counter() - started)
+            started = time.perf_counter()
+            for name in lookups:
+                repo.get(name)
+            get = min(get, (time.perf_counter() - started) / len(lookups))
+            started = time.perf_counter()
+            for _ in repo.items():
+                pass
+            scan = min(scan, time.perf_counter() - started)
+    return size, opened, get, scan
+
+
+def main():
+    ap = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--records", type=int, default=100_000, help="Number of records")
+    ap.add_argument("--compressions", type=Compression, nargs="+", choices=list(Compression),
+                    default=list(Compression), help="Compressions to compare")
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9], help="Compression levels")
+    ap.add_argument("--block-sizes", type=int, nargs="+", default=[4096, 32 * 1024, 256 * 1024],
+                    help="Sizes in bytes of uncompressed records in a block")
+    ap.add_argument("--lookups", type=int, default=1000, help="Number of random lookups timed")
+    ap.add_argument("--repeat", type=int, default=3, help="Best of this many runs is reported")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the generated records")
+    args = ap.parse_args()
+
+    records = make_records(args.records, args.seed)
+    rnd = random.Random(args.seed)
+    lookups = [str(rnd.choice(records).name) for _ in range(args.lookups)]
+    codec = CODECS[CodecType.BINARY]
+
+    settings = [("mmap", "", "")]
+    for compression in args.compressions:
+        # levels mean nothing without compression
+        levels = [0] if compression == Compression.NONE else args.levels
+        settings += [(compression, level, block_size)
+                     for level in levels for block_size in args.block_sizes]
+
+    print(f"{'store':<6} {'level':>5} {'block':>8} {'bytes':>12} {'bytes/rec':>9} "
+          f"{'open ms':>8} {'get us':>8} {'scan ms':>8}")
+    for compression, level, block_size in settings:
+        with tempfile.TemporaryDirectory(prefix="assistant-bench-") as directory:
+            directory = Path(directory)
+            if compression == "mmap":
+                repo = RecordStoreRepo(directory / "book.records", 0, codec)
+            else:
+                repo = BlockStoreRepo(directory / "book.blocks", compression, level, block_size, 0, codec)
+            size, opened, get, scan = bench(repo, records, lookups, args.repeat, directory)
+        print(f"{compression:<6} {level:>5} {block_size:>8} {size:>12,} {size / len(records):>9.1f} "
+              f"{opened * 1000:>8.2f} {get * 1_000_000:>8.1f} {scan * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare encode/decode throughput and size of the record codecs
+
+    python benchmarks/serialization.py --records 100000
+"""
+from argparse import ArgumentParser
+import time
+
+from assistant.model import Record
+from assistant.serialization import CODECS
+from synthetic import make_records
+
+
+def bench(codec, records: list[Record], repeat: int) -> tuple[float, float, int]:
+    encode = decode = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encoded = [codec.encode(r) for r in records]
+        encode = min(encode, time.perf_counter() - started)
+
+        # decode from views into one buffer, the way the mmap store does
+        buffer = memoryview(b"".join(encoded))
+        views = []
+        offset = 0
+        for value in encoded:
+            views.append(buffer[offset:offset + len(value)])
+            offset += len(value)
+        started = time.perf_counter()
+        for view in views:
+            codec.decode(view).phones
+        decode = min(decode, time.perf_counter() - started)
+    return encode, decode, sum(len(value) for value in encoded)
+
+
+def main():
+    ap = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--records", type=int, default=100_000, help="Number of records")
+    ap.add_argument("--repeat", type=int, default=3, help="Best of this many runs is reported")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the generated records")
+    args = ap.parse_args()
+
+    records = make_records(args.records, args.seed)
+    print(f"{'codec':<8} {'encode rec/s':>14} {'decode rec/s':>14} {'bytes':>12} {'bytes/rec':>10}")
+    for name, codec in CODECS.items():
+        encode, decode, size = bench(codec, records, args.repeat)
+        print(f"{name:<8} {len(records) / encode:>14,.0f} {len(records) / decode:>14,.0f} "
+              f"{size:>12,} {size / len(records):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
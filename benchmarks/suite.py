@@ -0,0 +1,201 @@
+"""
+Time repositories and commands on synthetic addressbooks
+
+    python benchmarks/suite.py run --sizes 1000 100000 --output new.json
+    python benchmarks/suite.py compare old.json new.json --threshold 0.2
+
+`run` builds a book of every size for every repository type and reports
+the best of `--repeat` runs in seconds. `compare` exits with 1 when a
+timing got slower than the baseline by more than the threshold.
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from assistant import AssistantApp
+from assistant import build_repo
+from assistant import make_argparser
+from assistant.birthdays import Birthdays
+from assistant.phones import Phones
+from assistant.repos import RepoType
+from synthetic import make_record
+from synthetic import record_name
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Number of random lookups and updates timed together on an open book
+OPERATIONS = 1000
+
+
+def repo_args(repo_type: RepoType, directory: Path) -> list[str]:
+    return [
+        "--repo-type", repo_type,
+        "--repo-pickle-filepath", str(directory / "addressbook.pickle"),
+        "--repo-shelve-db-dir", str(directory),
+        "--repo-mmap-filepath", str(directory / "addressbook.records"),
+        "--repo-blocks-filepath", str(directory / "addressbook.blocks"),
+        "--repo-shards-dir", str(directory / "addressbook.shards"),
+        "--repo-sqlite-filepath", str(directory / "addressbook.sqlite3"),
+    ]
+
+
+def commands(size: int, seed: int) -> dict[str, str]:
+    name = shlex.quote(record_name(size // 2, seed))
+    phone = make_record(size // 2, seed).phones[0].phone
+    return {
+        "list": "list",
+        "list_by_birthday": "list --sort birthday --format table",
+        "phones_show": f"phones show {name}",
+        "phones_find": f"phones find {phone[:4]} --prefix",
+        "birthdays_show": f"birthdays show {name}",
+        "birthdays_upcoming": "birthdays upcoming",
+        "unknown_command": "phnoes",
+    }
+
+
+def best(func, repeat: int) -> float:
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = min(elapsed, time.perf_counter() - started)
+    return elapsed
+
+
+def bench_book(repo_type: RepoType, size: int, seed: int, repeat: int, directory: Path) -> dict[str, float]:
+    args = make_argparser().parse_args(repo_args(repo_type, directory))
+    results = {}
+
+    started = time.perf_counter()
+    with build_repo(args) as addressbook:
+        for n in range(size):
+            record = make_record(n, seed)
+            addressbook.set(str(record.name), record)
+    results["populate"] = time.perf_counter() - started
+
+    rnd = random.Random(seed)
+    names = [record_name(rnd.randrange(size), seed) for _ in range(OPERATIONS)]
+    updates = [make_record(rnd.randrange(size), seed) for _ in range(OPERATIONS)]
+    lines = commands(size, seed)
+    results["open"] = results["close"] = float("inf")
+    results["get"] = results["set"] = float("inf")
+    for line_name in lines:
+        results[line_name] = float("inf")
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        for _ in range(repeat):
+            repo = build_repo(args)
+            started = time.perf_counter()
+            addressbook = repo.__enter__()
+            results["open"] = min(results["open"], time.perf_counter() - started)
+            try:
+                results["get"] = min(results["get"], best(
+                    lambda: [addressbook.get(name) for name in names], 1))
+                results["set"] = min(results["set"], best(
+                    lambda: [addressbook.set(str(r.name), r) for r in updates], 1))
+                app = AssistantApp(addressbook, Phones(addressbook, True), Birthdays(addressbook, True), True)
+                for line_name, line in lines.items():
+                    results[line_name] = min(results[line_name], best(lambda: app.onecmd(line), 1))
+            finally:
+                started = time.perf_counter()
+                repo.__exit__(None, None, None)
+                results["close"] = min(results["close"], time.perf_counter() - started)
+
+    # a fresh interpreter opening the book and running one command
+    cli = [sys.executable, "-m", "assistant", *repo_args(repo_type, directory), "hello"]
+    env = dict(os.environ, PYTHONPATH=str(ROOT),
+               ASSISTANT_HISTORY_FILE=str(directory / "history"),
+               ASSISTANT_INIT_FILE=str(directory / "init"))
+    results["cli_startup"] = best(
+        lambda: subprocess.run(cli, env=env, cwd=directory, check=True, capture_output=True), repeat)
+    return results
+
+
+def run(args):
+    results = {}
+    for repo_type in args.repo_types:
+        for size in args.sizes:
+            with tempfile.TemporaryDirectory(prefix="assistant-bench-") as directory:
+                started = time.perf_counter()
+                timings = bench_book(repo_type, size, args.seed, args.repeat, Path(directory))
+                print(f"{repo_type} {size}: {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for name, elapsed in timings.items():
+                results[f"{repo_type}/{size}/{name}"] = elapsed
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with args.output.open("w") as dst:
+            json.dump(report, dst, indent=2)
+
+
+def compare(args):
+    with args.baseline.open() as src:
+        baseline = json.load(src)["results"]
+    with args.current.open() as src:
+        current = json.load(src)["results"]
+    regressions = 0
+    print(f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(baseline.keys() & current.keys()):
+        old, new = baseline[name], current[name]
+        change = new / old - 1 if old > 0 else 0.0
+        # tiny timings are mostly noise
+        regressed = change > args.threshold and new - old > args.min_delta
+        regressions += regressed
+        print(f"{name:<40} {old:>12.6f} {new:>12.6f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    for name in sorted(baseline.keys() - current.keys()):
+        print(f"{name:<40} missing in {args.current}")
+    if regressions:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+def main():
+    ap = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subcommands = ap.add_subparsers(dest="command", required=True)
+
+    run_parser = subcommands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000],
+                            help="Numbers of records in the generated books")
+    run_parser.add_argument("--repo-types", type=RepoType, nargs="+", choices=list(RepoType),
+                            default=list(RepoType), help="Repository types to benchmark")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs is reported")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed of the generated records")
+    run_parser.add_argument("--output", type=Path, default=None,
+                            help="File to write the results to (default: stdout)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subcommands.add_parser("compare", help="Compare results of two runs")
+    compare_parser.add_argument("baseline", type=Path, help="Results of the baseline run")
+    compare_parser.add_argument("current", type=Path, help="Results of the run to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="Relative slowdown reported as a regression")
+    compare_parser.add_argument("--min-delta", type=float, default=0.001,
+                                help="Slowdowns of fewer seconds are ignored")
+    compare_parser.set_defaults(func=compare)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
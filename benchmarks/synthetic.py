@@ -0,0 +1,38 @@
+"""
+Deterministic synthetic addressbooks built from the real model
+"""
+from datetime import date
+import random
+
+from assistant.model import Birthday
+from assistant.model import Name
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+
+FIRST_NAMES = ["Anna", "Bohdan", "Olena", "Taras"]
+
+
+def record_name(n: int, seed: int) -> str:
+    """
+    Name of the n-th generated record, without generating the others
+    """
+    return f"{random.Random(seed * 1_000_003 + n).choice(FIRST_NAMES)} {n}"
+
+
+def make_record(n: int, seed: int) -> Record:
+    rnd = random.Random(seed * 1_000_003 + n)
+    first = date(1940, 1, 1).toordinal()
+    last = date(2010, 12, 31).toordinal()
+    record = Record(Name(f"{rnd.choice(FIRST_NAMES)} {n}"))
+    for _ in range(rnd.randint(1, 3)):
+        record.add_phone(Phone(
+            PhoneValue(f"{rnd.randrange(10 ** 10):010d}"), rnd.choice(list(PhoneType))))
+    if rnd.random() < 0.8:
+        record.set_birthday(Birthday(date.fromordinal(rnd.randint(first, last)).strftime("%Y.%m.%d")))
+    return record
+
+
+def make_records(count: int, seed: int) -> list[Record]:
+    return [make_record(n, seed) for n in range(count)]
@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+import assistant
+from assistant import build_repo
+from assistant import make_argparser
+from assistant.model import Birthday
+from assistant.model import Name
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+
+
+ROOT = Path(__file__).parent.parent
+
+
+def make_record(name: str, *phones: str, birthday: str | None = None) -> Record:
+    record = Record(Name(name), None if birthday is None else Birthday(birthday))
+    record.phones = [Phone(PhoneValue(phone), PhoneType.MOBILE) for phone in phones]
+    return record
+
+
+def state(record: Record | None):
+    """
+    Comparable contents of a record, records have no __eq__
+    """
+    return None if record is None else record.__getstate__()
+
+
+@pytest.fixture
+def records() -> list[Record]:
+    return [
+        make_record(f"Person {i:03d}", f"{i:010d}", birthday=f"19{i % 100:02d}.0{i % 9 + 1}.1{i % 10}")
+        for i in range(200)
+    ]
+
+
+@pytest.fixture
+def open_book(tmp_path, monkeypatch):
+    """
+    Build addressbooks in a temporary directory from command line options,
+    like `assistant` does
+
+    With `store=True` the storage backend is returned without the change
+    log, indexes and cache around it.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def open_book(*options: str, store: bool = False):
+        repo = build_repo(make_argparser().parse_args(list(options)))
+        while store and hasattr(repo, "repo"):
+            repo = repo.repo
+        return repo
+
+    return open_book
+
+
+@pytest.fixture
+def run_assistant(tmp_path, monkeypatch, capsys):
+    """
+    Run `assistant` with the arguments in a temporary directory and return
+    what it printed
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def run_assistant(*args: str):
+        monkeypatch.setattr(sys, "argv", ["assistant", *args])
+        assistant.main()
+        return capsys.readouterr()
+
+    return run_assistant
+
+
+def spawn_assistant(directory: Path, *args: str, env: dict | None = None,
+                    client: bool = False, **options) -> subprocess.Popen:
+    """
+    Start `assistant`, or `assistant-client` with `client=True`, in another
+    process
+    """
+    program = "from assistant.client import main; main()" if client else "import assistant; assistant.main()"
+    options = {"stdin": subprocess.PIPE, "stdout": subprocess.PIPE, "stderr": subprocess.PIPE} | options
+    return subprocess.Popen(
+        [sys.executable, "-c", program, *args], cwd=directory, text=True,
+        env={**os.environ, **(env or {}), "PYTHONPATH": str(ROOT)}, **options)
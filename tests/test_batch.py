@@ -0,0 +1,71 @@
+import subprocess
+
+import pytest
+
+from conftest import spawn_assistant
+from conftest import state
+
+EDITS = """\
+# comments and blank lines are skipped
+
+phones add Anna 0123456789
+phones add Bob 012
+phones add Cara 0987654321
+"""
+
+
+@pytest.fixture
+def edits(tmp_path):
+    path = tmp_path / "edits.txt"
+    path.write_text(EDITS)
+    return path
+
+
+def names(open_book) -> list[str]:
+    with open_book() as book:
+        return [name for name, _ in book.items()]
+
+
+def test_batch_stops_at_the_first_failure(run_assistant, open_book, edits):
+    with pytest.raises(SystemExit):
+        run_assistant("--batch", str(edits))
+    assert names(open_book) == ["Anna"]
+
+
+def test_batch_continues_on_error(run_assistant, open_book, edits, capsys):
+    with pytest.raises(SystemExit) as exited:
+        run_assistant("--batch", str(edits), "--continue-on-error")
+    assert exited.value.code == 1
+    summary = capsys.readouterr().out
+    assert "3 commands, 1 failed" in summary
+    assert "phones add: 3 (1 failed)" in summary
+    assert names(open_book) == ["Anna", "Cara"]
+
+
+def test_atomic_batch_keeps_nothing_after_a_failure(run_assistant, open_book, edits, capsys):
+    with pytest.raises(SystemExit):
+        run_assistant("--batch", str(edits), "--atomic", "--continue-on-error")
+    assert "Batch has been rolled back" in capsys.readouterr().out
+    assert names(open_book) == []
+
+    edits.write_text(EDITS.replace("Bob 012", "Bob 0120000000"))
+    committed = run_assistant("--batch", str(edits), "--atomic")
+    assert "Batch has been committed" in committed.out
+    assert names(open_book) == ["Anna", "Bob", "Cara"]
+
+
+def test_atomic_batch_holds_the_write_lock_until_the_commit(tmp_path, open_book):
+    batch = spawn_assistant(tmp_path, "--batch", "-", "--atomic", env={"PYTHONUNBUFFERED": "1"})
+    batch.stdin.write("phones add Anna 0123456789\n")
+    batch.stdin.flush()
+    assert "has been added to Anna" in batch.stdout.readline()
+    # the change isn't visible to others, who can't write meanwhile
+    other = spawn_assistant(tmp_path, "--repo-lock-timeout", "0.2", "phones", "add", "Bob", "0120000000",
+                            stdin=subprocess.DEVNULL)
+    _, err = other.communicate(timeout=30)
+    assert other.returncode == 1
+    assert "Timed out" in err
+    out, _ = batch.communicate("phones add Cara 0987654321\n", timeout=30)
+    assert batch.returncode == 0
+    assert "Batch has been committed" in out
+    assert names(open_book) == ["Anna", "Cara"]
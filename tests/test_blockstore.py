@@ -0,0 +1,79 @@
+import pytest
+
+from assistant import make_argparser
+from assistant.blockstore import ENTRY_HEADER
+from assistant.blockstore import Compression
+from conftest import make_record
+from conftest import state
+
+
+# small blocks, so lookups go through the block index
+BLOCKS = ("--repo-type", "blocks", "--repo-blocks-size", "512")
+
+
+@pytest.mark.parametrize("compression", list(Compression))
+def test_round_trip(open_book, records, compression):
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0",
+                   "--repo-blocks-compression", compression, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+        repo.delete("Person 001")
+    expected = {str(r.name): state(r) for r in records if str(r.name) != "Person 001"}
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0",
+                   "--repo-blocks-compression", compression, store=True) as repo:
+        assert len(repo._blocks) > 1
+        assert [(name, state(record)) for name, record in repo.items()] == sorted(expected.items())
+        for name in ("Person 000", "Person 002", "Person 199"):
+            assert state(repo.get(name)) == expected[name]
+        assert repo.get("Person 001") is None
+        assert repo.get("Nobody") is None
+
+
+def test_blocks_written_with_other_settings_are_read(open_book, records):
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0", "--repo-blocks-compression", "lzma",
+                   store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+    with open_book("--repo-type", "blocks", "--repo-blocks-size", "4096", "--repo-blocks-compact-limit", "0",
+                   "--repo-blocks-compression", "none", store=True) as repo:
+        assert state(repo.get("Person 100")) == state(records[100])
+        repo.set("Anna", make_record("Anna"))
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0", store=True) as repo:
+        assert repo._stored_compression == Compression.NONE
+        assert len(list(repo.items())) == len(records) + 1
+
+
+def test_journal_is_merged_past_the_limit(open_book, tmp_path, records):
+    journal = tmp_path / "addressbook.blocks.journal"
+    with open_book(*BLOCKS, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+    assert journal.stat().st_size > 0
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0", store=True) as repo:
+        assert len(repo._tail) == len(records)
+        repo.delete("Person 000")
+    # compacted on close
+    assert not journal.exists() or journal.stat().st_size == 0
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0", store=True) as repo:
+        assert not repo._tail
+        assert [name for name, _ in repo.items()] == [str(r.name) for r in records[1:]]
+
+
+def test_torn_journal_tail_is_dropped(open_book, tmp_path):
+    journal = tmp_path / "addressbook.blocks.journal"
+    with open_book(*BLOCKS, store=True) as repo:
+        repo.set("Anna", make_record("Anna", "0123456789"))
+    # an entry cut short by a crash
+    with journal.open("ab") as dst:
+        dst.write(ENTRY_HEADER.pack(4, 100) + b"Cara")
+    with open_book(*BLOCKS, store=True) as repo:
+        assert [name for name, _ in repo.items()] == ["Anna"]
+        repo.set("Dan", make_record("Dan"))
+    with open_book(*BLOCKS, "--repo-blocks-compact-limit", "0", store=True) as repo:
+        assert [name for name, _ in repo.items()] == ["Anna", "Dan"]
+
+
+def test_compression_choices_are_the_supported_ones():
+    action = make_argparser()._option_string_actions["--repo-blocks-compression"]
+    assert action.choices == list(Compression)
+    assert Compression(action.default) == Compression.ZLIB
@@ -0,0 +1,63 @@
+from assistant.repos import CachedRepo
+from conftest import make_record
+from conftest import state
+
+SHELVE = ("--repo-type", "shelve", "--repo-cache-size", "2")
+
+
+def cache_of(book) -> CachedRepo:
+    while not isinstance(book, CachedRepo):
+        book = book.repo
+    return book
+
+
+def test_lru_counters(open_book, records):
+    with open_book(*SHELVE) as book:
+        for record in records[:3]:
+            book.set(str(record.name), record)
+    with open_book(*SHELVE) as book:
+        cache = cache_of(book)
+        for name in ("Person 000", "Person 001", "Person 000", "Person 002", "Person 001", "Nobody"):
+            book.get(name)
+        # Person 001 was the least recently used when Person 002 came in
+        assert cache.stats() == {
+            "size": 2, "capacity": 2, "hits": 1, "misses": 5, "evictions": 2, "dirty": 0}
+        assert list(cache.cache) == ["Person 002", "Person 001"]
+        assert state(book.get("Person 001")) == state(records[1])
+
+
+def test_write_behind_writes_on_eviction_flush_and_close(open_book):
+    options = (*SHELVE, "--repo-cache-policy", "write-behind")
+    with open_book(*options) as book:
+        cache = cache_of(book)
+        book.set("Anna", make_record("Anna", "0123456789"))
+        book.set("Bob", make_record("Bob"))
+        assert cache.repo.get("Anna") is None
+        book.set("Cara", make_record("Cara"))
+        # Anna was evicted and written
+        assert cache.repo.get("Anna") is not None
+        assert cache.stats()["dirty"] == 2
+        book.flush()
+        assert cache.repo.get("Bob") is not None
+        assert cache.stats()["dirty"] == 0
+        book.set("Dan", make_record("Dan"))
+    with open_book(*options, store=True) as store:
+        assert sorted(name for name, _ in store.items()) == ["Anna", "Bob", "Cara", "Dan"]
+
+
+def test_changes_of_other_books_drop_the_cache(open_book):
+    with open_book(*SHELVE) as book:
+        book.set("Anna", make_record("Anna", "0123456789"))
+        book.flush()
+        assert len(book.get("Anna").phones) == 1
+        with open_book(*SHELVE) as other:
+            other.set("Anna", make_record("Anna", "0123456789", "0987654321"))
+        book.lock_for_write()
+        assert len(book.get("Anna").phones) == 2
+        book.flush()
+
+
+def test_cache_command(run_assistant):
+    assert "Record cache is disabled" in run_assistant("cache").err
+    shown = run_assistant("--repo-type", "shelve", "--repo-cache-size", "10", "cache")
+    assert "capacity: 10" in shown.out
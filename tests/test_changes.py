@@ -0,0 +1,119 @@
+import io
+import json
+
+import pytest
+
+from assistant.changes import ChangesError
+from assistant.changes import apply_changes
+from assistant.changes import export_changes
+from conftest import make_record
+from conftest import state
+
+
+def export(book, since=0) -> tuple[list[dict], int]:
+    dst = io.StringIO()
+    stats = export_changes(book, dst, since)
+    return [json.loads(line) for line in dst.getvalue().splitlines()], stats.until
+
+
+def export_text(book) -> str:
+    dst = io.StringIO()
+    export_changes(book, dst, 0)
+    return dst.getvalue()
+
+
+def test_changes_are_numbered_across_sessions(open_book):
+    with open_book() as book:
+        book.set("Anna", make_record("Anna", "0123456789"))
+        book.set("Bob", make_record("Bob"))
+    with open_book() as book:
+        book.delete("Bob")
+        book.set("Cara", make_record("Cara"))
+        history = book.history()
+    assert history.until == 4
+    assert {name: (c.seq, c.op) for name, c in history.latest.items()} == {
+        "Anna": (1, "set"), "Bob": (3, "delete"), "Cara": (4, "set")}
+
+    with open_book() as book:
+        lines, until = export(book, since=2)
+    assert until == 4
+    assert lines[0]["since"] == 2
+    assert [(line["name"], line.get("deleted", False)) for line in lines[1:]] == [
+        ("Bob", True), ("Cara", False)]
+
+
+def test_sync_between_books(open_book):
+    with open_book("--repo-pickle-filepath", "laptop.pickle") as laptop:
+        laptop.set("Anna", make_record("Anna", "0123456789"))
+        laptop.set("Bob", make_record("Bob"))
+        laptop.delete("Bob")
+        src = io.StringIO(export_text(laptop))
+    with open_book("--repo-pickle-filepath", "phone.pickle") as phone:
+        phone.set("Bob", make_record("Bob", "0987654321"), time_ns=1)
+        src.seek(0)
+        stats = apply_changes(phone, src, "laptop")
+        # Bob was deleted on the laptop after it was set on the phone
+        assert stats.applied == 2
+        assert sorted(name for name, _ in phone.items()) == ["Anna"]
+        assert state(phone.get("Anna")) == state(make_record("Anna", "0123456789"))
+        # applied changes are skipped the next time, a book's own are refused
+        src.seek(0)
+        assert apply_changes(phone, src, "laptop").applied == 0
+        with pytest.raises(ChangesError):
+            apply_changes(phone, io.StringIO(export_text(phone)), "phone")
+
+
+def test_later_change_wins(open_book):
+    with open_book("--repo-pickle-filepath", "a.pickle") as a:
+        a.set("Anna", make_record("Anna", "0111111111"), time_ns=100)
+        exported = export_text(a)
+    with open_book("--repo-pickle-filepath", "b.pickle") as b:
+        b.set("Anna", make_record("Anna", "0222222222"), time_ns=200)
+        assert apply_changes(b, io.StringIO(exported), "a").applied == 0
+        assert state(b.get("Anna")) == state(make_record("Anna", "0222222222"))
+
+
+def test_compaction_keeps_the_latest_change_of_every_name(open_book, tmp_path):
+    with open_book("--repo-changes-compact-limit", "0") as book:
+        for i in range(20):
+            book.set("Anna", make_record("Anna", f"{i:010d}"))
+        book.set("Bob", make_record("Bob"))
+        book.delete("Bob")
+    with open_book() as book:
+        history = book.history()
+        lines, _ = export(book, since=20)
+    assert history.until == 22
+    assert {name: (c.seq, c.op) for name, c in history.latest.items()} == {
+        "Anna": (20, "set"), "Bob": (22, "delete")}
+    assert [(line["name"], line.get("deleted", False)) for line in lines[1:]] == [("Bob", True)]
+    log = tmp_path / "addressbook.pickle.changes"
+    assert len(log.read_bytes().splitlines()) == 3
+
+
+def test_torn_log_line_is_dropped(open_book, tmp_path):
+    with open_book() as book:
+        book.set("Anna", make_record("Anna"))
+    log = tmp_path / "addressbook.pickle.changes"
+    with log.open("ab") as dst:
+        dst.write(b'[2, 1, null, "se')
+    with open_book() as book:
+        book.set("Bob", make_record("Bob"))
+        history = book.history()
+    assert {name: c.seq for name, c in history.latest.items()} == {"Anna": 1, "Bob": 2}
+
+
+def test_malformed_change_file_changes_nothing(open_book):
+    with open_book("--repo-pickle-filepath", "laptop.pickle") as laptop:
+        laptop.set("Anna", make_record("Anna", "0123456789"))
+        laptop.set("Bob", make_record("Bob"))
+        lines = export_text(laptop).splitlines(keepends=True)
+    header = json.loads(lines[0])
+    with open_book() as book:
+        for broken in ({**header, "book": None}, {k: v for k, v in header.items() if k != "until"}):
+            with pytest.raises(ChangesError, match="malformed header"):
+                apply_changes(book, io.StringIO(json.dumps(broken) + "\n" + "".join(lines[1:])), "-")
+        # the second change can't be parsed, the first isn't applied either
+        with pytest.raises(ChangesError, match="-:3: Malformed change"):
+            apply_changes(book, io.StringIO("".join(lines[:2]) + '{"time": 1}\n'), "-")
+        assert list(book.items()) == []
+        assert book.history().until == 0
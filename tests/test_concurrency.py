@@ -0,0 +1,46 @@
+from pathlib import Path
+import subprocess
+
+import pytest
+
+from assistant.repos import RepoType
+from conftest import spawn_assistant
+
+WRITERS = 10
+
+
+def assistant(directory: Path, repo_type: RepoType, *args: str) -> subprocess.Popen:
+    return spawn_assistant(
+        directory, "--repo-type", repo_type, "--repo-lock-timeout", "60",
+        # small limits, so writers also compact under each other
+        "--repo-pickle-journal-limit", "500", "--repo-mmap-compact-limit", "500",
+        "--repo-blocks-compact-limit", "500", "--repo-index-journal-limit", "200", *args,
+        stdin=subprocess.DEVNULL)
+
+
+def run(directory: Path, repo_type: RepoType, *args: str) -> str:
+    out, err = assistant(directory, repo_type, *args).communicate()
+    assert not err
+    return out
+
+
+@pytest.mark.parametrize("repo_type", list(RepoType))
+def test_concurrent_writers_lose_no_updates(tmp_path, repo_type):
+    run(tmp_path, repo_type, "phones", "add", "Anna", "0100000000")
+    # every writer reads Anna's phones and writes them back with one more
+    writers = [assistant(tmp_path, repo_type, "phones", "add", "Anna", f"02000000{i:02d}")
+               for i in range(WRITERS)]
+    writers += [assistant(tmp_path, repo_type, "phones", "add", f"Person {i}", f"03000000{i:02d}")
+                for i in range(WRITERS)]
+    for writer in writers:
+        out, err = writer.communicate(timeout=120)
+        assert writer.returncode == 0, err
+        assert not err
+
+    shown = run(tmp_path, repo_type, "phones", "show", "Anna")
+    assert len(shown.splitlines()) == WRITERS + 1
+    # found through the phone index, which saw every change too
+    found = run(tmp_path, repo_type, "find", "phone:0300")
+    for i in range(WRITERS):
+        assert f"02000000{i:02d}" in shown
+        assert f"Person {i}: 03000000{i:02d}" in found
@@ -0,0 +1,68 @@
+from datetime import date
+from datetime import timedelta
+
+import pytest
+
+from assistant import congratulations
+from assistant.congratulations import birthday_stats
+from assistant.congratulations import congratulation_date
+from assistant.congratulations import congratulation_ordinals
+
+# two full years, one of them leap, and a few in a century that isn't
+BIRTHDATES = [date(1999, 1, 1) + timedelta(days=i) for i in range(2 * 365 + 1)]
+BIRTHDATES += [date(1900, 2, 28), date(1900, 3, 1), date(1904, 2, 29), date(1988, 12, 31)]
+ORDINALS = [d.toordinal() for d in BIRTHDATES]
+YEARS = [1900, 2000, 2021, 2022, 2023, 2024, 2100]
+
+
+@pytest.fixture
+def scalar(monkeypatch):
+    monkeypatch.setattr(congratulations, "NUMPY_THRESHOLD", len(ORDINALS) + 1)
+
+
+@pytest.fixture
+def vectorized(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(congratulations, "NUMPY_THRESHOLD", 0)
+
+
+@pytest.mark.parametrize("year", YEARS)
+def test_numpy_matches_scalar(monkeypatch, year):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(congratulations, "NUMPY_THRESHOLD", len(ORDINALS) + 1)
+    expected = congratulation_ordinals(ORDINALS, year), birthday_stats(ORDINALS, year)
+    monkeypatch.setattr(congratulations, "NUMPY_THRESHOLD", 0)
+    assert congratulations._vectorized(ORDINALS) is not None
+    assert (congratulation_ordinals(ORDINALS, year), birthday_stats(ORDINALS, year)) == expected
+
+
+@pytest.mark.parametrize("paths", ["scalar", "vectorized"])
+def test_february_29(request, paths):
+    request.getfixturevalue(paths)
+    leap = date(2000, 2, 29).toordinal()
+    # Tuesday 2023-02-28
+    birthdays, congratulated = congratulation_ordinals([leap], 2023)
+    assert date.fromordinal(birthdays[0]) == date(2023, 2, 28)
+    assert date.fromordinal(congratulated[0]) == date(2023, 2, 28)
+    # Thursday 2024-02-29
+    birthdays, congratulated = congratulation_ordinals([leap], 2024)
+    assert date.fromordinal(birthdays[0]) == date(2024, 2, 29)
+    assert date.fromordinal(congratulated[0]) == date(2024, 2, 29)
+    # Saturday 2015-02-28, moved to Monday
+    assert date.fromordinal(congratulation_ordinals([leap], 2015)[1][0]) == date(2015, 3, 2)
+    months, weekdays = birthday_stats([leap], 2015)
+    assert months[2] == 1 and weekdays[5] == 1
+
+
+@pytest.mark.parametrize("paths", ["scalar", "vectorized"])
+def test_year_wraparound(request, paths):
+    request.getfixturevalue(paths)
+    # Saturday 2022-12-31 is congratulated on Monday 2023-01-02
+    new_year_eve = date(1988, 12, 31)
+    _, congratulated = congratulation_ordinals([new_year_eve.toordinal()], 2022)
+    assert date.fromordinal(congratulated[0]) == date(2023, 1, 2)
+    assert congratulation_date(new_year_eve, 2022) == date(2023, 1, 2)
+    # counted in January of the stats, on the weekday of the birthday
+    months, weekdays = birthday_stats([new_year_eve.toordinal()], 2022)
+    assert months[0] == 1 and sum(months) == 1
+    assert weekdays[5] == 1
@@ -0,0 +1,57 @@
+from assistant import dedupe
+from conftest import make_record
+
+
+def _fill(book):
+    book.set("John Doe", make_record("John Doe", "0123456789"))
+    book.set("doe  john", make_record("doe  john", "0987654321", birthday="1990.01.02"))
+    book.set("Jon Doe", make_record("Jon Doe", "0123456789", birthday="1991.03.04"))
+    book.set("Jane Roe", make_record("Jane Roe", "0555555555"))
+    book.set("Mary Major", make_record("Mary Major", "0111111111"))
+
+
+def test_name_keys():
+    assert dedupe.name_keys("John  Doe") == {"doe john", "doe j", "john d"}
+    assert dedupe.name_keys("Cher") == {"cher"}
+
+
+def test_find_and_apply_merges(open_book):
+    with open_book() as book:
+        _fill(book)
+        found = dedupe.find_duplicates(book)
+        assert found.records == 5
+        assert found.skipped == 0
+        [merge] = found.merges
+        # the tidy name with the most data is kept
+        assert merge.keep == "Jon Doe"
+        assert sorted(merge.merged) == ["John Doe", "doe  john"]
+        assert [str(p.phone) for p in merge.phones] == ["0987654321"]
+        assert merge.birthday is None
+        assert merge.dropped == ["birthday 1990.01.02 of 'doe  john'"]
+        dedupe.apply_merge(book, merge)
+        assert sorted(name for name, _ in book.items()) == ["Jane Roe", "Jon Doe", "Mary Major"]
+        kept = book.get("Jon Doe")
+        assert sorted(str(p.phone) for p in kept.phones) == ["0123456789", "0987654321"]
+        assert kept.birthday.birthday.strftime("%Y.%m.%d") == "1991.03.04"
+
+
+def test_large_blocks_are_skipped(open_book):
+    with open_book() as book:
+        for i in range(5):
+            book.set(f"Person {i}", make_record(f"Person {i}", "0123456789"))
+        found = dedupe.find_duplicates(book, max_block=4)
+        assert found.merges == []
+        assert found.skipped == 1
+        assert len(dedupe.find_duplicates(book, max_block=5).merges) == 1
+
+
+def test_dedupe_command(open_book, run_assistant):
+    with open_book() as book:
+        _fill(book)
+    assert "Threshold must be between 0 and 100" in run_assistant("dedupe", "--threshold", "101").err
+    assert "Block size must be at least 2" in run_assistant("dedupe", "--max-block", "1").err
+    shown = run_assistant("dedupe", "--yes").out
+    assert "Jon Doe <- 'John Doe', 'doe  john'" in shown
+    assert "1 merges proposed" in shown
+    assert "Merged 2 duplicates into 1 records" in shown
+    assert run_assistant("list", "--sort", "name").out.splitlines() == ["Jane Roe", "Jon Doe", "Mary Major"]
@@ -0,0 +1,116 @@
+import pickle
+
+from assistant.indexes import PhoneIndex
+from assistant.repos import IndexedRepo
+from conftest import make_record
+
+
+def test_indexes_are_stored_and_loaded_separately(open_book, tmp_path, records):
+    with open_book() as book:
+        for record in records:
+            book.set(str(record.name), record)
+    with open_book() as book:
+        assert book.index("phone").get("0000000007") == {"Person 007"}
+        assert book.index("unknown") is None
+    # rebuilt from the records on first use, then saved on its own
+    assert sorted(path.name for path in (tmp_path / "addressbook.pickle.idx").iterdir()) == [
+        "journal", "phone.pickle"]
+
+    with open_book() as book:
+        book.set("Anna", make_record("Anna", "0123456789"))
+        book.delete("Person 007")
+    # changes are journaled, the saved index is not rewritten
+    with open_book() as book:
+        phones = book.index("phone")
+        assert phones.get("0123456789") == {"Anna"}
+        assert phones.get("0000000007") == set()
+        assert list(book.index("name").prefix("Ann")) == ["Anna"]
+
+
+def test_journal_is_folded_into_the_indexes_past_the_limit(open_book, tmp_path, records):
+    with open_book("--repo-index-journal-limit", "100") as book:
+        for record in records:
+            book.set(str(record.name), record)
+    directory = tmp_path / "addressbook.pickle.idx"
+    assert len((directory / "journal").read_bytes().splitlines()) == 1
+    assert sorted(path.name for path in directory.iterdir()) == [
+        "birthday.pickle", "journal", "name.pickle", "phone.pickle", "trigram.pickle"]
+    with open_book() as book:
+        assert book.index("phone").get("0000000199") == {"Person 199"}
+
+
+def test_uncommitted_changes_are_not_indexed(open_book):
+    with open_book() as book:
+        book.set("Anna", make_record("Anna", "0123456789"))
+    with open_book() as writer, open_book() as reader:
+        assert reader.index("phone").get("0123456789") == {"Anna"}
+        writer.set("Bob", make_record("Bob", "0987654321"))
+        writer.set("Anna", make_record("Anna", "0111111111"))
+        # journaled, but the reader can't see the records yet
+        assert reader.index("phone").get("0987654321") == set()
+        assert reader.index("phone").get("0123456789") == {"Anna"}
+        writer.flush()
+        reader.flush()
+        assert reader.index("phone").get("0987654321") == {"Bob"}
+        assert reader.index("phone").get("0111111111") == {"Anna"}
+        assert reader.index("phone").get("0123456789") == set()
+
+
+def test_reindex_and_clear(open_book, records):
+    with open_book() as book:
+        for record in records:
+            book.set(str(record.name), record)
+    with open_book() as other, open_book() as book:
+        assert other.index("phone").get("0000000001") == {"Person 001"}
+        book.clear()
+        book.set("Anna", make_record("Anna", "0000000001"))
+        book.flush()
+        other.flush()
+        # the other book notices the new journal and reloads its index
+        assert other.index("phone").get("0000000001") == {"Anna"}
+        book.reindex()
+        book.flush()
+        other.flush()
+        assert list(other.index("name")) == ["Anna"]
+
+
+def test_indexes_of_older_versions_are_replaced(open_book, tmp_path):
+    with open_book() as book:
+        book.set("Anna", make_record("Anna", "0123456789"))
+    directory = tmp_path / "addressbook.pickle.idx"
+    for path in directory.iterdir():
+        path.unlink()
+    directory.rmdir()
+    # all indexes in one file
+    directory.write_bytes(b"\x80\x05N.")
+    with open_book() as book:
+        assert book.index("phone").get("0123456789") == {"Anna"}
+    assert directory.is_dir()
+
+
+def test_find_loads_only_the_index_it_looks_up(open_book, run_assistant, monkeypatch, records):
+    with open_book() as book:
+        for record in records:
+            book.set(str(record.name), record)
+        book.reindex()
+    loaded = []
+    load = IndexedRepo._load
+
+    def recording_load(self, name):
+        loaded.append(name)
+        return load(self, name)
+
+    monkeypatch.setattr(IndexedRepo, "_load", recording_load)
+    found = run_assistant("find", "phone:000000012", "name:Person", "birthday:01..12")
+    assert found.out.splitlines()[0].startswith("Person 120: 0000000120")
+    assert loaded == ["phone"]
+
+
+def test_loaded_index_is_updated_without_the_pickled_keys(records):
+    index = PhoneIndex()
+    index.rebuild((str(r.name), r) for r in records)
+    loaded = pickle.loads(pickle.dumps(index))
+    assert loaded._keys is None
+    loaded.add("Person 007", make_record("Person 007", "0123456789"))
+    assert loaded.get("0000000007") == set()
+    assert list(loaded.prefix("01234")) == ["Person 007"]
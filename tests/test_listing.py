@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+
+from assistant import listing
+from conftest import make_record
+
+
+@pytest.fixture
+def book(run_assistant, open_book, records):
+    with open_book() as book:
+        # stored out of name order
+        for record in reversed(records[:20]):
+            book.set(str(record.name), record)
+        book.set("Anna", make_record("Anna", "0123456789"))
+    return run_assistant
+
+
+def test_paging_by_name(book):
+    assert book("list", "--sort", "name", "--limit", "3").out.splitlines() == [
+        "Anna", "Person 000", "Person 001"]
+    assert book("list", "--sort", "name", "--offset", "19", "--limit", "5").out.splitlines() == [
+        "Person 018", "Person 019"]
+    assert book("list", "--sort", "name", "--prefix", "Person 01", "--offset", "8").out.splitlines() == [
+        "Person 018", "Person 019"]
+    assert book("list", "--limit", "0").out == ""
+
+
+def test_negative_paging_is_refused(book):
+    for option in ("--offset", "--limit"):
+        shown = book("list", option, "-1")
+        assert "Offset and limit cannot be negative" in shown.err
+        assert shown.out == ""
+
+
+def test_sort_by_birthday_puts_records_without_one_last(book, records):
+    listed = book("list", "--sort", "birthday").out.splitlines()
+    by_birthday = sorted(records[:20], key=lambda r: (r.birthday.birthday.month, r.birthday.birthday.day))
+    assert listed == [str(r.name) for r in by_birthday] + ["Anna"]
+
+
+@pytest.mark.parametrize("format", list(listing.ListFormat))
+def test_formats(book, format):
+    lines = book("list", "--sort", "name", "--limit", "2", "--format", format).out.splitlines()
+    match format:
+        case listing.ListFormat.NAMES:
+            assert lines == ["Anna", "Person 000"]
+        case listing.ListFormat.TABLE:
+            assert lines[0].split() == ["Name", "Birthday", "Phones"]
+            assert lines[1].split() == ["Anna", "0123456789", "(mobile)"]
+            assert lines[2].split() == ["Person", "000", "1900.01.10", "0000000000", "(mobile)"]
+        case listing.ListFormat.TSV:
+            assert lines == ["name\tbirthday\tphones", "Anna\t\t0123456789:mobile",
+                             "Person 000\t1900.01.10\t0000000000:mobile"]
+        case listing.ListFormat.JSONL:
+            assert [json.loads(line)["name"] for line in lines] == ["Anna", "Person 000"]
+
+
+def test_lines_are_written_in_chunks():
+    class Counting(io.StringIO):
+        writes = 0
+
+        def write(self, s):
+            self.writes += 1
+            return super().write(s)
+
+    dst = Counting()
+    listing.write_lines((str(i) for i in range(25)), dst, chunk_size=10)
+    assert dst.writes == 3
+    assert dst.getvalue() == "".join(f"{i}\n" for i in range(25))
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import assistant
+from assistant import metrics
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """
+    Repos built by the runs of `assistant`
+    """
+    monkeypatch.setattr(metrics, "_active", None)
+    repos = []
+    build_repo = assistant.build_repo
+
+    def recording_build_repo(*args):
+        repos.append(build_repo(*args))
+        return repos[-1]
+
+    monkeypatch.setattr(assistant, "build_repo", recording_build_repo)
+    return repos
+
+
+def instrumented(repo) -> bool:
+    layers = [repo]
+    while hasattr(layers[-1], "repo"):
+        layers.append(layers[-1].repo)
+    return any("get" in vars(layer) for layer in layers)
+
+
+def test_plain_run_is_not_instrumented(run_assistant, built):
+    run_assistant("phones", "add", "Anna", "0123456789")
+    assert not instrumented(built[-1])
+    assert metrics._active is None
+    assert "Statistics are not collected" in run_assistant("stats").err
+
+
+def test_requested_statistics_are_collected(run_assistant, built, tmp_path):
+    timed = run_assistant("--timing", "--stats-json", "stats.json", "phones", "add", "Anna", "0123456789")
+    assert instrumented(built[-1])
+    assert "command phones" in timed.err
+    stats = json.loads((tmp_path / "stats.json").read_text())
+    assert [h["count"] for h in stats["commands"].values()] == [1]
+    assert "output" in stats["operations"]
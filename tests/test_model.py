@@ -0,0 +1,58 @@
+import pickle
+
+import pytest
+
+from assistant.model import InvalidPhoneError
+from assistant.model import Phone
+from assistant.model import PhoneType
+from assistant.model import PhoneValue
+from assistant.model import Record
+from assistant.serialization import CODECS
+from assistant.serialization import CodecType
+from conftest import state
+
+
+class Pickled:
+    """
+    Pickles as an instance of `cls` with the given state, like objects of
+    the schema 0 model did
+    """
+
+    def __init__(self, cls: type, state: dict):
+        self.cls = cls
+        self.state = state
+
+    def __reduce__(self):
+        return object.__new__, (self.cls,), self.state
+
+
+def test_phone_must_be_exactly_10_digits():
+    assert PhoneValue("0123456789") == "0123456789"
+    for phone in ("012345678", "01234567890", "0123456789x", "phone"):
+        with pytest.raises(InvalidPhoneError):
+            PhoneValue(phone)
+
+
+@pytest.mark.parametrize("codec", list(CodecType))
+def test_schema_0_phones_of_other_lengths_are_kept(codec):
+    # schema 0 only checked that a phone started with 10 digits
+    old = pickle.dumps(Pickled(Record, {
+        "name": "Anna",
+        "phones": [Pickled(Phone, {"phone": "0123456789012", "type": "home"}),
+                   Pickled(Phone, {"phone": "0123456789", "type": "mobile"})],
+        "birthday": None,
+    }))
+    record = pickle.loads(old)
+    assert [(p.phone, p.type) for p in record.phones] == [
+        ("0123456789012", PhoneType.HOME), ("0123456789", PhoneType.MOBILE)]
+    # as `migrate` rewrites it
+    migrated = CODECS[codec].decode(CODECS[codec].encode(record))
+    assert state(migrated) == state(record)
+    assert [p.phone for p in migrated.phones] == ["0123456789012", "0123456789"]
+
+
+def test_phone_too_long_to_store_is_a_model_error():
+    record = Record("Anna")
+    record.phones = [Phone(str.__new__(PhoneValue, "1" * 256), PhoneType.HOME)]
+    with pytest.raises(InvalidPhoneError):
+        pickle.dumps(record)
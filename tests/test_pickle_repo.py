@@ -0,0 +1,111 @@
+import pickle
+import time
+
+from conftest import make_record
+from conftest import state
+
+
+def read_all(repo) -> dict:
+    return {name: state(record) for name, record in repo.items()}
+
+
+def test_round_trip(open_book, tmp_path, records):
+    path = tmp_path / "addressbook.pickle"
+    with open_book(store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+        repo.delete("Person 000")
+    expected = {str(r.name): state(r) for r in records[1:]}
+    with open_book(store=True) as repo:
+        assert read_all(repo) == expected
+
+
+def test_changes_go_to_the_journal_until_the_limit(open_book, tmp_path, records):
+    path = tmp_path / "addressbook.pickle"
+    journal = tmp_path / "addressbook.pickle.journal"
+    with open_book(store=True) as repo:
+        repo.set("Anna", make_record("Anna", "0123456789"))
+    # a journal of one entry is within the limit, an empty book is not written
+    assert journal.exists()
+    snapshot = path.stat().st_mtime_ns if path.exists() else None
+    with open_book(store=True) as repo:
+        repo.set("Bob", make_record("Bob"))
+    assert (path.stat().st_mtime_ns if path.exists() else None) == snapshot
+
+    with open_book("--repo-pickle-journal-limit", "100", store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+    # compacted on close
+    assert not journal.exists()
+    with path.open("rb") as src:
+        assert set(pickle.load(src)) == {"Anna", "Bob"} | {str(r.name) for r in records}
+
+
+def test_torn_tail_is_dropped(open_book, tmp_path):
+    path = tmp_path / "addressbook.pickle"
+    journal = tmp_path / "addressbook.pickle.journal"
+    with open_book(store=True) as repo:
+        repo.set("Anna", make_record("Anna", "0123456789"))
+        repo.set("Bob", make_record("Bob", "0987654321"))
+    # an entry cut short by a crash
+    entry = pickle.dumps(("set", "Cara", make_record("Cara")))
+    with journal.open("ab") as dst:
+        dst.write(entry[:len(entry) // 2])
+
+    with open_book(store=True) as repo:
+        assert sorted(name for name, _ in repo.items()) == ["Anna", "Bob"]
+        repo.set("Dan", make_record("Dan"))
+    with open_book(store=True) as repo:
+        assert sorted(name for name, _ in repo.items()) == ["Anna", "Bob", "Dan"]
+
+
+def test_checkpoint_folds_the_journal_into_the_snapshot(open_book, tmp_path, records):
+    path = tmp_path / "addressbook.pickle"
+    rotated = tmp_path / "addressbook.pickle.journal.1"
+    with open_book(store=True) as repo:
+        for record in records[:100]:
+            repo.set(str(record.name), record)
+        repo.flush()
+        assert repo.checkpoint()
+        assert not rotated.exists()
+        # nothing new to fold in
+        assert not repo.checkpoint()
+        for record in records[100:]:
+            repo.set(str(record.name), record)
+    with path.open("rb") as src:
+        assert set(pickle.load(src)) == {str(r.name) for r in records[:100]}
+    with open_book(store=True) as repo:
+        assert read_all(repo) == {str(r.name): state(r) for r in records}
+
+
+def test_set_aside_journal_is_replayed(open_book, tmp_path):
+    path = tmp_path / "addressbook.pickle"
+    journal = tmp_path / "addressbook.pickle.journal"
+    with open_book(store=True) as repo:
+        repo.set("Anna", make_record("Anna"))
+    # a checkpoint that set the journal aside and never installed the snapshot
+    journal.replace(tmp_path / "addressbook.pickle.journal.1")
+    with open_book(store=True) as repo:
+        repo.set("Bob", make_record("Bob"))
+    with open_book(store=True) as repo:
+        assert sorted(name for name, _ in repo.items()) == ["Anna", "Bob"]
+        assert repo.checkpoint()
+    assert not (tmp_path / "addressbook.pickle.journal.1").exists()
+    with open_book(store=True) as repo:
+        assert sorted(name for name, _ in repo.items()) == ["Anna", "Bob"]
+
+
+def test_background_checkpoints(open_book, tmp_path, records):
+    path = tmp_path / "addressbook.pickle"
+    with open_book("--repo-pickle-checkpoint-interval", "60",
+                   "--repo-pickle-checkpoint-entries", "50", store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+            repo.flush()
+        # woken by the number of entries long before the interval
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert path.exists()
+    with open_book(store=True) as repo:
+        assert read_all(repo) == {str(r.name): state(r) for r in records}
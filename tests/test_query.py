@@ -0,0 +1,40 @@
+import pytest
+
+from assistant import query
+from assistant.query import QueryError
+
+
+@pytest.fixture
+def book(open_book, records):
+    with open_book() as book:
+        for record in records:
+            book.set(str(record.name), record)
+    return open_book
+
+
+def test_planner_drives_from_the_most_selective_index(book):
+    with book() as addressbook:
+        plan = query.plan(addressbook, query.parse(["name:Person 1", "birthday:01..03", "phone:00000001"]))
+        assert plan.explain().splitlines() == [
+            "look up phone index: phone starts with '00000001'",
+            "filter: name starts with 'Person 1'",
+            "filter: birthday between 01-01 and 03-31",
+        ]
+        assert query.plan(addressbook, query.parse(["type:home"])).explain() == "scan all records\nfilter: has a home phone"
+        found = [name for name, _ in query.execute(addressbook, plan)]
+    # born in months i % 9 + 1
+    assert found == [f"Person {i}" for i in range(100, 200) if i % 9 < 3]
+
+
+def test_invalid_terms_are_rejected():
+    for terms in (["name"], ["phone:12a"], ["birthday:13"], ["email:x"], []):
+        with pytest.raises(QueryError):
+            query.parse(terms)
+
+
+def test_find_limit(book, run_assistant):
+    found = run_assistant("find", "name:Person 1", "--limit", "3")
+    assert [line.split(":")[0] for line in found.out.splitlines()] == ["Person 100", "Person 101", "Person 102"]
+    negative = run_assistant("find", "name:Person 1", "--limit", "-1")
+    assert not negative.out
+    assert "Limit cannot be negative" in negative.err
@@ -0,0 +1,78 @@
+from assistant.recordstore import ENTRY_HEADER
+from conftest import make_record
+from conftest import state
+
+
+MMAP = ("--repo-type", "mmap")
+
+
+def test_round_trip(open_book, records):
+    with open_book(*MMAP, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+        repo.delete("Person 001")
+        assert repo.get("Person 001") is None
+    expected = {str(r.name): state(r) for r in records if str(r.name) != "Person 001"}
+    with open_book(*MMAP, store=True) as repo:
+        # in key order
+        assert [(name, state(record)) for name, record in repo.items()] == sorted(expected.items())
+        assert state(repo.get("Person 002")) == expected["Person 002"]
+        assert repo.get("Person 001") is None
+
+
+def test_tail_is_compacted_past_the_limit(open_book, tmp_path, records):
+    path = tmp_path / "addressbook.records"
+    with open_book(*MMAP, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+    size = path.stat().st_size
+    with open_book(*MMAP, "--repo-mmap-compact-limit", "0", store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), make_record(str(record.name), "0123456789"))
+    # every record is stored once again, without the overwritten versions
+    assert path.stat().st_size < 2 * size
+    with open_book(*MMAP, store=True) as repo:
+        assert repo._count == len(records)
+        assert not repo._tail
+        assert all(state(record) == state(make_record(name, "0123456789"))
+                   for name, record in repo.items())
+
+
+def test_torn_tail_is_dropped(open_book, tmp_path):
+    path = tmp_path / "addressbook.records"
+    with open_book(*MMAP, store=True) as repo:
+        repo.set("Anna", make_record("Anna", "0123456789"))
+    # an entry cut short by a crash
+    with path.open("ab") as dst:
+        dst.write(ENTRY_HEADER.pack(4, 100) + b"Cara")
+    with open_book(*MMAP, store=True) as repo:
+        assert [name for name, _ in repo.items()] == ["Anna"]
+        repo.set("Dan", make_record("Dan"))
+    with open_book(*MMAP, store=True) as repo:
+        assert [name for name, _ in repo.items()] == ["Anna", "Dan"]
+
+
+def test_clear(open_book, records):
+    with open_book(*MMAP, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+        repo.clear()
+        repo.set("Anna", make_record("Anna"))
+    with open_book(*MMAP, store=True) as repo:
+        assert [name for name, _ in repo.items()] == ["Anna"]
+
+
+def test_written_records_are_read_back_from_the_file(open_book, records):
+    with open_book(*MMAP, store=True) as repo:
+        for record in records:
+            repo.set(str(record.name), record)
+        assert state(repo.get("Person 100")) == state(records[100])
+        repo.flush()
+        # only the offsets of the written records are kept
+        assert not repo._written
+        assert len(repo._tail) == len(records)
+        assert state(repo.get("Person 100")) == state(records[100])
+        repo.delete("Person 100")
+        repo.flush()
+        assert repo.get("Person 100") is None
+        assert [name for name, _ in repo.items()] == [str(r.name) for r in records if str(r.name) != "Person 100"]
@@ -0,0 +1,82 @@
+import pytest
+
+from assistant.indexes import TrigramIndex
+from assistant.indexes import trigrams
+from assistant.search import complete_name
+from assistant.search import did_you_mean
+from assistant.search import search_names
+from conftest import make_record
+
+SHARDED = ("--repo-type", "sharded", "--repo-shards", "4")
+NAMES = ["John Doe", "Jane Doe", "Johnny Cash", "Joan Baez", "Mary Jane"]
+
+
+def test_trigrams_ignore_case_and_spacing():
+    assert trigrams("Jo  DOE") == trigrams("jo doe") == {"  j", " jo", "jo ", "o d", " do", "doe", "oe "}
+
+
+def test_trigram_index_ranks_names_by_shared_trigrams():
+    index = TrigramIndex()
+    index.rebuild((name, make_record(name)) for name in NAMES)
+    assert index.similar("Jon Do", 2) == ["John Doe", "Jane Doe"]
+    index.discard("John Doe")
+    assert "John Doe" not in index.similar("Jon Do", 5)
+    assert index.similar("xyz", 5) == []
+
+
+def test_search_names_with_and_without_index(open_book):
+    found = {}
+    for repo_type in ("pickle", "sqlite"):
+        with open_book("--repo-type", repo_type) as book:
+            for name in NAMES:
+                book.set(name, make_record(name))
+            found[repo_type] = search_names(book, "jhon doe", 3)
+    # a bare pickle store has no indexes, every name is scored
+    with open_book(store=True) as store:
+        found["scan"] = search_names(store, "jhon doe", 3)
+    assert found["pickle"] == found["sqlite"] == found["scan"]
+    assert [name for _, name in found["scan"]] == ["John Doe", "Jane Doe", "Joan Baez"]
+    assert found["scan"][0][0] > found["scan"][1][0]
+
+
+def test_search_command(open_book, run_assistant):
+    with open_book() as book:
+        for name in NAMES:
+            book.set(name, make_record(name))
+    found = run_assistant("search", "Jonny Cash", "--limit", "1")
+    assert found.out.startswith("Johnny Cash (")
+    assert "Nothing found for qqq" in run_assistant("search", "qqq").err
+    # misspelled names get a suggestion
+    assert "did you mean Jane Doe?" in run_assistant("phones", "show", "Jane Do").err
+
+
+def test_sharded_names_are_completed_from_the_index(open_book, records):
+    with open_book(*SHARDED) as book:
+        for record in records:
+            book.set(str(record.name), record)
+    with open_book(*SHARDED) as book:
+        # indexes are rebuilt from the shards once
+        assert complete_name(book, "Person 01", 'show "Person 01', 15)[:2] == ["Person 010", "Person 011"]
+        assert did_you_mean(book, "Persn 12") == ", did you mean Person 012?"
+    with open_book(*SHARDED) as book:
+        completions = complete_name(book, "Person 19", 'show "Person 19', 15)
+        assert completions == [f"Person 19{i}" for i in range(10)]
+        assert did_you_mean(book, "Persn 123") == ", did you mean Person 123?"
+        store = book
+        while hasattr(store, "repo"):
+            store = store.repo
+        assert not store.shards
+
+
+def test_sharded_name_index_sees_changes_of_other_books(open_book):
+    with open_book(*SHARDED) as book:
+        book.set("Anna", make_record("Anna"))
+    with open_book(*SHARDED) as book:
+        assert complete_name(book, "A", "show A", 6) == ["Anna"]
+        with open_book(*SHARDED) as other:
+            other.set("Alex", make_record("Alex"))
+            other.delete("Anna")
+            other.flush()
+        book.lock_for_write()
+        assert complete_name(book, "A", "show A", 6) == ["Alex"]
+        book.flush()
@@ -0,0 +1,55 @@
+import dbm
+import pickle
+
+import pytest
+
+from assistant.serialization import BINARY_MAGIC
+from assistant.serialization import CODECS
+from assistant.serialization import CodecError
+from assistant.serialization import CodecType
+from assistant.serialization import decode
+from conftest import make_record
+from conftest import state
+
+
+@pytest.mark.parametrize("codec", list(CodecType))
+def test_codecs_round_trip(codec, records):
+    records = records + [make_record("Ünïcode Name", "0123456789", "0987654321")]
+    for record in records:
+        encoded = CODECS[codec].encode(record)
+        assert state(CODECS[codec].decode(encoded)) == state(record)
+        # the first byte tells the codec
+        assert state(decode(memoryview(encoded))) == state(record)
+
+
+def test_unknown_encoding():
+    with pytest.raises(CodecError):
+        decode(b"\x00data")
+    with pytest.raises(CodecError):
+        decode(b"")
+
+
+def test_migrate_mmap_from_pickle(run_assistant, open_book):
+    for i in range(10):
+        run_assistant("--repo-type", "mmap", "--repo-codec", "pickle",
+                      "phones", "add", f"Person {i}", f"{i:010d}")
+    with open_book("--repo-type", "mmap", store=True) as repo:
+        assert all(value[0] == pickle.PROTO[0] for _, value in repo._encoded_items())
+        before = {name: state(record) for name, record in repo.items()}
+
+    migrated = run_assistant("--repo-type", "mmap", "--repo-codec", "binary", "migrate")
+    assert "10 records have been migrated" in migrated.out
+    with open_book("--repo-type", "mmap", store=True) as repo:
+        assert all(value[0] == BINARY_MAGIC for _, value in repo._encoded_items())
+        assert {name: state(record) for name, record in repo.items()} == before
+
+
+def test_migrate_shelve_from_pickle(run_assistant, tmp_path):
+    for i in range(10):
+        run_assistant("--repo-type", "shelve", "--repo-codec", "pickle",
+                      "phones", "add", f"Person {i}", f"{i:010d}")
+    run_assistant("--repo-type", "shelve", "--repo-codec", "json", "migrate")
+    shown = run_assistant("--repo-type", "shelve", "phones", "show", "Person 3")
+    assert "0000000003 (mobile)" in shown.out
+    with dbm.open(str(tmp_path / "addressbook"), "r") as db:
+        assert all(db[key][:1] == b"{" for key in db.keys())
@@ -0,0 +1,44 @@
+import subprocess
+import time
+
+import pytest
+
+from conftest import spawn_assistant
+
+
+@pytest.fixture
+def server(tmp_path):
+    env = {"ASSISTANT_SOCKET": str(tmp_path / "assistant.sock")}
+    process = spawn_assistant(tmp_path, "serve", env=env, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not (tmp_path / "assistant.sock").exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield tmp_path, env
+    process.terminate()
+    process.wait(10)
+
+
+def client(server, *args: str, input: str = "") -> subprocess.CompletedProcess:
+    directory, env = server
+    process = spawn_assistant(directory, *args, env=env, client=True)
+    out, err = process.communicate(input, timeout=30)
+    return subprocess.CompletedProcess(process.args, process.returncode, out, err)
+
+
+def test_client_exits_with_the_command_status(server):
+    added = client(server, "phones", "add", "Anna", "0123456789")
+    assert added.returncode == 0
+    assert "has been added to Anna" in added.stdout
+
+    shown = client(server, "phones", "show", "Anna")
+    assert shown.returncode == 0
+    assert "0123456789 (mobile)" in shown.stdout
+
+    missing = client(server, "phones", "show", "Nobody")
+    assert missing.returncode == 1
+    assert missing.stderr
+
+    assert client(server, "no-such-command").returncode == 1
+    # piped input answers the confirmation
+    assert client(server, "phones", "delete", "Anna", "0", input="y\n").returncode == 0
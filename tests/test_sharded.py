@@ -0,0 +1,80 @@
+import pytest
+
+from assistant import repos
+from assistant.sharded import ShardedRepo
+from assistant.sharded import ShardingError
+from assistant.sharded import shard_of
+from conftest import make_record
+from conftest import state
+
+SHARDED = ("--repo-type", "sharded", "--repo-shards", "3")
+
+
+def _names(repo) -> list[str]:
+    return sorted(str(name) for name, _ in repo.items())
+
+
+@pytest.fixture
+def book(open_book, records):
+    with open_book(*SHARDED) as book:
+        for record in records:
+            book.set(str(record.name), record)
+    return open_book
+
+
+def test_round_trip_across_shards(book, records, tmp_path):
+    with book(*SHARDED, store=True) as repo:
+        assert repo.count == 3
+        assert state(repo.get("Person 042")) == state(records[42])
+        # only the shard of the record is loaded
+        assert list(repo.shards) == [shard_of("Person 042", 3)]
+        assert sorted(name for name, _ in repo.items()) == [str(r.name) for r in records]
+    shards = {path.name.split(".")[0] for path in tmp_path.joinpath("addressbook.shards").glob("shard-*")}
+    assert shards == {"shard-000", "shard-001", "shard-002"}
+
+
+def test_other_shard_count_is_refused(book, tmp_path):
+    with pytest.raises(ShardingError):
+        ShardedRepo(tmp_path / "addressbook.shards", 4)
+    # the stored count is used when none is given
+    assert ShardedRepo(tmp_path / "addressbook.shards").count == 3
+
+
+def test_shard_count_mismatch_is_a_usage_error(book, run_assistant, capsys):
+    with pytest.raises(SystemExit):
+        run_assistant("--repo-type", "sharded", "--repo-shards", "4", "list")
+    assert "has 3 shards, cannot open it with 4" in capsys.readouterr().err
+
+
+def test_scans_merge_the_shards(book, records):
+    with book(*SHARDED, store=True) as repo:
+        assert list(repos.scan(repo, _first_names, key=str)) == sorted(str(r.name) for r in records[:10])
+
+
+def _first_names(repo) -> list[str]:
+    return sorted(str(name) for name, _ in repo.items() if str(name) < "Person 010")
+
+
+def test_listing_and_birthdays_over_shards(book, records, run_assistant):
+    listed = run_assistant(*SHARDED, "list", "--sort", "birthday").out.splitlines()
+    by_birthday = sorted(records, key=lambda r: (r.birthday.birthday.month, r.birthday.birthday.day, str(r.name)))
+    assert listed == [str(r.name) for r in by_birthday]
+    assert "200 birthdays in 2024" in run_assistant(*SHARDED, "birthdays", "stats", "--year", "2024").out
+
+
+def test_wipe_clears_every_shard(book, run_assistant):
+    assert "All records have been deleted" in run_assistant(*SHARDED, "-y", "wipe").out
+    with book(*SHARDED, store=True) as repo:
+        assert _names(repo) == []
+
+
+def test_writes_bump_the_generation(book):
+    with book(*SHARDED, store=True) as repo:
+        repo.get("Person 000")
+        seen = repo.generation
+        with book(*SHARDED, store=True) as other:
+            other.set("Anna", make_record("Anna"))
+        repo.lock_for_write()
+        assert repo.generation != seen
+        assert repo.foreign_changes == 1
+        assert repo.get("Anna") is not None
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+from assistant.sqlite import SCHEMA_VERSION
+from conftest import make_record
+from conftest import state
+
+SQLITE = ("--repo-type", "sqlite")
+
+
+def test_round_trip_and_indexes(open_book, records):
+    with open_book(*SQLITE) as book:
+        for record in records:
+            book.set(str(record.name), record)
+        book.delete("Person 001")
+    with open_book(*SQLITE) as book:
+        assert state(book.get("Person 002")) == state(records[2])
+        assert book.get("Person 001") is None
+        assert [name for name, _ in book.items()] == [str(r.name) for r in records if str(r.name) != "Person 001"]
+        assert book.index("phone").get("0000000007") == {"Person 007"}
+        assert list(book.index("name").prefix("Person 19"))[:2] == ["Person 190", "Person 191"]
+        assert book.index("trigram").similar("Persn 123", 1) == ["Person 123"]
+
+
+def test_version_0_database_is_migrated_once(open_book, tmp_path):
+    # as written before names were indexed by trigrams
+    with sqlite3.connect(tmp_path / "addressbook.sqlite3") as db:
+        db.executescript("""
+            CREATE TABLE records (name TEXT PRIMARY KEY) WITHOUT ROWID;
+            INSERT INTO records (name) VALUES ('Anna'), ('Bob');
+        """)
+    with open_book(*SQLITE) as book:
+        assert book.index("trigram").similar("Ana", 1) == ["Anna"]
+        book.set("Cara", make_record("Cara", "0123456789"))
+    with sqlite3.connect(tmp_path / "addressbook.sqlite3") as db:
+        assert db.execute("PRAGMA user_version").fetchone() == (SCHEMA_VERSION,)
+
+    # a current database is only read on open
+    with sqlite3.connect(tmp_path / "addressbook.sqlite3") as db:
+        db.execute("BEGIN IMMEDIATE")
+        read = False
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            with open_book(*SQLITE, "--repo-lock-timeout", "0.1") as book:
+                assert state(book.get("Cara")) == state(make_record("Cara", "0123456789"))
+                read = True
+                # writers wait for the lock as long as --repo-lock-timeout
+                book.lock_for_write()
+        assert read
@@ -0,0 +1,64 @@
+import io
+
+import pytest
+
+from assistant import AssistantApp
+from assistant import transfer
+from conftest import make_record
+from conftest import state
+
+
+@pytest.fixture
+def open_locked(open_book, monkeypatch):
+    """
+    Open books whose storage asserts that every read holds the write lock
+    """
+
+    def open_locked():
+        book = open_book()
+        store = book
+        while hasattr(store, "repo"):
+            store = store.repo
+        get = store.get
+
+        def locked_get(name, default=None):
+            assert store.lock.held and store.lock.exclusive
+            return get(name, default)
+
+        monkeypatch.setattr(store, "get", locked_get)
+        return book
+
+    return open_locked
+
+
+def test_import_rows_and_round_trip(open_book):
+    rows = 'name,phone,type,birthday\nAnna,0123456789,mobile,1990.01.02\nAnna,0987654321,home,\nBob,bad,mobile,\n'
+    with open_book() as book:
+        stats = transfer.import_rows(book, transfer.read_rows(io.StringIO(rows), transfer.Format.CSV), 1000, "-")
+        assert (stats.rows, stats.records, stats.errors) == (3, 1, 1)
+        out = io.StringIO()
+        transfer.export_records(book.items(), out, transfer.Format.JSONL)
+    with open_book() as book:
+        imported = transfer.import_rows(
+            book, transfer.read_rows(io.StringIO(out.getvalue()), transfer.Format.JSONL), 1000, "-")
+        assert imported.records == 1
+        assert len(book.get("Anna").phones) == 2
+
+
+def test_every_import_batch_reads_under_the_write_lock(open_locked):
+    rows = "".join(f'{{"name": "Person {i % 3}", "phones": [{{"phone": "{i:010d}"}}]}}\n' for i in range(9))
+    with open_locked() as book:
+        stats = transfer.import_rows(book, transfer.read_rows(io.StringIO(rows), transfer.Format.JSONL), 1, "-")
+        assert stats.records == 9
+        assert [len(record.phones) for _, record in book.items()] == [3, 3, 3]
+
+
+def test_migrate_reads_under_the_write_lock(open_book, open_locked):
+    with open_book() as book:
+        for i in range(2500):
+            book.set(f"Person {i:04d}", make_record(f"Person {i:04d}", f"{i:010d}"))
+    with open_locked() as book:
+        AssistantApp(book, None, None, True).do_migrate("")
+        migrated = dict(book.items())
+    assert len(migrated) == 2500
+    assert state(migrated["Person 1234"]) == state(make_record("Person 1234", "0000001234"))